@@ -0,0 +1,97 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Iterable, Optional
+import metrics
+
+# Bump whenever the analysis or its response format changes so stored results are not reused.
+ANALYSIS_FORMAT_VERSION = "1"
+
+def squad_fingerprint(player_ids: Iterable[int], bank: Optional[float] = None) -> str:
+    """
+    Canonical key of a squad: the same players in any order, with the same money
+    in the bank (in millions, to the nearest 0.1), give the same fingerprint.
+    """
+    ids = ",".join(str(player_id) for player_id in sorted(int(player_id) for player_id in player_ids))
+    bank_part = "-" if bank is None else str(round(bank * 10))
+    return hashlib.sha1(f"v{ANALYSIS_FORMAT_VERSION}:{ids}:{bank_part}".encode()).hexdigest()
+
+class AnalysisStore:
+    """
+    SQLite-backed store of full squad analysis responses, keyed by squad
+    fingerprint and snapshot version, so repeated analyses of the same squad
+    on the same data are answered without recomputing anything. Only the most
+    recent `max_versions` snapshot versions are kept, and at most `max_entries`
+    results overall (oldest first out). The overflow is trimmed every
+    `evict_every` puts rather than on each one, since the eviction query reads
+    the whole table.
+    """
+    def __init__(self, path: str, max_versions: int = 2, max_entries: int = 20000, evict_every: int = 100):
+        self.path = path
+        self.max_versions = max_versions
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._last_version = None
+        with self._connect() as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "fingerprint TEXT NOT NULL, version TEXT NOT NULL, value TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (fingerprint, version))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS analyses_created_at ON analyses (created_at)")
+
+    def _connect(self):
+        # One short-lived connection per operation keeps this safe across threadpool workers
+        return closing(sqlite3.connect(self.path, timeout=10))
+
+    def get(self, fingerprint: str, version: str) -> Optional[Any]:
+        """Returns the stored analysis response, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM analyses WHERE fingerprint = ? AND version = ?", (fingerprint, version)
+            ).fetchone()
+        metrics.cache_lookups.inc(cache="analysis", result="hit" if row is not None else "miss")
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, fingerprint: str, version: str, value: Any):
+        """
+        Stores a JSON-serializable analysis response. Old versions are evicted when a
+        new version is stored, the overflow every `evict_every` puts.
+        """
+        with self._lock, self._connect() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (fingerprint, version, value, created_at) VALUES (?, ?, ?, ?)",
+                (fingerprint, version, json.dumps(value), time.time())
+            )
+            if version != self._last_version:
+                self._last_version = version
+                self._evict_versions(conn)
+            self._puts += 1
+            if self._puts >= self.evict_every:
+                self._evict_overflow(conn)
+
+    def evict(self):
+        """Evicts old versions and overflow now, e.g. at the end of a batch of puts."""
+        with self._lock, self._connect() as conn, conn:
+            self._evict_versions(conn)
+            self._evict_overflow(conn)
+
+    def _evict_versions(self, conn):
+        conn.execute(
+            "DELETE FROM analyses WHERE version NOT IN ("
+            "SELECT version FROM analyses GROUP BY version ORDER BY MAX(created_at) DESC LIMIT ?)",
+            (self.max_versions,)
+        )
+
+    def _evict_overflow(self, conn):
+        self._puts = 0
+        conn.execute(
+            "DELETE FROM analyses WHERE rowid IN ("
+            "SELECT rowid FROM analyses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
@@ -0,0 +1,422 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from synthetic_data import PRICE_DISTRIBUTIONS, SCORE_DISTRIBUTIONS
+
+# Benchmarks for fixture difficulty mapping, squad building and squad analysis.
+# Every case runs on the same data with a fixed seed, so solution quality is
+# reproducible and only timings vary between runs of the same code. Data comes
+# from a recorded upstream bundle (see recording.py), a snapshot file written by
+# SharedSnapshotStore, or the live APIs:
+#
+#   python benchmark.py --bundle bundles/2025-gw08 --output bench/main.json
+#   python benchmark.py --bundle bundles/2025-gw08 --compare bench/main.json
+#
+# --synthetic runs every case on generated datasets of growing size (see
+# synthetic_data.py) and reports how each one scales with the player count:
+#
+#   python benchmark.py --synthetic 700,2500,10000x100 --generations 20 --repeat 1
+#
+# With --compare, cases that got slower or hungrier than the tolerance allows,
+# or whose solution quality dropped on identical data, are reported as
+# regressions and the exit status is 1.
+
+BOOTSTRAP_URL = "https://fantasy.premierleague.com/api/bootstrap-static/"
+FIXTURES_URL = "https://fantasy.premierleague.com/api/fixtures/"
+RESULTS_FORMAT_VERSION = 1
+# Quality metrics where lower means worse; compared only when data and seed match
+QUALITY_METRICS = ("fitness", "score_gain")
+
+class SkipCase(Exception):
+    """The case cannot run on the selected data source."""
+
+class BenchmarkContext:
+    """Data shared by all cases: the snapshot, its fixture map and a fixed user squad."""
+    def __init__(self, snapshot, teams_payload, args):
+        from squad_builder import GeneticSquadBuilder, RandomSquadBuilder
+
+        self.snapshot = snapshot
+        self.players = list(snapshot.players)
+        self.fixture_difficulty_map = snapshot.fixture_difficulty_map
+        self.teams_payload = teams_payload
+        self.args = args
+
+        # Squads from every builder are scored by the same fitness function
+        with quiet(args.verbose):
+            self.scorer = GeneticSquadBuilder(self.players, population_size=0, generations=0,
+                                              fixture_difficulty_map=self.fixture_difficulty_map)
+            random.seed(args.seed)
+            self.user_squad = RandomSquadBuilder(self.players).build()
+        self.scored_players = {p['id']: p for p in self.scorer.players}
+
+    def fitness(self, squad) -> float:
+        if not squad:
+            return 0.0
+        return round(self.scorer._calculate_fitness([self.scored_players[p['id']] for p in squad]), 4)
+
+@contextmanager
+def quiet(verbose=False):
+    """Silences the progress prints of the benchmarked code (they still run, so their cost is measured)."""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        yield
+
+def squad_cost(squad) -> float:
+    return round(sum(p['now_cost'] for p in squad) / 10, 1) if squad else 0.0
+
+# --- Cases ---
+# Each case takes the context and returns (quality dict, evaluations or None)
+
+def bench_fixture_map(ctx):
+    from fixture_service import create_fixture_difficulty_map
+
+    if ctx.teams_payload is None:
+        raise SkipCase("needs upstream data (--bundle or live), not a snapshot file")
+    fixture_map = create_fixture_difficulty_map(ctx.teams_payload)
+    return {"teams": len(fixture_map), "fixtures": sum(len(f) for f in fixture_map.values())}, None
+
+def bench_random_builder(ctx):
+    from squad_builder import RandomSquadBuilder
+
+    squad = RandomSquadBuilder(ctx.players).build()
+    return {"fitness": ctx.fitness(squad), "squad_cost": squad_cost(squad)}, None
+
+def bench_genetic_builder(ctx):
+    from squad_builder import GeneticSquadBuilder
+
+    builder = GeneticSquadBuilder(
+        ctx.players,
+        population_size=ctx.args.population,
+        generations=ctx.args.generations,
+        fixture_difficulty_map=ctx.fixture_difficulty_map
+    )
+    squad = builder.run()
+    return {"fitness": ctx.fitness(squad), "squad_cost": squad_cost(squad)}, builder.evaluations
+
+def _analyzer(ctx):
+    from squad_builder import SquadAnalyzer
+
+    return SquadAnalyzer(ctx.user_squad, ctx.players, fixture_difficulty_map=ctx.fixture_difficulty_map)
+
+def bench_transfers(ctx):
+    analyzer = _analyzer(ctx)
+    suggestions = analyzer.find_transfers()
+    gains = [s['score_gain'] for s in suggestions]
+    return {"suggestions": len(gains), "score_gain": round(sum(gains), 4)}, analyzer.evaluations
+
+def bench_double_transfers(ctx):
+    analyzer = _analyzer(ctx)
+    double_transfer = analyzer.find_double_transfer()
+    return {"score_gain": double_transfer['score_gain'] if double_transfer else 0.0}, analyzer.evaluations
+
+def bench_chip_usage(ctx):
+    analyzer = _analyzer(ctx)
+    chip = analyzer.suggest_chip_usage()
+    return {"chip": chip['chip'] if chip else None}, analyzer.evaluations
+
+CASES = {
+    "fixture_map": bench_fixture_map,
+    "random_builder": bench_random_builder,
+    "genetic_builder": bench_genetic_builder,
+    "transfers": bench_transfers,
+    "double_transfers": bench_double_transfers,
+    "chip_usage": bench_chip_usage,
+}
+
+# --- Running ---
+
+def run_case(case, ctx, repeat: int, measure_memory=True) -> dict:
+    """
+    Runs `case` `repeat` times from the same seed and reports wall time (min
+    and median), evaluations per second and the solution quality. Peak memory
+    comes from one extra run under tracemalloc, which would skew the timings.
+    """
+    timings = []
+    for _ in range(repeat):
+        random.seed(ctx.args.seed)
+        start = time.perf_counter()
+        with quiet(ctx.args.verbose):
+            quality, evaluations = case(ctx)
+        timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    result = {
+        "wall_seconds": {
+            "min": round(min(timings), 4),
+            "median": round(median, 4),
+            "runs": [round(t, 4) for t in timings]
+        },
+        "quality": quality
+    }
+    if evaluations is not None:
+        result["evaluations"] = evaluations
+        result["evaluations_per_second"] = round(evaluations / median, 1) if median else None
+
+    if measure_memory:
+        random.seed(ctx.args.seed)
+        tracemalloc.start()
+        try:
+            with quiet(ctx.args.verbose):
+                case(ctx)
+            result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+def load_data(args):
+    """Returns (snapshot, teams payload for the fixture map or None)."""
+    if args.snapshot:
+        from snapshot_file import map_snapshot_file
+        return map_snapshot_file(args.snapshot), None
+
+    import upstream
+    from snapshot import build_snapshot
+    from fixture_service import create_fixture_difficulty_map
+
+    bootstrap_res = upstream.get(BOOTSTRAP_URL)
+    fixtures_res = upstream.get(FIXTURES_URL)
+    bootstrap_res.raise_for_status()
+    fixtures_res.raise_for_status()
+    bootstrap_data = bootstrap_res.json()
+    teams_payload = {'teams': [dict(team) for team in bootstrap_data['teams']]}
+    version = hashlib.sha1(bootstrap_res.content + fixtures_res.content).hexdigest()[:12]
+    snapshot = build_snapshot(
+        bootstrap_data,
+        fixtures_res.json(),
+        version=version,
+        fixture_map_loader=lambda: create_fixture_difficulty_map(teams_payload)
+    )
+    return snapshot, teams_payload
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(args, source: str) -> dict:
+    with quiet(args.verbose):
+        snapshot, teams_payload = load_data(args)
+        # Load the lazy fixture map now so it is not charged to the first case
+        snapshot.fixture_difficulty_map
+    ctx = BenchmarkContext(snapshot, teams_payload, args)
+
+    results = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "created_at": time.time(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "data": {
+            "source": source,
+            "version": snapshot.version,
+            "players": len(ctx.players),
+            "teams": len(snapshot.teams)
+        },
+        "params": {
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "population": args.population,
+            "generations": args.generations
+        },
+        "cases": {}
+    }
+    for name in args.cases:
+        print(f"Running {name} on {source}...", file=sys.stderr)
+        try:
+            results["cases"][name] = run_case(CASES[name], ctx, args.repeat, measure_memory=not args.no_memory)
+        except SkipCase as e:
+            results["cases"][name] = {"skipped": str(e)}
+    return results
+
+def parse_sizes(spec: str, teams: int, gameweeks: int) -> list:
+    """Parses "700,2500x50,10000x100x50" (players[xteams[xgameweeks]]) into generator params."""
+    sizes = []
+    for item in spec.split(","):
+        parts = [int(v) for v in item.strip().lower().split("x")]
+        sizes.append({
+            "players": parts[0],
+            "teams": parts[1] if len(parts) > 1 else teams,
+            "gameweeks": parts[2] if len(parts) > 2 else gameweeks
+        })
+    return sizes
+
+def run_scaling(args) -> dict:
+    """
+    Runs the benchmarks on synthetic datasets of increasing size and fits each
+    case's growth as time ~ players^k, so super-linear hot spots stand out.
+    """
+    import upstream
+    from synthetic_data import generate_bundle
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="fpl-synthetic-") as directory:
+        for size in parse_sizes(args.synthetic, args.synthetic_teams, args.synthetic_gameweeks):
+            path = os.path.join(directory, f"{size['players']}p-{size['teams']}t-{size['gameweeks']}gw")
+            bundle = generate_bundle(
+                path, seed=args.seed, price_distribution=args.price_distribution,
+                score_distribution=args.score_distribution, detail_players=0, **size
+            )
+            upstream.replay_from(path)
+            runs.append(run_benchmarks(args, bundle.manifest["label"]))
+
+    scaling = {}
+    for name in args.cases:
+        points = [(run["data"]["players"], run["cases"][name]["wall_seconds"]["median"])
+                  for run in runs if "wall_seconds" in run["cases"][name]]
+        scaling[name] = {"points": points, "exponent": _loglog_slope(points)}
+    return {"format_version": RESULTS_FORMAT_VERSION, "scaling": scaling, "runs": runs}
+
+def _loglog_slope(points):
+    """Least-squares slope of log(time) against log(size), or None with fewer than two sizes."""
+    points = [(math.log(n), math.log(t)) for n, t in points if n > 0 and t > 0]
+    if len({x for x, _ in points}) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / sum((x - mean_x) ** 2 for x, _ in points)
+    return round(slope, 2)
+
+# --- Reporting ---
+
+def paired_runs(current: dict, baseline: dict) -> list:
+    """Pairs the runs of two results files; scaling runs are matched by dataset."""
+    current_runs, baseline_runs = current.get("runs", [current]), baseline.get("runs", [baseline])
+    if len(current_runs) == 1 and len(baseline_runs) == 1:
+        return [(current_runs[0], baseline_runs[0])]
+    by_source = {run["data"]["source"]: run for run in baseline_runs}
+    return [(run, by_source[run["data"]["source"]]) for run in current_runs if run["data"]["source"] in by_source]
+
+def compare_results(current: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Lists regressions of `current` against `baseline`: median wall time or peak
+    memory more than `tolerance` (a fraction) above the baseline, and lower
+    solution quality when both ran on the same data with the same parameters.
+    """
+    regressions = []
+    for run, base_run in paired_runs(current, baseline):
+        same_inputs = run["data"]["version"] == base_run["data"]["version"] and run["params"] == base_run["params"]
+        for name, result in run["cases"].items():
+            base = base_run["cases"].get(name)
+            if not base or "skipped" in result or "skipped" in base:
+                continue
+
+            for metric, now, before in (
+                ("wall_seconds.median", result["wall_seconds"]["median"], base["wall_seconds"]["median"]),
+                ("peak_memory_bytes", result.get("peak_memory_bytes"), base.get("peak_memory_bytes"))
+            ):
+                if now is not None and before and now > before * (1 + tolerance):
+                    regressions.append({"data": run["data"]["source"], "case": name, "metric": metric, "baseline": before,
+                                        "current": now, "change_pct": round((now / before - 1) * 100, 1)})
+
+            if same_inputs:
+                for metric in QUALITY_METRICS:
+                    now, before = result["quality"].get(metric), base["quality"].get(metric)
+                    if now is not None and before is not None and now < before - 1e-6:
+                        regressions.append({"data": run["data"]["source"], "case": name, "metric": f"quality.{metric}",
+                                            "baseline": before, "current": now})
+    return regressions
+
+def format_summary(results: dict) -> str:
+    lines = [f"{results['data']['source']} ({results['data']['players']} players, {results['data']['teams']} teams)",
+             f"{'case':<18}{'median s':>10}{'min s':>10}{'evals/s':>12}{'peak MiB':>10}  quality"]
+    for name, result in results["cases"].items():
+        if "skipped" in result:
+            lines.append(f"{name:<18}skipped: {result['skipped']}")
+            continue
+        evals = result.get("evaluations_per_second")
+        peak = result.get("peak_memory_bytes")
+        lines.append(
+            f"{name:<18}{result['wall_seconds']['median']:>10.3f}{result['wall_seconds']['min']:>10.3f}"
+            f"{(f'{evals:,.0f}' if evals else '-'):>12}{(f'{peak / 2**20:.1f}' if peak is not None else '-'):>10}"
+            f"  {json.dumps(result['quality'])}"
+        )
+    return "\n".join(lines)
+
+def format_scaling(scaling: dict) -> str:
+    lines = ["Scaling (median seconds by player count; time ~ players^k):"]
+    for name, fit in scaling.items():
+        points = "  ".join(f"{n}: {t:.3f}" for n, t in fit["points"])
+        exponent = f"k={fit['exponent']:.2f}" if fit["exponent"] is not None else "k=?"
+        lines.append(f"  {name:<18}{exponent:<8}{points}")
+    return "\n".join(lines)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark squad building and analysis on fixed data.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--bundle", help="Replay upstream data from this recorded bundle (offline).")
+    source.add_argument("--snapshot", help="Use a snapshot file written by SharedSnapshotStore.")
+    source.add_argument("--synthetic", metavar="SIZES",
+                        help="Scaling run on generated data, e.g. 700,2500,10000x100 (players[xteams[xgameweeks]]).")
+    parser.add_argument("--synthetic-teams", type=int, default=20, help="Teams per synthetic dataset (default: 20).")
+    parser.add_argument("--synthetic-gameweeks", type=int, default=38)
+    parser.add_argument("--price-distribution", choices=PRICE_DISTRIBUTIONS, default="skewed")
+    parser.add_argument("--score-distribution", choices=SCORE_DISTRIBUTIONS, default="correlated")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (default: 3).")
+    parser.add_argument("--population", type=int, default=200, help="GA population size (as /api/ai-squad).")
+    parser.add_argument("--generations", type=int, default=100, help="GA generations (as /api/ai-squad).")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak memory run.")
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    parser.add_argument("--compare", help="Baseline results JSON to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown / memory growth before flagging a regression (default: 0.2 = 20%%).")
+    parser.add_argument("--verbose", action="store_true", help="Show the benchmarked code's output.")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.synthetic:
+        results = run_scaling(args)
+        for run in results["runs"]:
+            print(format_summary(run) + "\n")
+        print(format_scaling(results["scaling"]))
+    else:
+        if args.bundle:
+            import upstream
+            upstream.replay_from(args.bundle, os.getenv("UPSTREAM_REPLAY_LATENCY", "0"))
+        results = run_benchmarks(args, args.snapshot or args.bundle or "live")
+        print(format_summary(results))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        pairs = paired_runs(results, baseline)
+        if not pairs:
+            print(f"Nothing in {args.compare} ran on the same datasets; no comparison made.")
+        elif any(run["data"]["version"] != base["data"]["version"] or run["params"] != base["params"] for run, base in pairs):
+            print("Note: some baseline runs used different data or parameters; their quality is not compared.")
+        regressions = compare_results(results, baseline, args.tolerance)
+        for r in regressions:
+            change = f" ({r['change_pct']:+.1f}%)" if "change_pct" in r else ""
+            print(f"REGRESSION {r['data']} {r['case']} {r['metric']}: {r['baseline']} -> {r['current']}{change}")
+        if pairs and not regressions:
+            print(f"No regressions against {args.compare}.")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
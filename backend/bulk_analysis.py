@@ -0,0 +1,174 @@
+import os
+import copy
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from squad_builder import AnalysisContext, SquadAnalyzer
+from snapshot import player_to_dict, to_plain
+from reasoning import SOURCE_LLM, SOURCE_CACHE
+
+# Analyses of many squads against one snapshot (e.g. a whole mini-league). The
+# snapshot-wide work (every player's AI score and the wildcard comparison squad)
+# is done once, in an AnalysisContext, and the squads are analyzed in a pool of
+# worker processes that each receive the players and the context once, at start-up.
+# Workers are spawned rather than forked, since the API process runs threads.
+
+def analysis_response(captain, vice_captain, transfers, double_transfer, chip_suggestion) -> Dict[str, Any]:
+    """The analyzer's results as plain data, in the shape /api/analyze-squad returns."""
+    double_transfer_suggestion = None
+    if double_transfer:
+        double_transfer_suggestion = {
+            "players_out": [player_to_dict(p) for p in double_transfer['players_out']],
+            "players_in": [player_to_dict(p) for p in double_transfer['players_in']],
+            "score_gain": double_transfer['score_gain'],
+            "reason": double_transfer.get('reason'),
+            "reason_source": double_transfer.get('reason_source'),
+        }
+    return {
+        "captain_suggestion": player_to_dict(captain),
+        "vice_captain_suggestion": player_to_dict(vice_captain),
+        "suggested_transfers": [
+            {
+                "player_out": player_to_dict(t['player_out']),
+                "player_in": player_to_dict(t['player_in']),
+                "score_gain": t['score_gain'],
+                "reason": t.get('reason'),
+                "reason_source": t.get('reason_source'),
+            }
+            for t in transfers
+        ],
+        "double_transfer_suggestion": double_transfer_suggestion,
+        "chip_suggestion": to_plain(chip_suggestion),
+    }
+
+def analyze_squad(user_squad, players, fixture_difficulty_map, context: AnalysisContext) -> Dict[str, Any]:
+    """Analyzes one squad without transfer reasons (see attach_reasons). Blocking."""
+    analyzer = SquadAnalyzer(user_squad, players, fixture_difficulty_map=fixture_difficulty_map, context=context)
+    captain, vice_captain = analyzer.suggest_captain()
+    transfers = analyzer.find_transfers()
+    double_transfer = analyzer.find_double_transfer()
+    return analysis_response(captain, vice_captain, transfers, double_transfer, analyzer.suggest_chip_usage())
+
+async def attach_reasons(analysis: Dict[str, Any], batch_reasoning_generator):
+    """
+    Fills in the reasons of an analysis_response with one call to
+    `batch_reasoning_generator`, as SquadAnalyzer.attach_batch_reasoning does.
+    """
+    transfers = analysis["suggested_transfers"]
+    double_transfer = analysis["double_transfer_suggestion"]
+    pairs = [(t["player_out"], t["player_in"]) for t in transfers]
+    if double_transfer:
+        pairs.extend(zip(double_transfer["players_out"], double_transfer["players_in"]))
+    if not pairs:
+        return
+    reasons = await batch_reasoning_generator(pairs)
+    for transfer, (reason, source) in zip(transfers, reasons):
+        transfer["reason"], transfer["reason_source"] = reason, source
+    if double_transfer:
+        SquadAnalyzer._apply_double_transfer_reasons(double_transfer, reasons[len(transfers):])
+
+def _suggestions(analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The single transfers of an analysis_response and its double transfer, if any."""
+    double_transfer = analysis["double_transfer_suggestion"]
+    return analysis["suggested_transfers"] + ([double_transfer] if double_transfer else [])
+
+def _final_reason(suggestion: Dict[str, Any]) -> bool:
+    # A double transfer's source joins its pairs' sources, e.g. "llm+template"
+    source = suggestion.get("reason_source")
+    return bool(source) and set(source.split("+")) <= {SOURCE_LLM, SOURCE_CACHE}
+
+def has_final_reasons(analysis: Dict[str, Any]) -> bool:
+    """True if every suggestion's reason came from the LLM or the reasoning cache, none from a template."""
+    return all(_final_reason(suggestion) for suggestion in _suggestions(analysis))
+
+def storable_analysis(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A copy of an analysis_response to put into the analysis store. Template reasons
+    only stand in for an LLM that was slow or down, so they are left out; reasons
+    are attached again when the stored analysis is served.
+    """
+    stored = copy.deepcopy(analysis)
+    for suggestion in _suggestions(stored):
+        if not _final_reason(suggestion):
+            suggestion["reason"], suggestion["reason_source"] = None, None
+    return stored
+
+# Worker process state, set once by _init_worker
+_worker_state = None
+
+def _init_worker(players, fixture_difficulty_map, context):
+    global _worker_state
+    _worker_state = (players, fixture_difficulty_map, context)
+
+def _analyze_in_worker(user_squad):
+    return analyze_squad(user_squad, *_worker_state)
+
+class BulkAnalyzer:
+    """
+    Analyzes many squads against one set of players with shared precomputation.
+    Use as a context manager (or start() and close()); `submit` returns a Future
+    per squad and `analyze` yields results in input order as they become available.
+    """
+    def __init__(self, players: List[Dict[str, Any]], fixture_difficulty_map, context: AnalysisContext = None,
+                 workers: Optional[int] = None):
+        """
+        - players: All players of the snapshot (records or dicts).
+        - fixture_difficulty_map: The snapshot's fixture difficulty map.
+        - context: AnalysisContext for these players, e.g. cached per snapshot version;
+          built here (running the wildcard genetic algorithm) when omitted.
+        - workers: Worker processes; defaults to one per core. With 1, squads are
+          analyzed in a single thread of this process instead.
+        """
+        self.players = players
+        self.fixture_difficulty_map = fixture_difficulty_map
+        self.context = context or AnalysisContext.build(players, fixture_difficulty_map)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self._executor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self) -> "BulkAnalyzer":
+        """Creates the worker pool; processes are spawned on the first submit."""
+        if self.workers == 1:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                # Plain dicts, so the snapshot's compact records need not be picklable
+                initargs=([to_plain(p) for p in self.players], to_plain(self.fixture_difficulty_map), self.context)
+            )
+        return self
+
+    def close(self, cancel_pending=True):
+        """
+        Stops the workers once they finish their current squads. Squads not started
+        yet are dropped, or with cancel_pending=False, analyzed first.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=cancel_pending)
+            self._executor = None
+
+    def submit(self, user_squad: List[Dict[str, Any]]) -> Future:
+        if self.workers == 1:
+            return self._executor.submit(
+                analyze_squad, user_squad, self.players, self.fixture_difficulty_map, self.context
+            )
+        return self._executor.submit(_analyze_in_worker, [to_plain(p) for p in user_squad])
+
+    def analyze(self, squads: Iterable[List[Dict[str, Any]]]) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+        """
+        Yields (index, analysis, None) per squad in input order, or (index, None, error)
+        for a squad that could not be analyzed (e.g. a player without an id).
+        """
+        futures = [self.submit(squad) for squad in squads]
+        for index, future in enumerate(futures):
+            try:
+                yield index, future.result(), None
+            except Exception as e:
+                yield index, None, f"{type(e).__name__}: {e}"
@@ -0,0 +1,32 @@
+import threading
+
+
+class OperationCancelled(Exception):
+    """Raised when a long-running computation is abandoned by its caller."""
+
+
+class CancellationToken:
+    """
+    A thread-safe flag used to cooperatively stop work nobody is waiting for.
+    The GA and the squad analyzer check it between generations and stages,
+    and the API layer sets it when the HTTP client disconnects.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled()
+
+
+def raise_if_cancelled(cancel_token):
+    """Convenience check that tolerates a missing token."""
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
@@ -0,0 +1,68 @@
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Optional, Tuple
+import metrics
+
+class DetailsStore:
+    """
+    SQLite-backed persistence for the player details view:
+    - the FPL -> SportMonks player id map, filled on first match (or by a
+      bulk prebuild) and kept across restarts. Failed matches are stored too,
+      so they are only retried after a while.
+    - a JSON response cache with a TTL per entry, for season lists, player
+      stats and finished FPL gameweeks.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS player_ids ("
+                "fpl_id INTEGER PRIMARY KEY, sportmonks_id INTEGER, name TEXT, matched_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # One short-lived connection per operation keeps this safe across threadpool workers
+        return closing(sqlite3.connect(self.path, timeout=10))
+
+    def get_player_id(self, fpl_id: int) -> Optional[Tuple[Optional[int], float]]:
+        """Returns (sportmonks_id or None for a failed match, matched_at), or None if never tried."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT sportmonks_id, matched_at FROM player_ids WHERE fpl_id = ?", (fpl_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def set_player_id(self, fpl_id: int, sportmonks_id: Optional[int], name: str):
+        with self._lock, self._connect() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO player_ids (fpl_id, sportmonks_id, name, matched_at) VALUES (?, ?, ?, ?)",
+                (fpl_id, sportmonks_id, name, time.time())
+            )
+
+    def mapped_player_count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM player_ids WHERE sportmonks_id IS NOT NULL").fetchone()[0]
+
+    def get_response(self, key: str) -> Optional[Any]:
+        """Returns the cached JSON value for `key`, or None if missing or expired."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            metrics.cache_lookups.inc(cache="details", result="miss")
+            return None
+        metrics.cache_lookups.inc(cache="details", result="hit")
+        return json.loads(row[0])
+
+    def put_response(self, key: str, value: Any, ttl_seconds: float):
+        with self._lock, self._connect() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl_seconds)
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
@@ -1,16 +1,22 @@
 import re
-import requests
+import logging
+import upstream
 from thefuzz import process
 
-def get_team_strength_data():
+logger = logging.getLogger(__name__)
+
+def get_team_strength_data(bootstrap_data=None):
     """
     Fetches the bootstrap-static data from the FPL API to get team strength ratings.
+    Already-fetched bootstrap data can be passed in to skip the request.
     """
-    print("Fetching team strength data from FPL API...")
-    url = "https://fantasy.premierleague.com/api/bootstrap-static/"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
+    if bootstrap_data is None:
+        logger.debug("Fetching team strength data from FPL API...")
+        url = "https://fantasy.premierleague.com/api/bootstrap-static/"
+        response = upstream.get(url)
+        response.raise_for_status()
+        bootstrap_data = response.json()
+    data = bootstrap_data
     
     teams = data.get('teams', [])
     team_strength_map = {
@@ -23,19 +29,19 @@ def get_team_strength_data():
             'strength_overall_away': team['strength_overall_away'],
         } for team in teams
     }
-    print(f"Successfully fetched strength data for {len(team_strength_map)} teams.")
+    logger.debug("Fetched strength data for %d teams.", len(team_strength_map))
     return team_strength_map
 
 def get_fixture_data():
     """
     Fetches the full fixture list from the PulseLive API.
     """
-    print("Fetching full season fixture data from PulseLive API...")
+    logger.debug("Fetching full season fixture data from PulseLive API...")
     url = "https://footballapi.pulselive.com/football/fixtures?comps=1&page=0&pageSize=500&sort=asc&statuses=U,S"
-    response = requests.get(url)
+    response = upstream.get(url)
     response.raise_for_status()
     fixtures = response.json().get('content', [])
-    print(f"Successfully fetched {len(fixtures)} fixtures.")
+    logger.debug("Fetched %d fixtures.", len(fixtures))
     return fixtures
 
 def _sanitize_team_name(name):
@@ -69,13 +75,13 @@ def _normalize_strength_to_difficulty(strength, min_strength, max_strength):
     difficulty = 1 + (normalized * 4)
     return round(difficulty)
 
-def create_fixture_difficulty_map():
+def create_fixture_difficulty_map(bootstrap_data=None):
     """
     Creates a map of upcoming fixtures and their calculated difficulty for each team,
     using fuzzy matching for robust team name mapping.
+    - bootstrap_data: Optional bootstrap-static payload to reuse for team strengths.
     """
-    print("\n--- Creating Fixture Difficulty Map ---")
-    team_strength = get_team_strength_data()
+    team_strength = get_team_strength_data(bootstrap_data)
     fixtures = get_fixture_data()
     
     # --- NEW: Normalize team strength to a 1-5 difficulty scale ---
@@ -83,11 +89,9 @@ def create_fixture_difficulty_map():
                     [s['strength_overall_away'] for s in team_strength.values()]
     min_strength = min(all_strengths)
     max_strength = max(all_strengths)
-    print(f"Normalizing team strengths (Min: {min_strength}, Max: {max_strength}) to a 1-5 difficulty scale.")
+    logger.debug("Normalizing team strengths (Min: %s, Max: %s) to a 1-5 difficulty scale.", min_strength, max_strength)
     # ---
 
-    print("Dynamically mapping team names using fuzzy matching...")
-    
     fpl_team_names = list(team_strength.keys())
     pulse_team_names = list(set([team['team']['name'] for fixture in fixtures for team in fixture['teams']]))
     
@@ -106,10 +110,10 @@ def create_fixture_difficulty_map():
                     team_name_map[pulse_name] = original_fpl_name
                     break
     
-    print(f"Successfully mapped {len(team_name_map)} out of {len(pulse_team_names)} teams.")
+    if len(team_name_map) < len(pulse_team_names):
+        logger.warning("Mapped only %d out of %d PulseLive teams to FPL teams.", len(team_name_map), len(pulse_team_names))
 
     fixture_map = {fpl_name: [] for fpl_name in fpl_team_names}
-    print("Processing fixtures and calculating difficulty scores...")
 
     for fixture in fixtures:
         gameweek = fixture.get('gameweek', {}).get('gameweek')
@@ -141,8 +145,7 @@ def create_fixture_difficulty_map():
                     "location": "A"
                 })
     
-    print(f"Fixture difficulty map created successfully for {len(fixture_map)} teams.")
-    print("--- Fixture Service Initialized ---\n")
+    logger.info("Fixture difficulty map created for %d teams from %d fixtures.", len(fixture_map), len(fixtures))
     return fixture_map
 
 if __name__ == "__main__":
@@ -0,0 +1,337 @@
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+# Load generator for the API. It drives a mix of endpoints at increasing
+# concurrency and reports throughput, latency percentiles and error rates per
+# endpoint. It can start the app itself, replaying upstreams from a bundle (a
+# recording or one made by synthetic_data.py) with the LLM replaced by the
+# local stub, so a run never touches FPL, PulseLive, SportMonks or Azure:
+#
+#   python synthetic_data.py --players 3000 --teams 40 --out bundles/load
+#   python loadtest.py --start-app --bundle bundles/load --workers 2 --concurrency 1,4,16,32
+#
+# Without --start-app it targets an app that is already running (--url).
+
+# Relative weight of each endpoint in the request mix
+DEFAULT_MIX = "players=40,player=25,random-squad=15,analyze-squad=15,ai-squad=5"
+ENDPOINTS = ("players", "ai-squad", "random-squad", "analyze-squad", "player")
+
+class LoadTestSetupError(Exception):
+    """The target app could not be started or prepared for the test."""
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{name}'; expected one of {', '.join(ENDPOINTS)}.")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one endpoint with a positive weight.")
+    return mix
+
+def parse_ids(spec: str) -> list:
+    """Parses "1-200,305,410-420" into a list of ids."""
+    ids = []
+    for item in spec.split(","):
+        low, _, high = item.partition("-")
+        ids.extend(range(int(low), int(high or low) + 1))
+    return ids
+
+def percentile(sorted_values, pct: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+class ApiClient:
+    """One keep-alive HTTP connection, as a browser tab or API consumer would hold."""
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, method: str, path: str, body=None, decode=False):
+        """
+        Returns (status, body bytes); reconnects once if the kept-alive connection
+        was dropped. Bodies are gzip-decoded only with `decode`, to keep the
+        client's own CPU use out of the measurements.
+        """
+        headers = {"Accept-Encoding": "gzip"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            if self.connection is None:
+                connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+                self.connection = connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body=payload, headers=headers)
+                response = self.connection.getresponse()
+                content = response.read()
+                if decode and response.getheader("Content-Encoding") == "gzip":
+                    content = gzip.decompress(content)
+                return response.status, content
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+            except Exception:
+                self.close()
+                raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+class LoadTest:
+    """
+    Runs phases of `duration` seconds, one per concurrency level. Each of the
+    phase's workers loops: pick an endpoint by weight, send the request, record
+    its latency and outcome.
+    - squads: Realistic 15-player squads to post to /api/analyze-squad.
+    - player_ids: Players to request from /api/player/{id}.
+    """
+    def __init__(self, base_url: str, mix: dict, squads: list, player_ids: list, timeout=60.0, seed=0):
+        self.base_url = base_url
+        self.mix = mix
+        self.squads = squads
+        self.player_ids = player_ids
+        self.timeout = timeout
+        self.seed = seed
+
+    def _request_for(self, endpoint: str, rng: random.Random):
+        if endpoint == "players":
+            return "GET", "/api/players", None
+        if endpoint == "ai-squad":
+            return "GET", "/api/ai-squad", None
+        if endpoint == "random-squad":
+            return "GET", "/api/random-squad", None
+        if endpoint == "analyze-squad":
+            return "POST", "/api/analyze-squad", {"squad": rng.choice(self.squads)}
+        return "GET", f"/api/player/{rng.choice(self.player_ids)}", None
+
+    def _worker(self, worker_id: int, stop_at: float, samples: list):
+        rng = random.Random(self.seed * 1000 + worker_id)
+        client = ApiClient(self.base_url, self.timeout)
+        endpoints, weights = list(self.mix), list(self.mix.values())
+        try:
+            while time.monotonic() < stop_at:
+                endpoint = rng.choices(endpoints, weights=weights)[0]
+                method, path, body = self._request_for(endpoint, rng)
+                start = time.perf_counter()
+                try:
+                    status, _ = client.request(method, path, body)
+                    outcome = status
+                except Exception as e:
+                    outcome = type(e).__name__
+                samples.append((endpoint, time.perf_counter() - start, outcome))
+        finally:
+            client.close()
+
+    def run_phase(self, concurrency: int, duration: float) -> dict:
+        samples = []
+        stop_at = time.monotonic() + duration
+        started = time.perf_counter()
+        workers = [
+            threading.Thread(target=self._worker, args=(i, stop_at, samples), daemon=True)
+            for i in range(concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        # Requests in flight at the deadline still finish, so measure the real span
+        return summarize(samples, concurrency, time.perf_counter() - started)
+
+def summarize(samples: list, concurrency: int, elapsed: float) -> dict:
+    """Per-endpoint and overall throughput, latency percentiles (ms) and error rates of one phase."""
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+    by_endpoint["all"] = samples
+
+    endpoints = {}
+    for endpoint, endpoint_samples in by_endpoint.items():
+        latencies = sorted(latency * 1000 for _, latency, _ in endpoint_samples)
+        outcomes = defaultdict(int)
+        for _, _, outcome in endpoint_samples:
+            outcomes[str(outcome)] += 1
+        errors = sum(count for outcome, count in outcomes.items() if not (outcome.isdigit() and int(outcome) < 400))
+        endpoints[endpoint] = {
+            "requests": len(endpoint_samples),
+            "throughput_rps": round(len(endpoint_samples) / elapsed, 2) if elapsed else None,
+            "error_rate": round(errors / len(endpoint_samples), 4) if endpoint_samples else 0.0,
+            "outcomes": dict(outcomes),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50), 1) if latencies else None,
+                "p95": round(percentile(latencies, 95), 1) if latencies else None,
+                "p99": round(percentile(latencies, 99), 1) if latencies else None,
+                "max": round(latencies[-1], 1) if latencies else None
+            }
+        }
+    return {"concurrency": concurrency, "elapsed_seconds": round(elapsed, 2), "endpoints": endpoints}
+
+def format_phase(phase: dict) -> str:
+    lines = [f"concurrency {phase['concurrency']} ({phase['elapsed_seconds']}s)",
+             f"  {'endpoint':<15}{'requests':>9}{'req/s':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    endpoints = phase["endpoints"]
+    for name in sorted(endpoints, key=lambda n: (n == "all", n)):
+        stats = endpoints[name]
+        latency = stats["latency_ms"]
+
+        def ms(value):
+            return f"{value:.1f}" if value is not None else "-"
+        lines.append(
+            f"  {name:<15}{stats['requests']:>9}{stats['throughput_rps']:>9.1f}{stats['error_rate']:>8.1%}"
+            f"{ms(latency['p50']):>10}{ms(latency['p95']):>10}{ms(latency['p99']):>10}"
+        )
+    return "\n".join(lines)
+
+# --- Target setup ---
+
+def wait_until_ready(client: ApiClient, timeout: float, app=None):
+    """Polls /ready until the app has loaded its data (the warm-up includes the first snapshot)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if app is not None and app.poll() is not None:
+            raise LoadTestSetupError(f"The app exited with status {app.returncode} during startup.")
+        try:
+            status, _ = client.request("GET", "/ready")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise LoadTestSetupError(f"The app was not ready within {timeout:.0f}s.")
+
+def fetch_fixtures(client: ApiClient, squad_count: int, player_ids_spec: str):
+    """Realistic request bodies: random squads generated by the app, and player ids to look up."""
+    squads = []
+    for _ in range(squad_count):
+        status, body = client.request("GET", "/api/random-squad", decode=True)
+        if status != 200:
+            raise LoadTestSetupError(f"/api/random-squad returned {status} while preparing squads.")
+        squads.append(json.loads(body)["squad"])
+
+    if player_ids_spec:
+        return squads, parse_ids(player_ids_spec)
+    status, body = client.request("GET", "/api/players?fields=id", decode=True)
+    if status != 200:
+        raise LoadTestSetupError(f"/api/players returned {status} while preparing player ids.")
+    # The lowest ids are the ones synthetic bundles have details for
+    return squads, sorted(p["id"] for p in json.loads(body))[:200]
+
+def start_app(args, directory: str) -> subprocess.Popen:
+    """Starts the app under uvicorn, replaying upstreams from `args.bundle` and with the stub LLM."""
+    env = dict(
+        os.environ,
+        UPSTREAM_MODE="replay",
+        UPSTREAM_BUNDLE_DIR=os.path.abspath(args.bundle),
+        UPSTREAM_REPLAY_LATENCY=args.upstream_latency,
+        REASONING_CLIENT="stub",
+        REASONING_STUB_LATENCY_SECONDS=str(args.llm_latency),
+        DETAILS_CACHE_PATH=os.path.join(directory, "details.sqlite3"),
+        ANALYSIS_STORE_PATH=os.path.join(directory, "analyses.sqlite3"),
+        PREWARM_ON_STARTUP="1"
+    )
+    if args.workers > 1:
+        env["SNAPSHOT_SHARED_PATH"] = os.path.join(directory, "snapshot.bin")
+    port = urlsplit(args.url).port or 8000
+    log = open(args.app_log, "w") if args.app_log else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the API at increasing concurrency.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the app.")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Endpoint weights (default: {DEFAULT_MIX}).")
+    parser.add_argument("--concurrency", default="1,4,16", help="Concurrency levels, one phase each (default: 1,4,16).")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per phase (default: 20).")
+    parser.add_argument("--squads", type=int, default=10, help="Distinct squads to analyze (default: 10).")
+    parser.add_argument("--player-ids", help="Ids for /api/player/{id}, e.g. 1-200 (default: the 200 lowest).")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    app = parser.add_argument_group("starting the app (--start-app)")
+    app.add_argument("--start-app", action="store_true", help="Start the app locally with stubbed upstreams.")
+    app.add_argument("--bundle", help="Upstream bundle to replay (required with --start-app).")
+    app.add_argument("--workers", type=int, default=1, help="uvicorn workers; >1 shares one snapshot file.")
+    app.add_argument("--upstream-latency", default="0", help="Replay latency, e.g. 50-200 ms (see recording.LatencyModel).")
+    app.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub LLM takes per completion.")
+    app.add_argument("--startup-timeout", type=float, default=300.0)
+    app.add_argument("--app-log", help="File for the app's output (default: discarded).")
+    args = parser.parse_args(argv)
+    if args.start_app and not args.bundle:
+        parser.error("--start-app needs --bundle")
+    return args
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    client = ApiClient(args.url, args.timeout)
+
+    with tempfile.TemporaryDirectory(prefix="fpl-loadtest-") as directory:
+        app = start_app(args, directory) if args.start_app else None
+        try:
+            wait_until_ready(client, args.startup_timeout if app else 10.0, app)
+            squads, player_ids = fetch_fixtures(client, args.squads, args.player_ids)
+            client.close()
+
+            test = LoadTest(args.url, args.mix, squads, player_ids, timeout=args.timeout, seed=args.seed)
+            phases = []
+            for concurrency in levels:
+                print(f"Running {args.duration:.0f}s at concurrency {concurrency}...", file=sys.stderr)
+                phase = test.run_phase(concurrency, args.duration)
+                phases.append(phase)
+                print(format_phase(phase) + "\n")
+        except LoadTestSetupError as e:
+            print(f"Load test setup failed: {e}", file=sys.stderr)
+            return 2
+        finally:
+            if app is not None:
+                app.terminate()
+                try:
+                    app.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    app.kill()
+
+    if args.output:
+        results = {
+            "created_at": time.time(),
+            "url": args.url,
+            "mix": args.mix,
+            "duration_seconds": args.duration,
+            "app": {"bundle": args.bundle, "workers": args.workers, "upstream_latency": args.upstream_latency,
+                    "llm_latency": args.llm_latency} if args.start_app else None,
+            "phases": phases
+        }
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
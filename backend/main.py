@@ -1,17 +1,152 @@
 import os
+import json
+import time
+import logging
+import asyncio
+import functools
+import threading
+from concurrent.futures import BrokenExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
 import requests
 from dotenv import load_dotenv
-from unidecode import unidecode
-from squad_builder import GeneticSquadBuilder, SquadAnalyzer, RandomSquadBuilder
+from squad_builder import SquadAnalyzer, RandomSquadBuilder, AnalysisContext, select_ai_squad
+from bulk_analysis import BulkAnalyzer, attach_reasons, has_final_reasons, storable_analysis
+from cancellation import CancellationToken, OperationCancelled, raise_if_cancelled
+from fixture_service import create_fixture_difficulty_map
+from snapshot import SnapshotStore, build_snapshot, snapshot_version, player_to_dict, to_plain
+from snapshot_file import SharedSnapshotStore
+from snapshot_history import SnapshotHistory
+from warmup import WarmupTracker
+from details_store import DetailsStore
+from analysis_store import AnalysisStore, squad_fingerprint
+from precompute import PrecomputedResults, AI_SQUAD_FILE, FIXTURE_MAP_FILE
+from sportmonks import SportMonksClient, SportMonksError
+from refresher import SnapshotRefresher
+from recording import LatencyModel, RecordingChatClient, ReplayChatClient
+import upstream
+import metrics
+import profiling
+from logs import configure_logging
+from player_index import QueryError
+from player_payloads import (
+    PlayerPayloadCache, PayloadError, MEDIA_TYPES, parse_fields, check_format, choose_encoding,
+    payload_etag, etag_matches
+)
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from openai import AsyncAzureOpenAI
+from reasoning import (
+    ReasoningCache, ReasoningDeadline, StubChatClient, reasoning_cache_key, batch_key,
+    request_transfer_reasoning, request_batch_transfer_reasoning, template_transfer_reasoning,
+    SOURCE_LLM, SOURCE_CACHE, SOURCE_TEMPLATE
+)
 
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Transfer reasons are shared across requests; set REASONING_CACHE_PATH to keep them across restarts.
+reasoning_cache = ReasoningCache(
+    max_entries=int(os.getenv("REASONING_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=int(os.getenv("REASONING_CACHE_TTL_SECONDS", str(6 * 3600))),
+    persist_path=os.getenv("REASONING_CACHE_PATH")
+)
+
+PREWARM_ON_STARTUP = os.getenv("PREWARM_ON_STARTUP", "1") == "1"
+# Delay before retrying failed required warm-up stages; doubles on every failure up to the max
+PREWARM_RETRY_SECONDS = float(os.getenv("PREWARM_RETRY_SECONDS", "5"))
+PREWARM_MAX_RETRY_SECONDS = float(os.getenv("PREWARM_MAX_RETRY_SECONDS", "300"))
+# Startup warm-up stages reported by /ready: (name, required for readiness)
+warmup = WarmupTracker([
+    ("snapshot", True),
+    ("indexes", True),
+    ("fixture_difficulty_map", False),
+    ("ai_squad", False),
+] if PREWARM_ON_STARTUP else [])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so /ready can report progress while it runs
+    background_tasks = []
+    if PREWARM_ON_STARTUP:
+        background_tasks.append(asyncio.create_task(prewarm()))
+    if SNAPSHOT_REFRESHER:
+        background_tasks.append(asyncio.create_task(snapshot_refresher.run()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    reasoning_cache.save()
+    close_bulk_analyzers()
+
+app = FastAPI(lifespan=lifespan)
+
+class DataAgeHeadersMiddleware:
+    """
+    Adds the current snapshot's version and age to every response, and whether
+    it is stale (past its TTL and being revalidated, e.g. while upstream is down).
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-app = FastAPI()
+        async def send_with_data_age(message):
+            if message["type"] == "http.response.start":
+                snapshot = snapshot_store.peek()
+                if snapshot is not None:
+                    headers = MutableHeaders(raw=message.setdefault("headers", []))
+                    headers["X-Data-Version"] = snapshot.version
+                    headers["X-Data-Age-Seconds"] = str(int(snapshot.age_seconds))
+                    headers["X-Data-Stale"] = "true" if snapshot_store.is_stale(snapshot) else "false"
+            await send(message)
+
+        await self.app(scope, receive, send_with_data_age)
+
+class RequestMetricsMiddleware:
+    """
+    Counts requests and times them by route template, and lists the stages
+    timed with metrics.span while serving a request in its Server-Timing header.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        trace, token = metrics.start_trace(scope)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if trace.spans:
+                    headers = MutableHeaders(raw=message.setdefault("headers", []))
+                    headers["Server-Timing"] = trace.server_timing()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.end_trace(token)
+            route = trace.route
+            metrics.http_requests.inc(route=route, method=scope["method"], status=metrics.status_class(status_code))
+            metrics.http_request_seconds.observe(time.perf_counter() - start, route=route)
+
+app.add_middleware(DataAgeHeadersMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
 
 SPORTMONKS_API_KEY = os.getenv("SPORTMONKS_API_KEY")
 SPORTMONKS_API_URL = "https://api.sportmonks.com/v3/football"
@@ -21,117 +156,192 @@ PREMIER_LEAGUE_ID = 8 # Found via SportMonks documentation
 OPENAI_API_KEY = os.getenv("OPEN_AI_CREDS")
 OPENAI_ENDPOINT = os.getenv("OPEN_AI_HOST")
 
-# Initialize Azure OpenAI client
-client = AsyncAzureOpenAI(
-    api_key=OPENAI_API_KEY,
-    api_version="2024-02-01",
-    azure_endpoint=OPENAI_ENDPOINT
-)
+# "batch" explains every suggestion of an analysis in one completion, "per_call" uses one completion per transfer
+REASONING_MODE = os.getenv("REASONING_MODE", "batch")
+# Total time one request may spend waiting on the LLM before template reasons take over
+REASONING_DEADLINE_SECONDS = float(os.getenv("REASONING_DEADLINE_SECONDS", "4.0"))
+
+# Initialize Azure OpenAI client, or the local stub for offline runs (REASONING_CLIENT=stub, answering
+# after REASONING_STUB_LATENCY_SECONDS, e.g. for load tests). Otherwise, with UPSTREAM_MODE=record/replay,
+# completions are recorded to / replayed from the upstream bundle.
+if os.getenv("REASONING_CLIENT") == "stub":
+    client = StubChatClient(latency=float(os.getenv("REASONING_STUB_LATENCY_SECONDS", "0")))
+elif upstream.UPSTREAM_MODE == "replay":
+    # Looked up on every call, so upstream.replay_from() switches the LLM replays too
+    client = ReplayChatClient(lambda: upstream.bundle, LatencyModel(os.getenv("UPSTREAM_REPLAY_LATENCY", "0")))
+else:
+    client = AsyncAzureOpenAI(
+        api_key=OPENAI_API_KEY,
+        api_version="2024-02-01",
+        azure_endpoint=OPENAI_ENDPOINT
+    )
+if upstream.UPSTREAM_MODE == "record":
+    client = RecordingChatClient(client, upstream.bundle)
 
 class TransferSuggestion(BaseModel):
     player_out: Dict[str, Any]
     player_in: Dict[str, Any]
     score_gain: float
     reason: Optional[str] = None
+    reason_source: Optional[str] = None
 
 class DoubleTransferSuggestion(BaseModel):
     players_out: List[Dict[str, Any]]
     players_in: List[Dict[str, Any]]
     score_gain: float
     reason: Optional[str] = None
+    reason_source: Optional[str] = None
 
 class Squad(BaseModel):
     squad: List[Dict[str, Any]]
+    # Money in the bank, in millions; part of the key analyses are stored under
+    bank: Optional[float] = None
 
-async def generate_transfer_reasoning(player_out, player_in):
+class SquadBatch(BaseModel):
+    squads: List[Squad]
+    # Attach transfer reasons (LLM, cached or template) to each analysis, as /api/analyze-squad does
+    reasons: bool = False
+
+# Non-standard status (borrowed from nginx) for requests abandoned by the client.
+CLIENT_CLOSED_REQUEST = 499
+
+async def cancel_on_disconnect(request: Request, cancel_token: CancellationToken, poll_interval=0.25):
+    """
+    Polls the ASGI connection and triggers the cancellation token as soon as the
+    client goes away, so the GA and LLM calls stop instead of finishing for nobody.
+    """
+    while not cancel_token.cancelled:
+        if await request.is_disconnected():
+            logger.info("Client disconnected from %s, cancelling work.", request.url.path)
+            cancel_token.cancel()
+            return
+        await asyncio.sleep(poll_interval)
+
+async def generate_transfer_reasoning(player_out, player_in, deadline=None, count_lookup=True):
     """
     Generate a human-readable reason for a transfer suggestion using Azure OpenAI.
+    Reasons are served from the shared cache when the same swap with the same
+    stats has been explained recently. If the request's reasoning deadline
+    expires or the call fails, a local template reason is used instead.
+    Returns a (reason, source) tuple.
+    - count_lookup: False if the caller already counted the cache lookup for this pair.
     """
+    timeout = deadline.remaining() if deadline else None
+    if timeout == 0:
+        return template_transfer_reasoning(player_out, player_in), SOURCE_TEMPLATE
     try:
-        # Prepare player data for the prompt, focusing on key stats
-        player_out_data = {
-            'name': player_out.get('web_name', 'Unknown'),
-            'form': player_out.get('form', 0),
-            'ict_index': player_out.get('ict_index', 0),
-            'points_per_game': player_out.get('points_per_game', 0),
-            'fixtures': ", ".join([f"{f['opponent']}({f['location']})" for f in player_out.get('upcoming_fixtures', [])]) or "N/A"
-        }
-        
-        player_in_data = {
-            'name': player_in.get('web_name', 'Unknown'),
-            'form': player_in.get('form', 0),
-            'ict_index': player_in.get('ict_index', 0),
-            'points_per_game': player_in.get('points_per_game', 0),
-            'fixtures': ", ".join([f"{f['opponent']}({f['location']})" for f in player_in.get('upcoming_fixtures', [])]) or "N/A"
-        }
-        
-        # Format stats to one decimal place for the prompt
-        for p_data in [player_out_data, player_in_data]:
-            for key in ['form', 'ict_index', 'points_per_game']:
-                if isinstance(p_data[key], (int, float)):
-                    p_data[key] = f"{p_data[key]:.1f}"
-
-        # Create the new data-driven prompt
-        prompt = f"""You are an expert Fantasy Premier League (FPL) analyst. Your task is to provide a compelling, data-driven reason for a player transfer in 1-2 sentences.
-
-**Instructions:**
-- **Incorporate specific stats** to justify the recommendation (e.g., PPG, ICT Index, Form).
-- **Compare the upcoming fixtures** and mention if the incoming player has an easier schedule.
-- Keep the reasoning concise and to the point (max 2 sentences).
-
-**Player to transfer OUT:**
-- Name: {player_out_data['name']}
-- Form: {player_out_data['form']}
-- ICT Index: {player_out_data['ict_index']}
-- Points Per Game (PPG): {player_out_data['points_per_game']}
-- Upcoming Fixtures: {player_out_data['fixtures']}
-
-**Player to transfer IN:**
-- Name: {player_in_data['name']}
-- Form: {player_in_data['form']}
-- ICT Index: {player_in_data['ict_index']}
-- Points Per Game (PPG): {player_in_data['points_per_game']}
-- Upcoming Fixtures: {player_in_data['fixtures']}
-
-**Example Reasoning:** "Consider swapping Toney for Isak. Isak not only has a better PPG (5.9 vs 4.5) but also faces an easier run of fixtures (BOU (H), SHU (A)) compared to Toney's difficult schedule."
-
-**Your Reasoning:**
-"""
-
-        response = await client.chat.completions.create(
-            model="clio-assistant-gpt-4o-mini-4",
-            messages=[
-                {"role": "system", "content": "You are an expert FPL analyst who provides concise, data-driven transfer advice."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=100,
-            temperature=0.7
+        reason, from_cache = await asyncio.wait_for(
+            reasoning_cache.get_or_create(
+                reasoning_cache_key(player_out, player_in),
+                lambda: request_transfer_reasoning(client, player_out, player_in),
+                count_lookup=count_lookup
+            ),
+            timeout
+        )
+        return reason, SOURCE_CACHE if from_cache else SOURCE_LLM
+    except asyncio.TimeoutError:
+        logger.info(
+            "Transfer reasoning deadline expired for %s -> %s, using template.",
+            player_out.get('web_name'), player_in.get('web_name')
         )
-        
-        return response.choices[0].message.content.strip()
-    
     except Exception as e:
-        print(f"Error generating transfer reasoning: {e}")
-        return "Transfer suggested based on improved AI score and statistical analysis."
+        logger.warning("Error generating transfer reasoning: %s", e)
+    return template_transfer_reasoning(player_out, player_in), SOURCE_TEMPLATE
+
+async def _request_and_cache_batch(pairs, keys):
+    """Runs one batched reasoning call and stores every answered reason in the cache."""
+    answered, tokens = await request_batch_transfer_reasoning(client, pairs)
+    tokens_per_reason = tokens // len(answered) if answered else 0
+    for position, key in enumerate(keys):
+        reason = answered.get(batch_key(position))
+        if reason:
+            reasoning_cache.put(key, reason, tokens_per_reason)
+    return answered
+
+async def generate_batch_transfer_reasoning(pairs, deadline=None):
+    """
+    Generate reasons for several (player_out, player_in) pairs with a single Azure
+    OpenAI call. Cached pairs are not sent again, and any pair the batched answer
+    is missing (or every pair, if the call fails or misses the deadline) falls
+    back to generate_transfer_reasoning. Returns (reason, source) tuples in the
+    order of `pairs`.
+    """
+    keys = [reasoning_cache_key(player_out, player_in) for player_out, player_in in pairs]
+    results = []
+    for key in keys:
+        reason = reasoning_cache.get(key)
+        results.append((reason, SOURCE_CACHE) if reason is not None else None)
+    missing = [index for index, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    answered = {}
+    timeout = deadline.remaining() if deadline else None
+    if timeout != 0:
+        # Shielded so a late answer still fills the cache for the next request
+        batch_task = asyncio.ensure_future(
+            _request_and_cache_batch([pairs[index] for index in missing], [keys[index] for index in missing])
+        )
+        batch_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        try:
+            answered = await asyncio.wait_for(asyncio.shield(batch_task), timeout)
+        except asyncio.TimeoutError:
+            logger.info("Batched transfer reasoning deadline expired.")
+        except Exception as e:
+            logger.warning("Error generating batched transfer reasoning: %s", e)
+
+    for position, index in enumerate(missing):
+        reason = answered.get(batch_key(position))
+        if reason:
+            results[index] = (reason, SOURCE_LLM)
+
+    fallback_indexes = [index for index in missing if results[index] is None]
+    if fallback_indexes:
+        logger.info(
+            "Batched reasoning missed %d of %d transfers, falling back to per-call reasoning.",
+            len(fallback_indexes), len(missing)
+        )
+        fallback_results = await asyncio.gather(*[
+            # Their cache lookups were counted above already
+            generate_transfer_reasoning(*pairs[index], deadline=deadline, count_lookup=False)
+            for index in fallback_indexes
+        ])
+        for index, result in zip(fallback_indexes, fallback_results):
+            results[index] = result
+
+    return results
 
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
 
+@app.get("/api/reasoning/stats")
+def get_reasoning_stats():
+    """Reports hit rate and tokens saved by the transfer reasoning cache."""
+    return reasoning_cache.stats()
+
 @app.get("/api/bootstrap")
 def get_bootstrap_data():
     url = "https://fantasy.premierleague.com/api/bootstrap-static/"
-    response = requests.get(url)
+    response = upstream.get(url)
     return response.json()
 
-@app.get("/api/players")
-def get_players_data():
+# Results of the offline precompute.py runs (e.g. from cron), per snapshot version
+precomputed = PrecomputedResults(os.getenv("PRECOMPUTED_DIR"))
+
+def load_snapshot():
+    """
+    Fetches bootstrap-static and fixtures from the FPL API and builds a new
+    immutable Snapshot. The version is a digest of the raw payloads, so it only
+    changes when the upstream data does.
+    """
     bootstrap_url = "https://fantasy.premierleague.com/api/bootstrap-static/"
     fixtures_url = "https://fantasy.premierleague.com/api/fixtures/"
 
     try:
-        bootstrap_res = requests.get(bootstrap_url)
-        fixtures_res = requests.get(fixtures_url)
+        with metrics.span("upstream.fetch"):
+            bootstrap_res = upstream.get(bootstrap_url)
+            fixtures_res = upstream.get(fixtures_url)
         bootstrap_res.raise_for_status()
         fixtures_res.raise_for_status()
         
@@ -141,191 +351,279 @@ def get_players_data():
     except requests.exceptions.RequestException as e:
         raise HTTPException(status_code=500, detail=f"Error fetching FPL data: {e}")
 
-    players = bootstrap_data['elements']
-    teams = {team['id']: team for team in bootstrap_data['teams']}
-    positions = {pos['id']: pos['singular_name_short'] for pos in bootstrap_data['element_types']}
-    
-    # --- AI Score Calculation ---
-    
-    # 1. Convert relevant stats to float for calculation
-    for p in players:
-        p['form'] = float(p.get('form', 0))
-        p['ict_index'] = float(p.get('ict_index', 0))
-        p['points_per_game'] = float(p.get('points_per_game', 0))
-
-    # 2. Normalize metrics to a 0-1 scale
-    def normalize(players, key):
-        min_val = min(p[key] for p in players)
-        max_val = max(p[key] for p in players)
-        range_val = max_val - min_val
-        if range_val == 0:
-            return
-        for p in players:
-            p[f"{key}_normalized"] = (p[key] - min_val) / range_val
-
-    normalize(players, 'form')
-    normalize(players, 'ict_index')
-    normalize(players, 'points_per_game')
-
-    # 3. Calculate weighted AI score
-    weights = {
-        "form": 0.4,
-        "ict": 0.3,
-        "ppg": 0.3
+    version = snapshot_version(bootstrap_res.content, fixtures_res.content)
+    # Team strengths come from the bootstrap payload we already have
+    teams_payload = {'teams': [dict(team) for team in bootstrap_data['teams']]}
+
+    def load_fixture_map():
+        precomputed_map = precomputed.get(version, FIXTURE_MAP_FILE)
+        if precomputed_map is not None:
+            return precomputed_map
+        try:
+            with metrics.span("fixture_map"):
+                return create_fixture_difficulty_map(teams_payload)
+        except requests.exceptions.RequestException as e:
+            # Fixture difficulty barely moves between refreshes; prefer the previous map to failing
+            current = snapshot_store.peek()
+            previous_map = current.loaded_fixture_difficulty_map() if current is not None else None
+            if previous_map is None:
+                raise
+            logger.warning("PulseLive unavailable (%s); reusing the previous fixture difficulty map.", e)
+            return previous_map
+
+    with metrics.span("snapshot.build"):
+        return build_snapshot(
+            bootstrap_data,
+            fixtures_data,
+            version=version,
+            fixture_map_loader=load_fixture_map
+        )
+
+# With the background refresher on, the TTL is only a safety net for a stalled refresher
+SNAPSHOT_REFRESHER = os.getenv("SNAPSHOT_REFRESHER", "1") == "1"
+SNAPSHOT_TTL_SECONDS = int(os.getenv("SNAPSHOT_TTL_SECONDS", "7200" if SNAPSHOT_REFRESHER else "300"))
+# With several workers, set SNAPSHOT_SHARED_PATH so they share one mapped snapshot file
+# (and one upstream fetch per refresh) instead of each loading its own copy.
+SNAPSHOT_SHARED_PATH = os.getenv("SNAPSHOT_SHARED_PATH")
+if SNAPSHOT_SHARED_PATH:
+    snapshot_store = SharedSnapshotStore(SNAPSHOT_SHARED_PATH, load_snapshot, ttl_seconds=SNAPSHOT_TTL_SECONDS)
+else:
+    snapshot_store = SnapshotStore(load_snapshot, ttl_seconds=SNAPSHOT_TTL_SECONDS)
+
+snapshot_history = SnapshotHistory(max_versions=int(os.getenv("SNAPSHOT_HISTORY_VERSIONS", "24")))
+
+def get_snapshot():
+    """Returns the shared, read-only data snapshot, reloading it when it has expired."""
+    snapshot = snapshot_store.get()
+    snapshot_history.observe(snapshot)
+    return snapshot
+
+# Polls faster around deadlines and while a gameweek is being played, rarely otherwise
+snapshot_refresher = SnapshotRefresher(
+    snapshot_store,
+    on_refresh=snapshot_history.observe,
+    fast_seconds=int(os.getenv("REFRESH_FAST_SECONDS", "60")),
+    live_seconds=int(os.getenv("REFRESH_LIVE_SECONDS", "300")),
+    quiet_seconds=int(os.getenv("REFRESH_QUIET_SECONDS", "3600"))
+)
+
+@app.get("/api/snapshot")
+def get_snapshot_info():
+    """Reports the current data snapshot's version, age and memory footprint."""
+    snapshot = get_snapshot()
+    return {
+        "version": snapshot.version,
+        "age_seconds": round(snapshot.age_seconds, 1),
+        "current_gameweek": snapshot.current_gameweek,
+        "memory": snapshot.memory_report,
+        "stale": snapshot_store.is_stale(snapshot),
+        "last_refresh_error": snapshot_store.last_refresh_error,
+        "next_refresh_seconds": snapshot_refresher.next_interval() if SNAPSHOT_REFRESHER else None,
+        "upstream": upstream.stats(),
     }
 
-    for p in players:
-        form_score = p.get('form_normalized', 0) * weights['form']
-        ict_score = p.get('ict_index_normalized', 0) * weights['ict']
-        ppg_score = p.get('points_per_game_normalized', 0) * weights['ppg']
-        p['ai_score'] = round((form_score + ict_score + ppg_score) * 100, 2)
+player_payloads = PlayerPayloadCache()
 
-    # --- End AI Score Calculation ---
+@app.get("/api/players")
+def get_players_data(request: Request, fields: Optional[str] = None, format: str = "json"):
+    """
+    Returns all players of the current snapshot.
+    - fields: Optional comma-separated projection, e.g. `id,web_name,now_cost`.
+    - format: `json` (list of players), `columnar` (one array per field) or `msgpack`.
+    Bodies are cached per snapshot version and compressed per Accept-Encoding; the
+    strong ETag lets repeat loads revalidate with a 304 and no serialization.
+    """
+    try:
+        projection = parse_fields(fields)
+        check_format(format)
+    except PayloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Get current gameweek
-    current_gameweek = next((event['id'] for event in bootstrap_data['events'] if event['is_next']), None)
+    snapshot = get_snapshot()
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    etag = payload_etag(snapshot.version, projection, format, encoding)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache", "X-Snapshot-Version": snapshot.version}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
 
-    # Process fixtures
-    team_fixtures = {team_id: [] for team_id in teams.keys()}
-    if current_gameweek:
-        upcoming_fixtures = [f for f in fixtures_data if f.get('event') and f['event'] >= current_gameweek]
-        
-        for team_id in teams.keys():
-            # Get next 5 fixtures for the team
-            next_5_fixtures = [f for f in upcoming_fixtures if f['team_h'] == team_id or f['team_a'] == team_id][:5]
-            for fixture in next_5_fixtures:
-                is_home = fixture['team_h'] == team_id
-                opponent_id = fixture['team_a'] if is_home else fixture['team_h']
-                opponent_name = teams.get(opponent_id, {}).get('short_name', 'N/A')
-                difficulty = fixture['team_h_difficulty'] if is_home else fixture['team_a_difficulty']
-                
-                team_fixtures[team_id].append({
-                    "opponent": opponent_name,
-                    "difficulty": difficulty,
-                    "is_home": is_home
-                })
+    with metrics.span("players.payload"):
+        body, etag = player_payloads.get(snapshot, projection, format, encoding)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=MEDIA_TYPES[format], headers=headers)
+
+def build_ai_squad(cancel_token=None):
+    """
+    Runs the genetic algorithm over all available players and picks the best
+    starting 11 and bench from the resulting squad, unless precompute.py already
+    stored one for the current snapshot.
+    """
+    snapshot = get_snapshot()
+    cached = ai_squad_cache.get(snapshot.version)
+    metrics.cache_lookups.inc(cache="ai_squad", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached
+    result = precomputed.get(snapshot.version, AI_SQUAD_FILE)
+    if result is None:
+        raise_if_cancelled(cancel_token)
+        result = select_ai_squad(snapshot.players, snapshot.fixture_difficulty_map, cancel_token=cancel_token)
+    # The default squad only depends on the snapshot, so keep it until the data changes
+    ai_squad_cache.clear()
+    ai_squad_cache[snapshot.version] = result
+    return result
+
+# Snapshot version -> default AI squad (only the current version is kept)
+ai_squad_cache = {}
+
+async def prewarm():
+    """
+    Runs the cold path once before traffic arrives: loads the snapshot (from the
+    shared snapshot file when one is configured and fresh), the fixture
+    difficulty map, the player indexes and default /api/players payload, and
+    the default AI squad. The required stages are retried with backoff until
+    they succeed, e.g. while the FPL API is down at boot; progress is reported by /ready.
+    """
+    delay = PREWARM_RETRY_SECONDS
+    while True:
+        try:
+            snapshot = await run_in_threadpool(prewarm_required)
+            break
+        except Exception as e:
+            logger.error("Warm-up failed, retrying in %.0fs: %s", delay, e)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, PREWARM_MAX_RETRY_SECONDS)
+    await run_in_threadpool(prewarm_optional, snapshot)
+
+def prewarm_required():
+    """The warm-up stages /ready waits for: the snapshot and its indexes. Blocking."""
+    with warmup.stage("snapshot"):
+        snapshot = get_snapshot()
+    with warmup.stage("indexes"):
+        snapshot.index
+        player_payloads.get(snapshot, parse_fields(None), "json", choose_encoding("gzip"))
+    return snapshot
+
+def prewarm_optional(snapshot):
+    """The warm-up stages that may fail without blocking traffic. Blocking."""
+    stage = None
+    try:
+        stage = "fixture_difficulty_map"
+        with warmup.stage(stage):
+            snapshot.fixture_difficulty_map
+        stage = "ai_squad"
+        with warmup.stage(stage):
+            build_ai_squad()
+    except Exception as e:
+        logger.warning("Optional warm-up stage %s failed: %s", stage, e)
+        warmup.skip_remaining(f"Skipped after the {stage} stage failed.")
+    logger.info("Warm-up finished: %s", warmup.report())
+
+@app.get("/ready")
+def readiness():
+    """Readiness probe: 200 once the warm-up finished, 503 (with per-stage status) until then."""
+    report = warmup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+def _snapshot_age():
+    snapshot = snapshot_store.peek()
+    return snapshot.age_seconds if snapshot is not None else None
 
-    for player in players:
-        player['team_name'] = teams.get(player['team'], {}).get('name')
-        player['team_short_name'] = teams.get(player['team'], {}).get('short_name')
-        player['position_name'] = positions.get(player['element_type'])
-        player['upcoming_fixtures'] = team_fixtures.get(player['team'], [])
+metrics.CallbackMetric("fpl_snapshot_age_seconds", "Age of the current data snapshot.", _snapshot_age)
+metrics.CallbackMetric("fpl_ready", "1 once the startup warm-up finished.", lambda: int(warmup.report()["ready"]))
 
-    # Add team_code for badge URLs
-    team_code_map = {team['id']: team['code'] for team in bootstrap_data['teams']}
-    for player in players:
-        player['team_code'] = team_code_map.get(player['team'])
+@app.get("/metrics")
+def get_metrics():
+    """Request, stage, upstream, LLM, cache and genetic algorithm metrics in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-    return players
+def start_profiling(name: str, request: Request):
+    """Starts profiling the request if it asked for it with `?profile=1` (see profiling.py); else returns None."""
+    try:
+        return profiling.start_session(name, request.query_params, request.headers)
+    except profiling.ProfilingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 @app.get("/api/ai-squad")
-def get_ai_squad():
+async def get_ai_squad(request: Request):
+    """
+    The default AI squad for the current snapshot. With `?profile=1` and a valid
+    X-Admin-Token header, the response also carries a `profile` of the request.
+    """
+    profile = start_profiling("ai-squad", request)
+    cancel_token = CancellationToken()
+    watcher = asyncio.create_task(cancel_on_disconnect(request, cancel_token))
     try:
-        players = get_players_data()
-        
-        # Filter out players with status 'u' (unavailable) or low chance of playing
-        available_players = [
-            p for p in players 
-            if p.get('status') != 'u' and (p.get('chance_of_playing_next_round') is None or p.get('chance_of_playing_next_round') > 50)
-        ]
-
-        builder = GeneticSquadBuilder(
-            players=available_players,
-            population_size=200, # Increased for better exploration
-            generations=100,     # Increased for deeper evolution
-            mutation_rate=0.2
-        )
-        best_squad = builder.run()
-        
-        # Properly select starting 11 following FPL rules
-        # Group players by position
-        position_groups = {'GKP': [], 'DEF': [], 'MID': [], 'FWD': []}
-        for player in best_squad:
-            pos = player.get('position_name')
-            if pos in position_groups:
-                position_groups[pos].append(player)
-        
-        # Sort each position group by AI score
-        for pos in position_groups:
-            position_groups[pos].sort(key=lambda p: p.get('ai_score', 0), reverse=True)
-        
-        # Select starting 11: 1 GKP + best formation from remaining positions
-        starting_11 = []
-        bench = []
-        
-        # Always start the best goalkeeper
-        if position_groups['GKP']:
-            starting_11.append(position_groups['GKP'][0])
-            bench.extend(position_groups['GKP'][1:])
-        
-        # For outfield players, try different valid formations and pick the best
-        valid_formations = [
-            {'DEF': 4, 'MID': 4, 'FWD': 2},  # 4-4-2
-            {'DEF': 3, 'MID': 5, 'FWD': 2},  # 3-5-2
-            {'DEF': 3, 'MID': 4, 'FWD': 3},  # 3-4-3
-            {'DEF': 4, 'MID': 3, 'FWD': 3},  # 4-3-3
-            {'DEF': 4, 'MID': 5, 'FWD': 1},  # 4-5-1
-            {'DEF': 5, 'MID': 4, 'FWD': 1},  # 5-4-1
-            {'DEF': 5, 'MID': 3, 'FWD': 2},  # 5-3-2
-        ]
-        
-        best_formation_score = 0
-        best_formation_players = []
-        
-        for formation in valid_formations:
-            formation_players = []
-            formation_score = 0
-            
-            # Check if we have enough players for this formation
-            can_form = True
-            for pos, count in formation.items():
-                if len(position_groups[pos]) < count:
-                    can_form = False
-                    break
-            
-            if can_form:
-                # Select best players for this formation
-                for pos, count in formation.items():
-                    selected = position_groups[pos][:count]
-                    formation_players.extend(selected)
-                    formation_score += sum(p.get('ai_score', 0) for p in selected)
-                
-                if formation_score > best_formation_score:
-                    best_formation_score = formation_score
-                    best_formation_players = formation_players
-        
-        # Add the best formation players to starting 11
-        starting_11.extend(best_formation_players)
-        
-        # Add remaining players to bench
-        for pos in ['DEF', 'MID', 'FWD']:
-            selected_ids = {p['id'] for p in best_formation_players if p.get('position_name') == pos}
-            remaining = [p for p in position_groups[pos] if p['id'] not in selected_ids]
-            bench.extend(remaining)
-        
-        # Calculate squad statistics
-        total_cost = sum(p.get('now_cost', 0) / 10 for p in best_squad)  # Convert from tenths to millions
-        remaining_budget = 100.0 - total_cost
-        total_ai_score = sum(p.get('ai_score', 0) for p in starting_11)
-        
-        # Determine the formation name
-        formation_counts = {}
-        for player in best_formation_players:
-            pos = player.get('position_name')
-            formation_counts[pos] = formation_counts.get(pos, 0) + 1
-        
-        formation_name = f"{formation_counts.get('DEF', 0)}-{formation_counts.get('MID', 0)}-{formation_counts.get('FWD', 0)}"
-        
-        return {
-            "starting_11": starting_11,
-            "bench": bench,
-            "formation": formation_name,
-            "squad_value": round(total_cost, 1),
-            "remaining_budget": round(remaining_budget, 1),
-            "total_ai_score": round(total_ai_score, 1)
-        }
+        result = await profiling.run_in_threadpool(build_ai_squad, cancel_token)
+        if profile is not None:
+            profile.stop()
+            return {**result, "profile": await run_in_threadpool(profile.report)}
+        return result
+    except OperationCancelled:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        watcher.cancel()
+        if profile is not None:
+            profile.stop()
+
+@app.get("/api/players/changes")
+def get_player_changes(since: Optional[str] = None):
+    """
+    Players changed since snapshot version `since` (from `X-Snapshot-Version` or a
+    previous call's `version`): changed rows carry the id and changed fields only.
+    `full` is true when `since` is unknown or evicted and all players are returned.
+    """
+    get_snapshot()
+    return snapshot_history.changes_since(since)
+
+@app.get("/api/players/query")
+def query_players(
+    position: Optional[str] = None,
+    team: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    status: Optional[str] = None,
+    min_ai_score: Optional[float] = None,
+    sort: str = "total_points",
+    order: str = "desc",
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Filtered, sorted and paginated players, served from the snapshot's indexes.
+    - position: GKP, DEF, MID or FWD. team: club id, short name or name.
+    - min_price / max_price: In millions, e.g. 5.5. status: Comma-separated, e.g. `a,d`.
+    - sort / order: Sort key and `asc`/`desc`. cursor: `next_cursor` of the previous page.
+    - fields: Optional comma-separated projection, as for /api/players.
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'.")
+    try:
+        projection = parse_fields(fields)
+        snapshot = get_snapshot()
+        result = snapshot.index.query(
+            position=position.upper() if position else None,
+            team=team,
+            min_cost=round(min_price * 10) if min_price is not None else None,
+            max_cost=round(max_price * 10) if max_price is not None else None,
+            statuses=[s.strip() for s in status.split(",")] if status else None,
+            min_ai_score=min_ai_score,
+            sort=sort,
+            descending=order == "desc",
+            limit=limit,
+            cursor=cursor
+        )
+    except (PayloadError, QueryError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "version": snapshot.version,
+        "total": result["total"],
+        "players": [{field: to_plain(p[field]) for field in projection} for p in result["players"]],
+        "next_cursor": result["next_cursor"]
+    }
 
 @app.get("/api/random-squad")
 async def get_random_squad():
@@ -333,9 +631,10 @@ async def get_random_squad():
     Generates and returns a single, valid, randomized FPL squad.
     """
     try:
-        all_players = get_players_data()
+        all_players = get_snapshot().players
         builder = RandomSquadBuilder(players=all_players)
-        squad = builder.build()
+        with metrics.span("random_squad.build"):
+            squad = builder.build()
         if squad is None:
             raise HTTPException(status_code=500, detail="Failed to generate a random squad after several attempts.")
         
@@ -344,123 +643,474 @@ async def get_random_squad():
         remaining_budget = 100.0 - total_cost
         
         return {
-            "squad": squad,
+            "squad": [player_to_dict(p) for p in squad],
             "squad_value": round(total_cost, 1),
             "remaining_budget": round(remaining_budget, 1)
         }
 
     except Exception as e:
-        print(f"An unexpected error occurred in /api/random-squad: {e}")
+        logger.exception("An unexpected error occurred in /api/random-squad: %s", e)
         raise HTTPException(status_code=500, detail="An internal server error occurred while generating a random squad.")
 
+def create_analyzer(user_squad, cancel_token=None):
+    """Builds a SquadAnalyzer over the shared snapshot. Blocking, so run it in the threadpool."""
+    snapshot = get_snapshot()
+    return SquadAnalyzer(
+        user_squad=user_squad,
+        all_players=snapshot.players,
+        cancel_token=cancel_token,
+        fixture_difficulty_map=snapshot.fixture_difficulty_map
+    )
+
+# Full analysis responses by squad fingerprint and snapshot version, so re-evaluating a squad is instant
+analysis_store = AnalysisStore(
+    os.getenv("ANALYSIS_STORE_PATH", "analysis_results.sqlite3"),
+    max_versions=int(os.getenv("ANALYSIS_STORE_VERSIONS", "2")),
+    max_entries=int(os.getenv("ANALYSIS_STORE_MAX_ENTRIES", "20000"))
+)
+
+def find_stored_analysis(squad_data: Squad):
+    """
+    Returns the (fingerprint, snapshot version) key of the squad on the current
+    snapshot and the analysis stored under it, or None. Blocking.
+    """
+    key = (squad_fingerprint([p['id'] for p in squad_data.squad], squad_data.bank), get_snapshot().version)
+    return key, analysis_store.get(*key)
+
+async def serve_stored_analysis(analysis_key, stored):
+    """
+    Completes a stored analysis before it is served: suggestions stored without a
+    reason (see storable_analysis) get one now, from the reasoning cache or the LLM
+    within the usual deadline. Once every reason is final, the analysis is stored
+    again with them.
+    """
+    if has_final_reasons(stored):
+        return stored
+    await attach_reasons(stored, functools.partial(
+        generate_batch_transfer_reasoning, deadline=ReasoningDeadline(REASONING_DEADLINE_SECONDS)
+    ))
+    if has_final_reasons(stored):
+        await run_in_threadpool(analysis_store.put, *analysis_key, stored)
+    return stored
+
+def to_transfer_suggestion(transfer):
+    """Converts a transfer dict from the analyzer into a TransferSuggestion."""
+    return TransferSuggestion(
+        player_out=player_to_dict(transfer['player_out']),
+        player_in=player_to_dict(transfer['player_in']),
+        score_gain=transfer['score_gain'],
+        reason=transfer.get('reason'),
+        reason_source=transfer.get('reason_source')
+    )
+
+def to_double_transfer_suggestion(double_transfer):
+    """Converts the analyzer's double transfer dict, if any, into a DoubleTransferSuggestion."""
+    if not double_transfer:
+        return None
+    return DoubleTransferSuggestion(
+        players_out=[player_to_dict(p) for p in double_transfer['players_out']],
+        players_in=[player_to_dict(p) for p in double_transfer['players_in']],
+        score_gain=double_transfer['score_gain'],
+        reason=double_transfer.get('reason'),
+        reason_source=double_transfer.get('reason_source')
+    )
+
 @app.post("/api/analyze-squad")
-async def analyze_squad_endpoint(squad_data: Squad):
+async def analyze_squad_endpoint(squad_data: Squad, request: Request, response: Response):
     """
     Analyzes a user's squad and suggests transfers.
+    Blocking stages run in the threadpool so a client disconnect can be noticed
+    and the remaining work cancelled. Results are stored per squad and snapshot
+    version, so a repeat analysis is answered from the store (X-Analysis-Cache: hit);
+    template reasons are not stored but replaced when the stored result is served.
+    With `?profile=1` and a valid X-Admin-Token header, the analysis is always
+    recomputed and the response also carries a `profile` of the request.
     """
+    profile = start_profiling("analyze-squad", request)
+    cancel_token = CancellationToken()
+    watcher = asyncio.create_task(cancel_on_disconnect(request, cancel_token))
     try:
-        all_players = get_players_data()
+        if profile is None:
+            analysis_key, stored = await run_in_threadpool(find_stored_analysis, squad_data)
+            response.headers["X-Analysis-Cache"] = "hit" if stored is not None else "miss"
+            if stored is not None:
+                return await serve_stored_analysis(analysis_key, stored)
+
         user_squad_data = squad_data.squad # No longer need to convert from Pydantic models
-        
-        analyzer = SquadAnalyzer(user_squad=user_squad_data, all_players=all_players)
+        analyzer = await profiling.run_in_threadpool(
+            metrics.spanned("analyzer.init", create_analyzer), user_squad_data, cancel_token
+        )
+        cancel_token.raise_if_cancelled()
         
         captain, vice_captain = analyzer.suggest_captain()
-        transfers = await analyzer.suggest_transfers(reasoning_generator=generate_transfer_reasoning)
-        double_transfer = await analyzer.suggest_double_transfers(reasoning_generator=generate_transfer_reasoning)
-        chip_suggestion = analyzer.suggest_chip_usage()
-        
-        # Convert transfers to TransferSuggestion objects
-        transfer_suggestions = []
-        for transfer in transfers:
-            transfer_suggestion = TransferSuggestion(
-                player_out=transfer['player_out'],
-                player_in=transfer['player_in'],
-                score_gain=transfer['score_gain'],
-                reason=transfer.get('reason')
-            )
-            transfer_suggestions.append(transfer_suggestion)
-        
-        # Convert double transfer to DoubleTransferSuggestion object if it exists
-        double_transfer_suggestion = None
-        if double_transfer:
-            double_transfer_suggestion = DoubleTransferSuggestion(
-                players_out=double_transfer['players_out'],
-                players_in=double_transfer['players_in'],
-                score_gain=double_transfer['score_gain'],
-                reason=double_transfer.get('reason')
-            )
+        deadline = ReasoningDeadline(REASONING_DEADLINE_SECONDS)
+        if REASONING_MODE == "batch":
+            # The searches run in the threadpool, leaving the event loop free to
+            # notice a client disconnect and trigger the cancellation token meanwhile
+            with metrics.span("analyzer.transfers"):
+                transfers = await profiling.run_in_threadpool(analyzer.find_transfers)
+            with metrics.span("analyzer.double_transfers"):
+                double_transfer = await profiling.run_in_threadpool(analyzer.find_double_transfer)
+            with metrics.span("analyzer.reasoning"):
+                await analyzer.attach_batch_reasoning(
+                    transfers, double_transfer, functools.partial(generate_batch_transfer_reasoning, deadline=deadline)
+                )
+        else:
+            # Per-call reasons are requested inside the suggestion stages, so their spans include them
+            reasoning_generator = functools.partial(generate_transfer_reasoning, deadline=deadline)
+            with metrics.span("analyzer.transfers"):
+                transfers = await profiling.run_in_threadpool(analyzer.find_transfers)
+                await analyzer.attach_reasoning(transfers, reasoning_generator)
+            with metrics.span("analyzer.double_transfers"):
+                double_transfer = await profiling.run_in_threadpool(analyzer.find_double_transfer)
+                await analyzer.attach_double_transfer_reasoning(double_transfer, reasoning_generator)
+        chip_suggestion = await profiling.run_in_threadpool(
+            metrics.spanned("analyzer.chip_usage", analyzer.suggest_chip_usage)
+        )
         
-        return {
-            "captain_suggestion": captain,
-            "vice_captain_suggestion": vice_captain,
-            "suggested_transfers": transfer_suggestions,
-            "double_transfer_suggestion": double_transfer_suggestion,
-            "chip_suggestion": chip_suggestion
+        result = {
+            "captain_suggestion": player_to_dict(captain),
+            "vice_captain_suggestion": player_to_dict(vice_captain),
+            "suggested_transfers": [to_transfer_suggestion(t) for t in transfers],
+            "double_transfer_suggestion": to_double_transfer_suggestion(double_transfer),
+            "chip_suggestion": to_plain(chip_suggestion)
         }
+        if profile is not None:
+            profile.stop()
+            result["profile"] = await run_in_threadpool(profile.report)
+        else:
+            await run_in_threadpool(analysis_store.put, *analysis_key, storable_analysis(jsonable_encoder(result)))
+        return result
+    except OperationCancelled:
+        logger.info("Squad analysis cancelled because the client disconnected.")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         # Log the exception for debugging
-        print(f"Error in squad analysis: {e}")
+        logger.exception("Error in squad analysis: %s", e)
         raise HTTPException(status_code=500, detail="An unexpected error occurred during analysis.")
+    finally:
+        watcher.cancel()
+        if profile is not None:
+            profile.stop()
 
-@app.get("/api/player/{player_id}")
-def get_player_details(player_id: int):
-    # This is a placeholder for matching FPL player IDs to SportMonks player IDs.
-    # In a real application, you would need a more robust matching system.
-    fpl_player_data = next((p for p in get_players_data() if p['id'] == player_id), None)
-    if not fpl_player_data:
-        raise HTTPException(status_code=404, detail="Player not found in FPL data")
+def ndjson_event(event, **payload):
+    """Encodes a single analysis stream event as one line of NDJSON."""
+    return json.dumps({"event": event, **jsonable_encoder(payload)}) + "\n"
 
-    player_full_name = f"{fpl_player_data['first_name']} {fpl_player_data['second_name']}"
+def stored_analysis_events(stored):
+    """Replays a stored analysis response as the events of the analysis stream."""
+    yield ndjson_event(
+        "captain", captain_suggestion=stored["captain_suggestion"], vice_captain_suggestion=stored["vice_captain_suggestion"]
+    )
+    yield ndjson_event("transfers", suggested_transfers=stored["suggested_transfers"])
+    for index, transfer in enumerate(stored["suggested_transfers"]):
+        yield ndjson_event(
+            "transfer_reason", index=index, reason=transfer["reason"], reason_source=transfer["reason_source"]
+        )
+    yield ndjson_event("double_transfer", double_transfer_suggestion=stored["double_transfer_suggestion"])
+    yield ndjson_event("chip", chip_suggestion=stored["chip_suggestion"])
+    yield ndjson_event("done")
 
-    # Search for the player on SportMonks by name
-    search_url = f"{SPORTMONKS_API_URL}/players/search/{player_full_name}?api_token={SPORTMONKS_API_KEY}&include=teams.team"
-    search_response = requests.get(search_url)
-    
-    if search_response.status_code != 200:
-        raise HTTPException(status_code=search_response.status_code, detail="Error searching for player on SportMonks")
+@app.post("/api/analyze-squad/stream")
+async def analyze_squad_stream_endpoint(squad_data: Squad, request: Request):
+    """
+    Streaming variant of /api/analyze-squad. Emits NDJSON events as each section
+    becomes ready: `captain`, `transfers` (without reasons), one `transfer_reason`
+    per suggestion as its LLM call (or template fallback) resolves, `double_transfer`, `chip` and
+    finally `done`. Failures are reported as an `error` event. Stored analyses
+    (see /api/analyze-squad) are replayed as the same events at once.
+    """
+    async def events():
+        cancel_token = CancellationToken()
+        watcher = asyncio.create_task(cancel_on_disconnect(request, cancel_token))
+        chip_task = None
+        pending_reasons = {}
+        try:
+            analysis_key, stored = await run_in_threadpool(find_stored_analysis, squad_data)
+            if stored is not None:
+                stored = await serve_stored_analysis(analysis_key, stored)
+                for line in stored_analysis_events(stored):
+                    yield line
+                return
 
-    search_data = search_response.json()
-    if not search_data.get('data'):
-        raise HTTPException(status_code=404, detail=f"Player '{player_full_name}' not found on SportMonks")
+            analyzer = await run_in_threadpool(metrics.spanned("analyzer.init", create_analyzer), squad_data.squad, cancel_token)
+            cancel_token.raise_if_cancelled()
 
-    # --- Robust Name Matching Logic ---
-    def sanitize_name(name):
-        return unidecode(name.lower()) if name else ""
+            captain, vice_captain = analyzer.suggest_captain()
+            captain_suggestion, vice_captain_suggestion = player_to_dict(captain), player_to_dict(vice_captain)
+            yield ndjson_event(
+                "captain", captain_suggestion=captain_suggestion, vice_captain_suggestion=vice_captain_suggestion
+            )
 
-    fpl_names = {
-        sanitize_name(fpl_player_data.get('web_name')),
-        sanitize_name(fpl_player_data.get('first_name')),
-        sanitize_name(fpl_player_data.get('second_name')),
-        sanitize_name(player_full_name)
-    }
-    fpl_names.discard('')
-
-    matched_player = None
-    for sm_player in search_data.get('data', []):
-        sm_names = {
-            sanitize_name(sm_player.get('common_name')),
-            sanitize_name(sm_player.get('firstname')),
-            sanitize_name(sm_player.get('lastname')),
-            sanitize_name(sm_player.get('name')),
-            sanitize_name(sm_player.get('display_name'))
+            # The wildcard GA is the slowest stage, so start it now and let it run
+            # in the threadpool while the transfers and their reasons are streamed.
+            # It gets its own fork of the analyzer: the transfer searches run in
+            # the threadpool too and write to the squad overlays meanwhile.
+            chip_task = asyncio.ensure_future(
+                run_in_threadpool(metrics.spanned("analyzer.chip_usage", analyzer.fork().suggest_chip_usage))
+            )
+
+            with metrics.span("analyzer.transfers"):
+                transfers = await run_in_threadpool(analyzer.find_transfers)
+            yield ndjson_event("transfers", suggested_transfers=[to_transfer_suggestion(t) for t in transfers])
+
+            reasoning_generator = functools.partial(
+                generate_transfer_reasoning, deadline=ReasoningDeadline(REASONING_DEADLINE_SECONDS)
+            )
+            pending_reasons = {
+                asyncio.ensure_future(reasoning_generator(t['player_out'], t['player_in'])): index
+                for index, t in enumerate(transfers)
+            }
+            while pending_reasons:
+                cancel_token.raise_if_cancelled()
+                done, _ = await asyncio.wait(pending_reasons, timeout=0.1, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = pending_reasons.pop(task)
+                    reason, source = task.result()
+                    transfers[index]['reason'], transfers[index]['reason_source'] = reason, source
+                    yield ndjson_event("transfer_reason", index=index, reason=reason, reason_source=source)
+
+            with metrics.span("analyzer.double_transfers"):
+                double_transfer = await run_in_threadpool(analyzer.find_double_transfer)
+                await analyzer.attach_double_transfer_reasoning(double_transfer, reasoning_generator)
+            double_transfer_suggestion = to_double_transfer_suggestion(double_transfer)
+            yield ndjson_event("double_transfer", double_transfer_suggestion=double_transfer_suggestion)
+
+            chip_suggestion = to_plain(await chip_task)
+            yield ndjson_event("chip", chip_suggestion=chip_suggestion)
+            result = {
+                "captain_suggestion": captain_suggestion,
+                "vice_captain_suggestion": vice_captain_suggestion,
+                "suggested_transfers": [to_transfer_suggestion(t) for t in transfers],
+                "double_transfer_suggestion": double_transfer_suggestion,
+                "chip_suggestion": chip_suggestion
+            }
+            await run_in_threadpool(analysis_store.put, *analysis_key, storable_analysis(jsonable_encoder(result)))
+            yield ndjson_event("done")
+        except OperationCancelled:
+            logger.info("Streaming squad analysis cancelled because the client disconnected.")
+        except Exception as e:
+            logger.exception("Error in streaming squad analysis: %s", e)
+            yield ndjson_event("error", detail="An unexpected error occurred during analysis.")
+        finally:
+            # Also reached when the server aborts the stream on disconnect.
+            cancel_token.cancel()
+            watcher.cancel()
+            for task in pending_reasons:
+                task.cancel()
+            if chip_task is not None and not chip_task.done():
+                chip_task.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+# Most squads one bulk request may analyze; workers default to one per core
+BULK_ANALYSIS_MAX_SQUADS = int(os.getenv("BULK_ANALYSIS_MAX_SQUADS", "1000"))
+BULK_ANALYSIS_WORKERS = int(os.getenv("BULK_ANALYSIS_WORKERS", "0")) or None
+# LLM reason requests in flight at once for one bulk request
+BULK_REASONING_CONCURRENCY = int(os.getenv("BULK_REASONING_CONCURRENCY", "8"))
+
+# Snapshot version -> AnalysisContext shared by bulk analyses (only the current version is kept).
+# Concurrent requests needing a version's context wait for a single build of it.
+analysis_context_cache = {}
+analysis_context_flight = upstream.SingleFlight()
+
+def get_analysis_context(snapshot) -> AnalysisContext:
+    """All players' scores and the wildcard comparison squad for the snapshot, built once per version. Blocking."""
+    context = analysis_context_cache.get(snapshot.version)
+    if context is None:
+        context = analysis_context_flight.do(snapshot.version, lambda: _build_analysis_context(snapshot))
+    return context
+
+def _build_analysis_context(snapshot) -> AnalysisContext:
+    # A caller may have missed the cache just before another build finished
+    context = analysis_context_cache.get(snapshot.version)
+    if context is None:
+        with metrics.span("analysis_context.build"):
+            context = AnalysisContext.build(snapshot.players, snapshot.fixture_difficulty_map)
+        analysis_context_cache.clear()
+        analysis_context_cache[snapshot.version] = context
+    return context
+
+# (snapshot version, workers) -> BulkAnalyzer pool shared by the bulk requests on that version
+bulk_analyzers = {}
+bulk_analyzers_lock = threading.Lock()
+
+def get_bulk_analyzer(snapshot) -> BulkAnalyzer:
+    """
+    The worker pool analyzing squads against the snapshot. It is started once per
+    version, so the players and context are sent to the workers once rather than
+    per request. The previous version's pool finishes its squads, then its
+    workers exit. Blocking.
+    """
+    key = (snapshot.version, BULK_ANALYSIS_WORKERS)
+    bulk = bulk_analyzers.get(key)
+    if bulk is None:
+        context = get_analysis_context(snapshot)
+        with bulk_analyzers_lock:
+            bulk = bulk_analyzers.get(key)
+            if bulk is None:
+                for previous in bulk_analyzers.values():
+                    previous.close(cancel_pending=False)
+                bulk_analyzers.clear()
+                bulk = bulk_analyzers[key] = BulkAnalyzer(
+                    snapshot.players, snapshot.fixture_difficulty_map, context=context, workers=BULK_ANALYSIS_WORKERS
+                ).start()
+    return bulk
+
+def discard_bulk_analyzer(bulk: BulkAnalyzer):
+    """Drops a pool whose workers died, so the next bulk request starts a new one."""
+    with bulk_analyzers_lock:
+        for key, cached in list(bulk_analyzers.items()):
+            if cached is bulk:
+                del bulk_analyzers[key]
+    bulk.close()
+
+def close_bulk_analyzers():
+    with bulk_analyzers_lock:
+        for bulk in bulk_analyzers.values():
+            bulk.close()
+        bulk_analyzers.clear()
+
+def find_stored_analyses(squads: List[Squad]):
+    """find_stored_analysis for each squad; (None, None) for a squad that cannot be keyed. Blocking."""
+    found = []
+    for squad_data in squads:
+        try:
+            found.append(find_stored_analysis(squad_data))
+        except (KeyError, TypeError, ValueError):
+            found.append((None, None))
+    return found
+
+@app.post("/api/analyze-squads")
+async def analyze_squads_endpoint(batch: SquadBatch):
+    """
+    Analyzes many squads (e.g. a mini-league) in one request. Snapshot-wide work,
+    including the wildcard comparison squad, is shared by all of them and the
+    squads are analyzed in parallel worker processes. Emits NDJSON: one `result`
+    event (with `index` and `analysis`) or `error` event per squad, in input
+    order, then `done`. Stored analyses (see /api/analyze-squad) are reused.
+    """
+    if len(batch.squads) > BULK_ANALYSIS_MAX_SQUADS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_ANALYSIS_MAX_SQUADS} squads per request.")
+
+    async def events():
+        futures = []
+        pending = []
+        try:
+            snapshot = await run_in_threadpool(get_snapshot)
+            found = await run_in_threadpool(find_stored_analyses, batch.squads)
+            misses = [index for index, (_, stored) in enumerate(found) if stored is None]
+            results = {}
+            if misses:
+                bulk = await run_in_threadpool(get_bulk_analyzer, snapshot)
+                reasoning_slots = asyncio.Semaphore(BULK_REASONING_CONCURRENCY)
+
+                async def finish(index, future):
+                    # Reasons are requested as soon as this squad's analysis is done, not in output order
+                    try:
+                        analysis = await asyncio.wrap_future(future)
+                    except BrokenExecutor:
+                        discard_bulk_analyzer(bulk)
+                        raise
+                    if batch.reasons:
+                        async with reasoning_slots:
+                            await attach_reasons(analysis, functools.partial(
+                                generate_batch_transfer_reasoning, deadline=ReasoningDeadline(REASONING_DEADLINE_SECONDS)
+                            ))
+                    if found[index][0] is not None:
+                        await run_in_threadpool(analysis_store.put, *found[index][0], storable_analysis(analysis))
+                    return analysis
+
+                futures = [bulk.submit(batch.squads[index].squad) for index in misses]
+                pending = [asyncio.ensure_future(finish(index, future)) for index, future in zip(misses, futures)]
+                results = dict(zip(misses, pending))
+
+            errors = 0
+            for index, (analysis_key, stored) in enumerate(found):
+                if stored is not None:
+                    if batch.reasons:
+                        stored = await serve_stored_analysis(analysis_key, stored)
+                    yield ndjson_event("result", index=index, analysis=stored)
+                    continue
+                try:
+                    analysis = await results[index]
+                except Exception as e:
+                    errors += 1
+                    yield ndjson_event("error", index=index, detail=f"{type(e).__name__}: {e}")
+                    continue
+                yield ndjson_event("result", index=index, analysis=analysis)
+            yield ndjson_event("done", squads=len(found), stored=len(found) - len(misses), errors=errors)
+        except Exception as e:
+            logger.exception("Error in bulk squad analysis: %s", e)
+            yield ndjson_event("error", detail="An unexpected error occurred during analysis.")
+        finally:
+            # Also reached when the server aborts the stream on disconnect. The pool
+            # is shared, so only this request's squads that have not started are dropped.
+            for task in pending:
+                task.cancel()
+            for future in futures:
+                future.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+# Matched SportMonks ids, season lists, player stats and finished gameweeks survive restarts
+details_store = DetailsStore(os.getenv("DETAILS_CACHE_PATH", "player_details_cache.sqlite3"))
+sportmonks_client = SportMonksClient(SPORTMONKS_API_URL, SPORTMONKS_API_KEY, PREMIER_LEAGUE_ID, details_store)
+
+# Gameweeks whose data FPL has checked do not change any more
+CHECKED_GAMEWEEK_TTL_SECONDS = 30 * 24 * 3600
+UNCHECKED_GAMEWEEK_TTL_SECONDS = 600
+
+def get_gameweek_results(gameweek) -> Dict[str, Any]:
+    """
+    Fixtures and per-player live stats of a finished gameweek, slimmed down to
+    what the form view needs and cached in the details store.
+    """
+    gw_id = gameweek.get('id')
+    key = f"fpl:gameweek:{gw_id}:results"
+    results = details_store.get_response(key)
+    if results is not None:
+        return results
+
+    fixtures_response = upstream.get(f"https://fantasy.premierleague.com/api/fixtures/?event={gw_id}")
+    fixtures_data = fixtures_response.json()
+    live_response = upstream.get(f"https://fantasy.premierleague.com/api/event/{gw_id}/live/")
+    live_data = live_response.json()
+
+    results = {
+        "fixtures": {
+            str(fix['id']): {key: fix.get(key) for key in ('id', 'team_h', 'team_a', 'kickoff_time')}
+            for fix in fixtures_data
+        },
+        "players": {
+            str(elem['id']): {"stats": elem['stats'], "fixture": elem['explain'][0]['fixture']}
+            for elem in live_data.get('elements', [])
+            if elem.get('stats', {}).get('minutes', 0) > 0 and elem.get('explain')
         }
-        sm_names.discard('')
-        
-        if fpl_names.intersection(sm_names):
-            matched_player = sm_player
-            break
-            
-    if not matched_player:
-        raise HTTPException(status_code=404, detail=f"Could not find a unique player match for '{player_full_name}' on SportMonks")
+    }
+    ttl = CHECKED_GAMEWEEK_TTL_SECONDS if gameweek.get('data_checked') else UNCHECKED_GAMEWEEK_TTL_SECONDS
+    details_store.put_response(key, results, ttl)
+    return results
+
+@app.get("/api/player/{player_id}")
+def get_player_details(player_id: int):
+    snapshot = get_snapshot()
+    fpl_player_data = snapshot.index.by_id.get(player_id)
+    if not fpl_player_data:
+        raise HTTPException(status_code=404, detail="Player not found in FPL data")
 
-    sportmonks_player_id = matched_player['id']
+    # The FPL -> SportMonks id is matched by name once, then read from the details store
+    try:
+        with metrics.span("sportmonks.match"):
+            sportmonks_player_id = sportmonks_client.find_player_id(fpl_player_data)
+    except SportMonksError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
     # --- Fetch Last 5 Games (Form) from FPL API ---
     form_stats = []
     try:
-        fpl_bootstrap_data = requests.get("https://fantasy.premierleague.com/api/bootstrap-static/").json()
-        all_events = fpl_bootstrap_data.get('events', [])
-        teams_map = {team['id']: team['short_name'] for team in fpl_bootstrap_data.get('teams', [])}
+        all_events = snapshot.events
+        teams_map = {team['id']: team['short_name'] for team in snapshot.teams.values()}
 
         finished_gameweeks = sorted(
             [gw for gw in all_events if gw.get('finished', False)],
@@ -472,18 +1122,12 @@ def get_player_details(player_id: int):
         player_team_id = fpl_player_data.get('team')
 
         for gw in last_5_gameweeks:
-            gw_id = gw.get('id')
-            fixtures_response = requests.get(f"https://fantasy.premierleague.com/api/fixtures/?event={gw_id}")
-            fixtures_data = fixtures_response.json()
-            
-            live_response = requests.get(f"https://fantasy.premierleague.com/api/event/{gw_id}/live/")
-            live_data = live_response.json()
-            
-            player_live_stats = next((elem for elem in live_data.get('elements', []) if elem.get('id') == player_id), None)
-
-            if player_live_stats and player_live_stats['stats']['minutes'] > 0:
-                player_fixture_id = player_live_stats['explain'][0]['fixture']
-                player_fixture = next((fix for fix in fixtures_data if fix.get('id') == player_fixture_id), None)
+            with metrics.span("player.gameweek_results"):
+                results = get_gameweek_results(gw)
+            player_live_stats = results["players"].get(str(player_id))
+
+            if player_live_stats:
+                player_fixture = results["fixtures"].get(str(player_live_stats['fixture']))
                 
                 if player_fixture:
                     opponent_id = player_fixture['team_a'] if player_fixture['team_h'] == player_team_id else player_fixture['team_h']
@@ -519,45 +1163,17 @@ def get_player_details(player_id: int):
                     }
                     form_stats.append(game_stats)
     except requests.exceptions.RequestException as e:
-        print(f"Could not fetch FPL form data: {e}")
+        logger.warning("Could not fetch FPL form data: %s", e)
 
     # --- End Fetch Form ---
 
-    # Fetch all seasons for the Premier League to find the last two
-    seasons_url = f"{SPORTMONKS_API_URL}/leagues/{PREMIER_LEAGUE_ID}?api_token={SPORTMONKS_API_KEY}&include=seasons"
-    seasons_response = requests.get(seasons_url)
-    if seasons_response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Could not fetch seasons from SportMonks")
-    
-    league_data = seasons_response.json().get('data', {})
-    all_seasons = league_data.get('seasons', [])
-
-    if not all_seasons:
-        raise HTTPException(status_code=404, detail="No seasons found for Premier League")
-
-    all_seasons.sort(key=lambda s: s.get('name', ''), reverse=True)
-    last_two_season_ids = [s['id'] for s in all_seasons[:2]]
-    
-    if not last_two_season_ids:
-        player_data_url = f"{SPORTMONKS_API_URL}/players/{sportmonks_player_id}?api_token={SPORTMONKS_API_KEY}"
-        player_data_response = requests.get(player_data_url)
-        player_data = player_data_response.json()
-        player_data['data']['statistics'] = []
-        player_data['data']['form_stats'] = form_stats
-        return player_data
-
-    season_ids_str = ",".join(map(str, last_two_season_ids))
-
-    # Fetch detailed stats for the player from SportMonks, filtered by the last two seasons
-    includes = "statistics.details.type;statistics.season.league"
-    filters = f"playerStatisticSeasons:{season_ids_str}"
-    stats_url = f"{SPORTMONKS_API_URL}/players/{sportmonks_player_id}?api_token={SPORTMONKS_API_KEY}&include={includes}&filters={filters}"
-    stats_response = requests.get(stats_url)
-
-    if stats_response.status_code != 200:
-        raise HTTPException(status_code=stats_response.status_code, detail="Error fetching player stats from SportMonks")
-
-    player_data = stats_response.json()
+    # Fetch the player's stats for the last two Premier League seasons (both cached)
+    try:
+        with metrics.span("sportmonks.stats"):
+            last_two_seasons = sportmonks_client.recent_seasons(2)
+            player_data = sportmonks_client.player_stats(sportmonks_player_id, last_two_seasons)
+    except SportMonksError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
     if player_data.get('data'):
         player_data['data']['position_name'] = fpl_player_data.get('position_name')
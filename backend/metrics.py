@@ -0,0 +1,233 @@
+import time
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Iterable, Tuple
+
+# In-process metrics in the Prometheus text format, without a client library.
+# Recording is a dict update under a lock and nothing runs between requests;
+# callback gauges are only evaluated when /metrics is scraped. Each worker
+# process keeps its own values, so scrape workers individually (or run one).
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+class Counter(_Metric):
+    """A monotonically increasing count; by convention the name ends in `_total`."""
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets, plus their sum and count."""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS,
+                 registry: Registry = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, the last one for +Inf; then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def render(self):
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+class CallbackMetric(_Metric):
+    """
+    A gauge (or counter) read from `callback` at scrape time, for values other
+    components already track. The callback returns a number, or a dict of label
+    value tuples to numbers.
+    """
+    def __init__(self, name: str, help: str, callback: Callable, labelnames: Iterable[str] = (), type="gauge",
+                 registry: Registry = REGISTRY):
+        self.callback = callback
+        self.type = type
+        super().__init__(name, help, labelnames, registry)
+
+    def render(self):
+        try:
+            values = self.callback()
+        except Exception: # A failing callback must not break the whole scrape
+            return
+        if values is None:
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+# --- Application metrics ---
+
+http_requests = Counter("fpl_http_requests_total", "HTTP requests served.", ("route", "method", "status"))
+http_request_seconds = Histogram("fpl_http_request_duration_seconds", "HTTP request latency.", ("route",))
+stage_seconds = Histogram(
+    "fpl_stage_duration_seconds", "Time spent in each named stage, by the route it ran for.", ("stage", "route")
+)
+upstream_seconds = Histogram(
+    "fpl_upstream_request_duration_seconds", "Upstream HTTP call latency.", ("host", "outcome")
+)
+llm_seconds = Histogram(
+    "fpl_llm_request_duration_seconds", "Chat completion latency.", ("kind", "outcome"),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0)
+)
+llm_tokens = Counter("fpl_llm_tokens_total", "Tokens used by chat completions.", ("kind",))
+cache_lookups = Counter("fpl_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+ga_generations = Histogram(
+    "fpl_ga_generations", "Generations evolved per genetic algorithm run.",
+    buckets=(10, 25, 50, 100, 200, 500, 1000)
+)
+ga_evaluations = Histogram(
+    "fpl_ga_evaluations", "Squad fitness evaluations per genetic algorithm run.",
+    buckets=(1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+)
+
+# --- Spans ---
+
+class RequestTrace:
+    """The spans recorded while serving one request (see span)."""
+    __slots__ = ('scope', 'spans')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.spans = []
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the scope; use its template to keep label values bounded
+        route = self.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+    def server_timing(self) -> str:
+        """The spans as a Server-Timing header value, shown by browser devtools."""
+        return ", ".join(f"{name.replace('.', '-')};dur={duration * 1000:.1f}" for name, duration in self.spans)
+
+_current_trace = contextvars.ContextVar("fpl_request_trace", default=None)
+
+def start_trace(scope) -> Tuple[RequestTrace, contextvars.Token]:
+    trace = RequestTrace(scope)
+    return trace, _current_trace.set(trace)
+
+def end_trace(token: contextvars.Token):
+    _current_trace.reset(token)
+
+@contextmanager
+def span(stage: str):
+    """
+    Times a named stage (e.g. "analyzer.transfers") into fpl_stage_duration_seconds,
+    labelled with the route of the request it runs for ("background" outside
+    requests). Spans are also listed in the response's Server-Timing header.
+    Context variables follow run_in_threadpool, so spans in worker threads count.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        trace = _current_trace.get()
+        stage_seconds.observe(duration, stage=stage, route=trace.route if trace is not None else "background")
+        if trace is not None:
+            trace.spans.append((stage, duration))
+
+def spanned(stage: str, func: Callable) -> Callable:
+    """`func` wrapped in span(stage), e.g. to hand to run_in_threadpool."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(stage):
+            return func(*args, **kwargs)
+    return wrapper
+
+def status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,141 @@
+import json
+import heapq
+import base64
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional
+
+# Keys the query API can sort by
+SORT_KEYS = ('total_points', 'ai_score', 'now_cost', 'form', 'points_per_game', 'ict_index', 'minutes', 'web_name')
+MAX_PAGE_SIZE = 200
+
+class QueryError(ValueError):
+    """Raised for an invalid query parameter (unknown sort key, team, malformed cursor)."""
+
+def encode_cursor(sort_value, player_id) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, player_id]).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        sort_value, player_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (sort_value, int(player_id))
+    except (ValueError, TypeError):
+        raise QueryError("Malformed cursor.")
+
+class PlayerIndex:
+    """
+    Lookup structures over one snapshot's players, built once per snapshot:
+    - by_id: player id -> player.
+    - orderings: for every sort key, the players sorted by (sort value, id) with a
+      parallel list of those keys, for every combination of position, team and
+      status (each either one value or None for "any"). A query picks the
+      orderings of its position, team and statuses, bisects them for a range on
+      the sort key itself and for the cursor, and slices out (or, for several
+      statuses, merges) the page; no request sorts.
+    """
+    def __init__(self, players, teams):
+        self.by_id = {p['id']: p for p in players}
+
+        self._orderings = {}
+        for sort in SORT_KEYS:
+            for p in sorted(players, key=lambda p: (p[sort], p['id'])):
+                key = (p[sort], p['id'])
+                for position in (None, p['position_name']):
+                    for team_id in (None, p['team']):
+                        for status in (None, p['status']):
+                            ordering = self._orderings.get((position, team_id, status, sort))
+                            if ordering is None:
+                                ordering = self._orderings[(position, team_id, status, sort)] = ([], [])
+                            ordering[0].append(p)
+                            ordering[1].append(key)
+
+        # Clubs can be given by id, short name or full name
+        self._team_ids = {}
+        for team in teams.values():
+            for alias in (str(team['id']), team.get('short_name'), team.get('name')):
+                if alias:
+                    self._team_ids[alias.lower()] = team['id']
+
+    def team_id(self, team: str) -> int:
+        team_id = self._team_ids.get(team.strip().lower())
+        if team_id is None:
+            raise QueryError(f"Unknown team '{team}'.")
+        return team_id
+
+    def _ordering(self, sort: str, position: Optional[str] = None, team_id: Optional[int] = None, status: Optional[str] = None):
+        """The (players, keys) ordering by `sort` of the players matching the given values; empty if there are none."""
+        return self._orderings.get((position, team_id, status, sort), ([], []))
+
+    @staticmethod
+    def _key_range(keys, low=None, high=None):
+        """The [start, end) positions in `keys` whose sort value lies between `low` and `high` (both inclusive)."""
+        start = bisect_left(keys, (low,)) if low is not None else 0
+        end = bisect_right(keys, (high, float('inf'))) if high is not None else len(keys)
+        return start, max(start, end)
+
+    def price_range(self, position: Optional[str] = None, min_cost: Optional[int] = None, max_cost: Optional[int] = None):
+        """Players of `position` (all if None) with min_cost <= now_cost <= max_cost, cheapest first."""
+        ordered, keys = self._ordering('now_cost', position)
+        start, end = self._key_range(keys, min_cost, max_cost)
+        return ordered[start:end]
+
+    def query(self, position: Optional[str] = None, team: Optional[str] = None, min_cost: Optional[int] = None,
+              max_cost: Optional[int] = None, statuses: Optional[List[str]] = None, min_ai_score: Optional[float] = None,
+              sort: str = 'total_points', descending: bool = True, limit: int = 50,
+              cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Filters, sorts and pages players. Pages are keyed by the last item's
+        (sort value, id), so a cursor stays valid as other players change.
+        Returns {"total": matches, "players": [...], "next_cursor": str or None}.
+        """
+        if sort not in SORT_KEYS:
+            raise QueryError(f"Unknown sort key '{sort}'. Available: {', '.join(SORT_KEYS)}")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        team_id = self.team_id(team) if team is not None else None
+
+        # A range on the sort key itself is a slice of each ordering; the other
+        # range filters scan what is left of it, which stays in sort order
+        filters = []
+        if sort != 'now_cost':
+            if min_cost is not None:
+                filters.append(lambda p: p['now_cost'] >= min_cost)
+            if max_cost is not None:
+                filters.append(lambda p: p['now_cost'] <= max_cost)
+        if sort != 'ai_score' and min_ai_score is not None:
+            filters.append(lambda p: p['ai_score'] >= min_ai_score)
+
+        runs = []
+        for status in (dict.fromkeys(statuses) if statuses else (None,)):
+            ordered, keys = self._ordering(sort, position, team_id, status)
+            if sort == 'now_cost':
+                lo, hi = self._key_range(keys, min_cost, max_cost)
+            elif sort == 'ai_score':
+                lo, hi = self._key_range(keys, low=min_ai_score)
+            else:
+                lo, hi = 0, len(keys)
+            if filters:
+                ordered = [p for p in ordered[lo:hi] if all(f(p) for f in filters)]
+                keys = [(p[sort], p['id']) for p in ordered]
+                lo, hi = 0, len(ordered)
+            runs.append((ordered, keys, lo, hi))
+        after = decode_cursor(cursor) if cursor else None
+
+        # Take up to limit + 1 players past the cursor from each run, so a longer page means there are more
+        slices = []
+        try:
+            for ordered, keys, lo, hi in runs:
+                if descending:
+                    end = bisect_left(keys, after, lo, hi) if after else hi
+                    slices.append(ordered[max(lo, end - limit - 1):end][::-1])
+                else:
+                    start = bisect_right(keys, after, lo, hi) if after else lo
+                    slices.append(ordered[start:min(hi, start + limit + 1)])
+        except TypeError:
+            raise QueryError("Cursor does not match the sort key.")
+        if len(slices) == 1:
+            page = slices[0]
+        else:
+            page = list(heapq.merge(*slices, key=lambda p: (p[sort], p['id']), reverse=descending))
+
+        next_cursor = encode_cursor(page[limit - 1][sort], page[limit - 1]['id']) if len(page) > limit else None
+        return {"total": sum(hi - lo for _, _, lo, hi in runs), "players": page[:limit], "next_cursor": next_cursor}
@@ -0,0 +1,146 @@
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+try:
+    import brotli
+except ImportError: # Optional: without it we only offer gzip
+    brotli = None
+
+try:
+    import msgpack
+except ImportError: # Optional: format=msgpack is rejected without it
+    msgpack = None
+
+import metrics
+from player_table import PLAYER_FIELDS
+from snapshot import to_plain
+
+FORMAT_JSON = "json"
+FORMAT_COLUMNAR = "columnar"
+FORMAT_MSGPACK = "msgpack"
+FORMATS = (FORMAT_JSON, FORMAT_COLUMNAR, FORMAT_MSGPACK)
+
+MEDIA_TYPES = {
+    FORMAT_JSON: "application/json",
+    FORMAT_COLUMNAR: "application/json",
+    FORMAT_MSGPACK: "application/msgpack",
+}
+
+class PayloadError(ValueError):
+    """Raised for an unknown field or an unavailable format."""
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Parses a comma-separated `fields=` projection; all fields when empty."""
+    if not fields:
+        return PLAYER_FIELDS
+    requested = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in PLAYER_FIELDS]
+    if unknown:
+        raise PayloadError(f"Unknown player fields: {', '.join(unknown)}. Available: {', '.join(PLAYER_FIELDS)}")
+    return requested or PLAYER_FIELDS
+
+def check_format(format: str):
+    if format not in FORMATS:
+        raise PayloadError(f"Unknown format '{format}'. Available: {', '.join(FORMATS)}")
+    if format == FORMAT_MSGPACK and msgpack is None:
+        raise PayloadError("format=msgpack requires the 'msgpack' package on the server.")
+
+def choose_encoding(accept_encoding: Optional[str]) -> str:
+    """Picks the best content encoding we can serve for an Accept-Encoding header."""
+    offered = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return "identity"
+
+def payload_etag(version: str, fields: Tuple[str, ...], format: str, encoding: str) -> str:
+    """
+    A strong ETag derived only from the snapshot version and the request's
+    options, so a conditional request can be answered without serializing.
+    """
+    variant = hashlib.sha1(f"{','.join(fields)}|{format}".encode()).hexdigest()[:10]
+    return f'"{version}-{variant}-{encoding}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True when an If-None-Match header matches `etag` (strong comparison)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def encode_players(players, fields: Tuple[str, ...], format: str) -> bytes:
+    """
+    Serializes snapshot players with only `fields`:
+    - json: a list of player objects (the original shape).
+    - columnar: {"count": n, "fields": [...], "columns": {field: [values...]}}, which
+      avoids repeating every key for every player.
+    - msgpack: the columnar shape, MessagePack-encoded.
+    """
+    if format == FORMAT_JSON:
+        data = [{field: to_plain(p[field]) for field in fields} for p in players]
+    else:
+        data = {
+            "count": len(players),
+            "fields": list(fields),
+            "columns": {field: [to_plain(p[field]) for p in players] for field in fields},
+        }
+    if format == FORMAT_MSGPACK:
+        return msgpack.packb(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+class PlayerPayloadCache:
+    """
+    Serialized (and compressed) /api/players bodies per snapshot version and
+    variant (fields, format, encoding). Variants are built on first request and
+    then served as-is until the snapshot version changes, at which point the
+    whole cache is dropped.
+    """
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, snapshot, fields: Tuple[str, ...], format: str, encoding: str) -> Tuple[bytes, str]:
+        """Returns (body, etag) for a variant, building it if needed."""
+        key = (fields, format, encoding)
+        with self._lock:
+            if self._version != snapshot.version:
+                self._version = snapshot.version
+                self._entries.clear()
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                metrics.cache_lookups.inc(cache="player_payloads", result="hit")
+                return cached
+        metrics.cache_lookups.inc(cache="player_payloads", result="miss")
+
+        # Serialize outside the lock; the uncompressed body is shared between encodings
+        body_key = (fields, format, "identity")
+        with self._lock:
+            body = self._entries.get(body_key, (None,))[0]
+        if body is None:
+            body = encode_players(snapshot.players, fields, format)
+        entry = (compress(body, encoding), payload_etag(snapshot.version, fields, format, encoding))
+
+        with self._lock:
+            if self._version == snapshot.version:
+                if encoding != "identity":
+                    self._entries[body_key] = (body, payload_etag(snapshot.version, fields, format, "identity"))
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
@@ -0,0 +1,91 @@
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import List, Dict, Any
+
+# Only the player fields the analyzer, squad builders and frontend actually use.
+INT_FIELDS = ('id', 'team', 'team_code', 'element_type', 'now_cost', 'minutes', 'total_points', 'goals_scored', 'assists')
+# Nullable integers are stored with a -1 sentinel for None
+NULLABLE_INT_FIELDS = ('chance_of_playing_next_round',)
+FLOAT_FIELDS = ('form', 'ict_index', 'points_per_game', 'ai_score')
+STR_FIELDS = ('web_name', 'first_name', 'second_name', 'status', 'team_name', 'team_short_name', 'position_name')
+PLAYER_FIELDS = INT_FIELDS + NULLABLE_INT_FIELDS + FLOAT_FIELDS + STR_FIELDS + ('upcoming_fixtures',)
+
+_NULL = -1
+
+class PlayerRecord(Mapping):
+    """
+    A read-only, dict-like view of one row of a PlayerTable. It holds only a
+    reference to the table and its row index; `upcoming_fixtures` is resolved
+    through the player's team so fixtures are never copied per player.
+    """
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        column = self._table.columns.get(key)
+        if column is None:
+            if key == 'upcoming_fixtures':
+                return self._table.team_fixtures.get(self._table.columns['team'][self._index], ())
+            raise KeyError(key)
+        value = column[self._index]
+        if value == _NULL and key in NULLABLE_INT_FIELDS:
+            return None
+        return value
+
+    def __iter__(self):
+        return iter(PLAYER_FIELDS)
+
+    def __len__(self):
+        return len(PLAYER_FIELDS)
+
+    def __repr__(self):
+        return f"PlayerRecord(id={self['id']}, web_name={self['web_name']!r})"
+
+class PlayerTable:
+    """
+    Column-oriented storage for all players of a snapshot: numeric fields in
+    fixed-width arrays, strings in (interned) lists, and one shared fixture
+    list per team. `records` exposes each row as a PlayerRecord. Any indexable
+    column works, e.g. memoryviews over a mapped snapshot file (see snapshot_file).
+    """
+    def __init__(self, columns: Dict[str, Any], team_fixtures):
+        self.columns = columns
+        self.team_fixtures = team_fixtures
+        self.size = len(columns['id'])
+        self.records = tuple(PlayerRecord(self, i) for i in range(self.size))
+
+    @classmethod
+    def from_dicts(cls, players: List[Dict[str, Any]], team_fixtures) -> "PlayerTable":
+        """Builds a table from processed bootstrap-static player dicts."""
+        columns = {}
+        for key in INT_FIELDS:
+            columns[key] = array('i', (int(p.get(key) or 0) for p in players))
+        for key in NULLABLE_INT_FIELDS:
+            columns[key] = array('i', (_NULL if p.get(key) is None else int(p[key]) for p in players))
+        for key in FLOAT_FIELDS:
+            columns[key] = array('d', (float(p.get(key) or 0) for p in players))
+        for key in STR_FIELDS:
+            columns[key] = [sys.intern(p.get(key) or "") for p in players]
+        return cls(columns, team_fixtures)
+
+def deep_sizeof(value, seen=None) -> int:
+    """Approximate memory footprint of an object graph, counting shared objects once."""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, PlayerTable):
+        size += deep_sizeof(value.columns, seen) + deep_sizeof(value.team_fixtures, seen) + deep_sizeof(value.records, seen)
+    elif isinstance(value, PlayerRecord):
+        pass # Two slots pointing into the shared table
+    elif isinstance(value, Mapping):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in value)
+    return size
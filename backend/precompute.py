@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from itertools import repeat
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import upstream
+import metrics
+from logs import configure_logging
+from snapshot import build_snapshot, snapshot_version, player_to_dict, to_plain
+from fixture_service import create_fixture_difficulty_map
+from squad_builder import AnalysisContext, select_ai_squad
+from bulk_analysis import BulkAnalyzer, attach_reasons
+from analysis_store import AnalysisStore, squad_fingerprint
+from reasoning import template_transfer_reasoning, SOURCE_TEMPLATE
+
+# Offline precomputation, so heavy work can run in a cron pipeline instead of on
+# request threads. Loads a snapshot (live, replayed from a recorded bundle, or
+# mapped from a snapshot file written by SharedSnapshotStore) and writes results
+# under <out>/<snapshot version>/:
+#
+#   fixture_difficulty.json           the fixture difficulty map
+#   fixture_difficulty.columnar.json  the same, one array per field
+#   ai_squad.json                     the /api/ai-squad response (best of --runs GA runs)
+#   analyses.ndjson                   one analysis per input squad (with template reasons)
+#
+#   python precompute.py all --bundle bundles/2025-gw08 --runs 8
+#   python precompute.py analyze league.json --store analysis_results.sqlite3
+#
+# The API serves the fixture map and AI squad of its current snapshot from here
+# when PRECOMPUTED_DIR points at <out>; analyses reach it through its analysis
+# store (--store). They are stored without the template reasons, which the API
+# replaces with LLM (or cached) reasons when it serves them. Files are replaced
+# atomically, so the API never reads a partial one, and results for other
+# snapshot versions are never served.
+
+BOOTSTRAP_URL = "https://fantasy.premierleague.com/api/bootstrap-static/"
+FIXTURES_URL = "https://fantasy.premierleague.com/api/fixtures/"
+
+FIXTURE_MAP_FILE = "fixture_difficulty.json"
+FIXTURE_COLUMNS_FILE = "fixture_difficulty.columnar.json"
+AI_SQUAD_FILE = "ai_squad.json"
+ANALYSES_FILE = "analyses.ndjson"
+
+class PrecomputeInputError(Exception):
+    """The input to a precompute command is unusable (e.g. an unknown player id)."""
+
+class PrecomputedResults:
+    """
+    Read side of the precompute output, used by the API: results are looked up
+    by snapshot version. Without a directory every lookup returns None.
+    """
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+
+    def get(self, version: str, name: str) -> Optional[Any]:
+        """The parsed JSON file `name` stored for this snapshot version, or None."""
+        if not self.directory:
+            return None
+        try:
+            with open(os.path.join(self.directory, version, name)) as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            value = None
+        metrics.cache_lookups.inc(cache="precomputed", result="hit" if value is not None else "miss")
+        return value
+
+@contextmanager
+def atomic_file(path: str):
+    """Opens a temporary file next to `path` for writing and moves it into place when done."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".precompute-", suffix=".tmp")
+    try:
+        os.fchmod(fd, 0o644) # mkstemp creates files readable by the owner only
+        with os.fdopen(fd, "w") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_json(path: str, value: Any):
+    with atomic_file(path) as f:
+        json.dump(value, f)
+
+def prune_versions(out: str, keep: int):
+    """Removes all but the `keep` most recently written snapshot version directories."""
+    versions = [entry for entry in os.scandir(out) if entry.is_dir()]
+    versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[keep:]:
+        shutil.rmtree(entry.path)
+
+def load_snapshot(args):
+    """The snapshot to precompute for, from --snapshot, --bundle or the live APIs."""
+    if args.snapshot:
+        from snapshot_file import map_snapshot_file
+        return map_snapshot_file(args.snapshot)
+
+    if args.bundle:
+        upstream.replay_from(args.bundle)
+    bootstrap_res = upstream.get(BOOTSTRAP_URL)
+    fixtures_res = upstream.get(FIXTURES_URL)
+    bootstrap_res.raise_for_status()
+    fixtures_res.raise_for_status()
+    bootstrap_data = bootstrap_res.json()
+    teams_payload = {'teams': [dict(team) for team in bootstrap_data['teams']]}
+    return build_snapshot(
+        bootstrap_data,
+        fixtures_res.json(),
+        version=snapshot_version(bootstrap_res.content, fixtures_res.content),
+        fixture_map_loader=lambda: create_fixture_difficulty_map(teams_payload)
+    )
+
+# --- Fixture difficulty ---
+
+def fixture_columns(fixture_difficulty_map) -> Dict[str, list]:
+    """The fixture difficulty map as one array per field, one row per team fixture."""
+    fields = ("gameweek", "opponent", "difficulty", "location")
+    columns = {"team": [], **{field: [] for field in fields}}
+    for team, fixtures in fixture_difficulty_map.items():
+        for fixture in fixtures:
+            columns["team"].append(team)
+            for field in fields:
+                columns[field].append(fixture.get(field))
+    return columns
+
+def export_fixtures(snapshot, directory: str):
+    fixture_difficulty_map = to_plain(snapshot.fixture_difficulty_map)
+    write_json(os.path.join(directory, FIXTURE_MAP_FILE), fixture_difficulty_map)
+    write_json(os.path.join(directory, FIXTURE_COLUMNS_FILE), fixture_columns(fixture_difficulty_map))
+    print(f"Fixture difficulty for {len(fixture_difficulty_map)} teams written to {directory}")
+
+# --- AI squad ---
+
+def _select_ai_squad_with_seed(players, fixture_difficulty_map, seed):
+    return select_ai_squad(players, fixture_difficulty_map, seed=seed)
+
+def best_ai_squad(snapshot, runs: int, workers: int, seed: int) -> Dict[str, Any]:
+    """
+    Runs the /api/ai-squad genetic algorithm `runs` times with different seeds,
+    in parallel worker processes, and returns the squad with the best total AI score.
+    """
+    seeds = range(seed, seed + runs)
+    workers = min(workers, runs)
+    if workers == 1:
+        results = [_select_ai_squad_with_seed(snapshot.players, snapshot.fixture_difficulty_map, s) for s in seeds]
+    else:
+        # Plain data, so the snapshot's compact records need not be picklable
+        players = [to_plain(p) for p in snapshot.players]
+        fixture_difficulty_map = to_plain(snapshot.fixture_difficulty_map)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_select_ai_squad_with_seed, repeat(players), repeat(fixture_difficulty_map), seeds))
+    return max(results, key=lambda result: result["total_ai_score"])
+
+def export_ai_squad(snapshot, directory: str, args):
+    start = time.perf_counter()
+    result = best_ai_squad(snapshot, args.runs, args.workers, args.seed)
+    write_json(os.path.join(directory, AI_SQUAD_FILE), result)
+    print(f"AI squad (best of {args.runs} runs, total AI score {result['total_ai_score']}) "
+          f"written to {directory} in {time.perf_counter() - start:.1f}s")
+
+# --- Batch analysis ---
+
+def read_squads(path: str, snapshot) -> List[Tuple[List[Dict[str, Any]], Optional[float]]]:
+    """
+    Reads squads to analyze as (players, bank) pairs. The file holds a JSON list
+    (or an /api/analyze-squads body) whose items are lists of players or player
+    ids, or {"squad": [...], "bank": ...} objects.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("squads", [])
+    players_by_id = {p['id']: p for p in snapshot.players}
+    squads = []
+    for index, item in enumerate(data):
+        squad, bank = (item.get("squad", []), item.get("bank")) if isinstance(item, dict) else (item, None)
+        try:
+            squad = [player_to_dict(players_by_id[p]) if isinstance(p, int) else p for p in squad]
+        except KeyError as e:
+            raise PrecomputeInputError(f"Squad {index} in {path}: unknown player id {e}.")
+        squads.append((squad, bank))
+    return squads
+
+async def template_reasons(pairs):
+    """Batch reason generator for offline runs: the local template, no LLM calls."""
+    return [(template_transfer_reasoning(player_out, player_in), SOURCE_TEMPLATE) for player_out, player_in in pairs]
+
+def export_analyses(snapshot, directory: str, args):
+    squads = read_squads(args.squads, snapshot)
+    store = AnalysisStore(
+        args.store,
+        max_versions=int(os.getenv("ANALYSIS_STORE_VERSIONS", "2")),
+        max_entries=int(os.getenv("ANALYSIS_STORE_MAX_ENTRIES", "20000"))
+    ) if args.store else None
+    start = time.perf_counter()
+    context = AnalysisContext.build(snapshot.players, snapshot.fixture_difficulty_map)
+    errors = 0
+    with BulkAnalyzer(snapshot.players, snapshot.fixture_difficulty_map, context=context, workers=args.workers) as bulk, \
+            atomic_file(os.path.join(directory, ANALYSES_FILE)) as f:
+        for index, analysis, error in bulk.analyze(squad for squad, _ in squads):
+            if error is not None:
+                errors += 1
+                f.write(json.dumps({"index": index, "error": error}) + "\n")
+                continue
+            if store is not None:
+                # Before the template reasons: the API attaches its own when serving the analysis
+                squad, bank = squads[index]
+                store.put(squad_fingerprint([p['id'] for p in squad], bank), snapshot.version, analysis)
+            asyncio.run(attach_reasons(analysis, template_reasons))
+            f.write(json.dumps({"index": index, "analysis": analysis}) + "\n")
+    if store is not None:
+        store.evict()
+    print(f"{len(squads) - errors} of {len(squads)} squads analyzed and written to {directory} "
+          f"in {time.perf_counter() - start:.1f}s" + (f"; stored in {args.store}" if store is not None else ""))
+
+# --- CLI ---
+
+def parse_args(argv=None):
+    # Shared options, accepted after the command name
+    common = argparse.ArgumentParser(add_help=False)
+    source = common.add_mutually_exclusive_group()
+    source.add_argument("--bundle", help="Replay upstream data from this recorded bundle (offline).")
+    source.add_argument("--snapshot", help="Use a snapshot file written by SharedSnapshotStore.")
+    common.add_argument("--out", default=os.getenv("PRECOMPUTED_DIR", "precomputed"),
+                        help="Output directory, as PRECOMPUTED_DIR for the API (default: PRECOMPUTED_DIR or ./precomputed).")
+    common.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: one per core).")
+    common.add_argument("--keep", type=int, default=3, help="Snapshot versions to keep in --out (default: 3).")
+
+    parser = argparse.ArgumentParser(description="Precompute squads, analyses and fixture difficulty for the API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("fixtures", parents=[common], help="Export the fixture difficulty map.")
+    for name, summary in (("ai-squad", "Build the AI squad."), ("all", "Export fixture difficulty and build the AI squad.")):
+        command = commands.add_parser(name, parents=[common], help=summary)
+        command.add_argument("--runs", type=int, default=os.cpu_count() or 1,
+                             help="Independent GA runs; the best squad is kept (default: one per core).")
+        command.add_argument("--seed", type=int, default=42, help="Seed of the first run (default: 42).")
+    analyze = commands.add_parser("analyze", parents=[common], help="Analyze a batch of squads, e.g. a mini-league.")
+    analyze.add_argument("squads", help="JSON file of squads (lists of players or player ids).")
+    analyze.add_argument("--store", help="Also put the analyses, without reasons, into this analysis store "
+                                         "(the API's ANALYSIS_STORE_PATH).")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    configure_logging()
+    args = parse_args(argv)
+    snapshot = load_snapshot(args)
+    directory = os.path.join(args.out, snapshot.version)
+    try:
+        if args.command in ("fixtures", "all"):
+            export_fixtures(snapshot, directory)
+        if args.command in ("ai-squad", "all"):
+            export_ai_squad(snapshot, directory, args)
+        if args.command == "analyze":
+            export_analyses(snapshot, directory, args)
+    except PrecomputeInputError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    prune_versions(args.out, args.keep)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
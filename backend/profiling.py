@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+import hmac
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import contextvars
+from typing import Any, Callable, Dict, Optional
+from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+
+# Opt-in profiling of single requests (e.g. /api/analyze-squad?profile=1 with an
+# X-Admin-Token header). A profiled request runs under cProfile and tracemalloc,
+# and the response carries the top functions by cumulative time and the top
+# allocation sites; with PROFILE_DIR set, the full profile is also written there
+# as a .prof file (for pstats or snakeviz).
+#
+# From Python 3.12, cProfile is process-wide (sys.monitoring) and one profiler sees
+# every thread. Before that it only sees the thread that enabled it, so work handed
+# to the threadpool through run_in_threadpool below is profiled in its worker thread
+# and the profiles are merged. Either way, other requests served meanwhile on the
+# event loop are included, and only one profiled request runs per process at a time.
+
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "30"))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "15"))
+# Frames kept per allocation traceback; more frames attribute better but cost more
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+
+PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+
+class ProfilingError(Exception):
+    """A profiling request was refused; carries the HTTP status to report to the client."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def profiling_requested(query_params, headers) -> bool:
+    """True if the request opts in with `?profile=1` or an `X-Profile: 1` header."""
+    flag = query_params.get("profile") or headers.get("x-profile") or ""
+    return flag.lower() in ("1", "true", "yes")
+
+def check_admin_token(headers):
+    """Raises ProfilingError unless profiling is enabled and the X-Admin-Token header matches."""
+    if not PROFILING_ADMIN_TOKEN:
+        raise ProfilingError(403, "Profiling is disabled; set PROFILING_ADMIN_TOKEN to enable it.")
+    token = headers.get("x-admin-token") or ""
+    if not hmac.compare_digest(token.encode(), PROFILING_ADMIN_TOKEN.encode()):
+        raise ProfilingError(403, "A valid X-Admin-Token header is required to profile requests.")
+
+_session_lock = threading.Lock()
+_current_session = contextvars.ContextVar("fpl_profile_session", default=None)
+
+def _function_name(func) -> str:
+    filename, line, name = func
+    if filename == "~": # Built-ins have no file
+        return name
+    # Keep the package name for package modules, e.g. collections/__init__.py
+    parent, base = os.path.split(filename)
+    if base == "__init__.py":
+        base = f"{os.path.basename(parent)}/{base}"
+    return f"{base}:{line}({name})"
+
+class ProfileSession:
+    """
+    Profiles one request from start() to stop(). Work handed to the threadpool
+    while it is running should go through run_in_threadpool so it is included.
+    """
+    def __init__(self, name: str):
+        """
+        - name: Label for the stored profile file, e.g. "analyze-squad".
+        """
+        self.name = name
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        self._loop_profiler = None
+        self._token = None
+        self._started_tracemalloc = False
+        self._start = None
+        self.wall_seconds = None
+        self.allocations = None
+
+    def start(self):
+        if not _session_lock.acquire(blocking=False):
+            raise ProfilingError(409, "Another profiled request is running; try again when it has finished.")
+        try:
+            self._loop_profiler = cProfile.Profile()
+            self._loop_profiler.enable()
+        except ValueError: # Another profiler (e.g. a debugger or an outer cProfile run) is active
+            _session_lock.release()
+            raise ProfilingError(409, "Another profiler is active in this process.")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._token = _current_session.set(self)
+        self._start = time.perf_counter()
+
+    def stop(self):
+        """Stops profiling and takes the allocation snapshot. Later calls do nothing."""
+        if self.wall_seconds is not None:
+            return
+        self.wall_seconds = time.perf_counter() - self._start
+        self._loop_profiler.disable()
+        self._add(self._loop_profiler)
+        _current_session.reset(self._token)
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ]).statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]
+            self.allocations = {
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top": [
+                    {"location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                     "size_bytes": stat.size, "count": stat.count}
+                    for stat in top
+                ],
+            }
+        finally:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            _session_lock.release()
+
+    def _add(self, profiler):
+        with self._profiles_lock:
+            self._profiles.append(profiler)
+
+    def wrap(self, func: Callable) -> Callable:
+        """`func`, profiled in the thread that runs it (a no-op with a process-wide profiler)."""
+        if PROCESS_WIDE_PROFILER:
+            return func
+        def profiled(*args, **kwargs):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                self._add(profiler)
+        return profiled
+
+    def stats(self) -> pstats.Stats:
+        with self._profiles_lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profiler in profiles[1:]:
+            stats.add(profiler)
+        return stats
+
+    def report(self, top: int = PROFILE_TOP_FUNCTIONS) -> Dict[str, Any]:
+        """
+        The profile summary returned with the response; stores the full profile when
+        PROFILE_DIR is set. Blocking: endpoints run it in the threadpool.
+        """
+        stats = self.stats()
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        profile_file = None
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profile_file = os.path.join(PROFILE_DIR, f"{self.name}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.prof")
+            stats.dump_stats(profile_file)
+        return {
+            "wall_seconds": round(self.wall_seconds, 4),
+            "profiler": "cProfile (process-wide)" if PROCESS_WIDE_PROFILER else "cProfile (per thread, merged)",
+            "top_functions": [
+                {
+                    "function": _function_name(func),
+                    "calls": calls,
+                    "self_seconds": round(self_time, 4),
+                    "cumulative_seconds": round(cumulative, 4),
+                }
+                for func, (_, calls, self_time, cumulative, _) in rows
+            ],
+            "allocations": self.allocations,
+            "profile_file": profile_file,
+        }
+
+def start_session(name: str, query_params, headers) -> Optional[ProfileSession]:
+    """
+    Starts profiling the current request if it opted in, after checking the admin
+    token. Returns None when profiling was not requested; raises ProfilingError.
+    """
+    if not profiling_requested(query_params, headers):
+        return None
+    check_admin_token(headers)
+    session = ProfileSession(name)
+    session.start()
+    return session
+
+async def run_in_threadpool(func: Callable, *args, **kwargs):
+    """starlette's run_in_threadpool, profiling `func` when the current request is being profiled."""
+    session = _current_session.get()
+    if session is not None:
+        func = session.wrap(func)
+    return await _run_in_threadpool(func, *args, **kwargs)
@@ -0,0 +1,479 @@
+import os
+import re
+import json
+import logging
+import time
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the prompt or model settings change so cached reasons are not reused.
+PROMPT_VERSION = "1"
+REASONING_MODEL = "clio-assistant-gpt-4o-mini-4"
+SYSTEM_PROMPT = "You are an expert FPL analyst who provides concise, data-driven transfer advice."
+
+# Where a reason came from, reported alongside it in the API response
+SOURCE_LLM = "llm"
+SOURCE_CACHE = "cache"
+SOURCE_TEMPLATE = "template"
+
+def reasoning_inputs(player: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extracts the player data used in the reasoning prompt, formatting stats to
+    one decimal place.
+    """
+    data = {
+        'name': player.get('web_name', 'Unknown'),
+        'form': player.get('form', 0),
+        'ict_index': player.get('ict_index', 0),
+        'points_per_game': player.get('points_per_game', 0),
+        'fixtures': ", ".join([f"{f['opponent']}({f['location']})" for f in player.get('upcoming_fixtures', [])]) or "N/A"
+    }
+    for key in ['form', 'ict_index', 'points_per_game']:
+        if isinstance(data[key], (int, float)):
+            data[key] = f"{data[key]:.1f}"
+    return data
+
+def build_transfer_prompt(player_out_data: Dict[str, Any], player_in_data: Dict[str, Any]) -> str:
+    """Creates the data-driven prompt for a single transfer."""
+    return f"""You are an expert Fantasy Premier League (FPL) analyst. Your task is to provide a compelling, data-driven reason for a player transfer in 1-2 sentences.
+
+**Instructions:**
+- **Incorporate specific stats** to justify the recommendation (e.g., PPG, ICT Index, Form).
+- **Compare the upcoming fixtures** and mention if the incoming player has an easier schedule.
+- Keep the reasoning concise and to the point (max 2 sentences).
+
+**Player to transfer OUT:**
+- Name: {player_out_data['name']}
+- Form: {player_out_data['form']}
+- ICT Index: {player_out_data['ict_index']}
+- Points Per Game (PPG): {player_out_data['points_per_game']}
+- Upcoming Fixtures: {player_out_data['fixtures']}
+
+**Player to transfer IN:**
+- Name: {player_in_data['name']}
+- Form: {player_in_data['form']}
+- ICT Index: {player_in_data['ict_index']}
+- Points Per Game (PPG): {player_in_data['points_per_game']}
+- Upcoming Fixtures: {player_in_data['fixtures']}
+
+**Example Reasoning:** "Consider swapping Toney for Isak. Isak not only has a better PPG (5.9 vs 4.5) but also faces an easier run of fixtures (BOU (H), SHU (A)) compared to Toney's difficult schedule."
+
+**Your Reasoning:**
+"""
+
+class ReasoningDeadline:
+    """
+    Latency budget shared by every reasoning call made for one request. The clock
+    starts with the first call, so time spent on the analysis itself is not counted.
+    """
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._expires_at = None
+
+    def remaining(self) -> float:
+        now = time.monotonic()
+        if self._expires_at is None:
+            self._expires_at = now + self.seconds
+        return max(0.0, self._expires_at - now)
+
+def _average_difficulty(fixtures: List[Dict[str, Any]]) -> Optional[float]:
+    difficulties = [f['difficulty'] for f in fixtures if f.get('difficulty') is not None]
+    return sum(difficulties) / len(difficulties) if difficulties else None
+
+def template_transfer_reasoning(player_out: Dict[str, Any], player_in: Dict[str, Any]) -> str:
+    """
+    Deterministic, local reason generator used when the LLM is too slow or
+    unavailable. Picks the incoming player's clearest advantages in form, PPG and
+    ICT Index and compares the fixture difficulty of the upcoming games.
+    """
+    out_name = player_out.get('web_name', 'Unknown')
+    in_name = player_in.get('web_name', 'Unknown')
+
+    # (label, minimum meaningful difference) for each stat we compare
+    stat_labels = {'points_per_game': ("PPG", 0.3), 'form': ("form", 0.5), 'ict_index': ("ICT Index", 5.0)}
+    advantages = []
+    for key, (label, threshold) in stat_labels.items():
+        value_in = float(player_in.get(key, 0) or 0)
+        value_out = float(player_out.get(key, 0) or 0)
+        if value_in - value_out >= threshold:
+            strength = (value_in - value_out) / threshold
+            advantages.append((strength, f"a better {label} ({value_in:.1f} vs {value_out:.1f})"))
+    advantages.sort(key=lambda a: a[0], reverse=True)
+
+    sentences = [f"Consider swapping {out_name} for {in_name}."]
+    if advantages:
+        sentences.append(f"{in_name} has " + " and ".join(text for _, text in advantages[:2]) + ".")
+
+    fixtures_in = player_in.get('upcoming_fixtures') or []
+    difficulty_in = _average_difficulty(fixtures_in)
+    difficulty_out = _average_difficulty(player_out.get('upcoming_fixtures') or [])
+    if difficulty_in is not None and difficulty_out is not None and difficulty_out - difficulty_in >= 0.3:
+        next_games = ", ".join(f"{f['opponent']} ({f['location']})" for f in fixtures_in[:3] if f.get('location'))
+        sentences.append(
+            f"{in_name} also faces an easier run of fixtures (average difficulty {difficulty_in:.1f} vs {difficulty_out:.1f})"
+            + (f", starting with {next_games}." if next_games else ".")
+        )
+    elif not advantages:
+        sentences.append(f"{in_name} rates higher on the overall AI score, which blends form, ICT Index, minutes and fixture difficulty.")
+
+    return " ".join(sentences)
+
+def batch_key(index: int) -> str:
+    """Key used for the `index`-th transfer in a batched prompt and its JSON response."""
+    return f"t{index + 1}"
+
+def _format_player_block(label: str, data: Dict[str, Any]) -> str:
+    return (
+        f"{label}: {data['name']} | Form: {data['form']} | ICT Index: {data['ict_index']} | "
+        f"PPG: {data['points_per_game']} | Upcoming Fixtures: {data['fixtures']}"
+    )
+
+def build_batch_transfer_prompt(pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> str:
+    """
+    Creates one prompt covering every (player_out, player_in) pair. Each transfer is
+    labelled with its batch key and the model is asked for a JSON object mapping
+    those keys to reasons.
+    """
+    transfers = []
+    for index, (player_out, player_in) in enumerate(pairs):
+        transfers.append("\n".join([
+            f"**[{batch_key(index)}]**",
+            _format_player_block("- OUT", reasoning_inputs(player_out)),
+            _format_player_block("- IN", reasoning_inputs(player_in)),
+        ]))
+    keys = ", ".join(batch_key(i) for i in range(len(pairs)))
+
+    return f"""You are an expert Fantasy Premier League (FPL) analyst. For each transfer below, provide a compelling, data-driven reason in 1-2 sentences.
+
+**Instructions:**
+- **Incorporate specific stats** to justify the recommendation (e.g., PPG, ICT Index, Form).
+- **Compare the upcoming fixtures** and mention if the incoming player has an easier schedule.
+- Keep each reason concise and to the point (max 2 sentences).
+- Respond with a single JSON object whose keys are exactly: {keys}. Each value is the reason for that transfer.
+
+**Example Reasoning:** "Consider swapping Toney for Isak. Isak not only has a better PPG (5.9 vs 4.5) but also faces an easier run of fixtures (BOU (H), SHU (A)) compared to Toney's difficult schedule."
+
+**Transfers:**
+{chr(10).join(transfers)}
+"""
+
+def parse_batch_response(content: str, keys: List[str]) -> Dict[str, str]:
+    """
+    Parses the keyed JSON object returned for a batched prompt. Unknown keys and
+    empty or non-string values are dropped so the caller can fall back per pair.
+    """
+    content = (content or "").strip()
+    # Tolerate the model wrapping its answer in a markdown code fence
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", content, re.DOTALL)
+    if fenced:
+        content = fenced.group(1)
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        key: data[key].strip()
+        for key in keys
+        if isinstance(data.get(key), str) and data[key].strip()
+    }
+
+async def _create_completion(client, kind: str, **kwargs):
+    """Runs one chat completion, recording its latency, outcome and token use as `kind`."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await client.chat.completions.create(**kwargs)
+        outcome = "ok"
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        metrics.llm_seconds.observe(time.perf_counter() - start, kind=kind, outcome=outcome)
+    usage = getattr(response, 'usage', None)
+    metrics.llm_tokens.inc(getattr(usage, 'total_tokens', 0) or 0, kind=kind)
+    return response
+
+async def request_batch_transfer_reasoning(client, pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+    """
+    Asks for the reasons of all pairs in a single completion.
+    Returns a ({batch_key: reason}, total_tokens) tuple; keys missing from the
+    response are simply absent. Errors are left to the caller.
+    """
+    keys = [batch_key(i) for i in range(len(pairs))]
+    response = await _create_completion(
+        client, "batch",
+        model=REASONING_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": build_batch_transfer_prompt(pairs)}
+        ],
+        max_tokens=100 * len(pairs),
+        temperature=0.7,
+        response_format={"type": "json_object"}
+    )
+    usage = getattr(response, 'usage', None)
+    return parse_batch_response(response.choices[0].message.content, keys), getattr(usage, 'total_tokens', 0) or 0
+
+class StubChatClient:
+    """
+    Local stand-in for the (Async)AzureOpenAI client, exposing the same
+    `client.chat.completions.create(...)` shape. Used for offline runs and for
+    exercising the batched and per-call reasoning paths without network access.
+    - latency: Seconds to wait before answering each call.
+    - drop_keys: Batch keys to leave out of batched answers, simulating partial failures.
+    - fail: Raise on every call, simulating an outage.
+    """
+    def __init__(self, latency=0.0, drop_keys=(), fail=False):
+        self.latency = latency
+        self.drop_keys = set(drop_keys)
+        self.fail = fail
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, max_tokens=None, temperature=None, response_format=None, **kwargs):
+        self.calls.append({"model": model, "messages": messages, "response_format": response_format})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("Stub chat client configured to fail")
+
+        prompt = messages[-1]["content"]
+        if response_format and response_format.get("type") == "json_object":
+            answer = {}
+            for key, out_name, in_name in re.findall(r"\*\*\[(t\d+)\]\*\*\n- OUT: ([^|]+?) \|.*\n- IN: ([^|]+?) \|", prompt):
+                if key not in self.drop_keys:
+                    answer[key] = f"{in_name} offers better value than {out_name} on current stats."
+            content = json.dumps(answer)
+        else:
+            names = re.findall(r"- Name: (.+)", prompt)
+            out_name, in_name = (names + ["Unknown", "Unknown"])[:2]
+            content = f"{in_name} offers better value than {out_name} on current stats."
+
+        tokens = len(prompt.split()) + len(content.split())
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(total_tokens=tokens)
+        )
+
+def reasoning_cache_key(player_out: Dict[str, Any], player_in: Dict[str, Any]) -> str:
+    """
+    Content-addressed key for a transfer reason: the two player ids, a digest of
+    the exact stats and fixtures that go into the prompt (so a new data snapshot
+    invalidates the entry), and the prompt version.
+    """
+    payload = json.dumps([reasoning_inputs(player_out), reasoning_inputs(player_in)], sort_keys=True)
+    snapshot_digest = hashlib.sha1(payload.encode()).hexdigest()[:16]
+    return f"v{PROMPT_VERSION}:{player_out.get('id')}:{player_in.get('id')}:{snapshot_digest}"
+
+async def request_transfer_reasoning(client, player_out: Dict[str, Any], player_in: Dict[str, Any]):
+    """
+    Asks the chat completion client for a transfer reason.
+    Returns a (reason, total_tokens) tuple; errors are left to the caller.
+    """
+    prompt = build_transfer_prompt(reasoning_inputs(player_out), reasoning_inputs(player_in))
+    response = await _create_completion(
+        client, "per_call",
+        model=REASONING_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=100,
+        temperature=0.7
+    )
+    usage = getattr(response, 'usage', None)
+    return response.choices[0].message.content.strip(), getattr(usage, 'total_tokens', 0) or 0
+
+class ReasoningCache:
+    """
+    LRU + TTL cache of generated transfer reasons with single-flight
+    deduplication: concurrent lookups for the same key share one upstream call.
+    Entries can optionally be persisted to a JSON file so they survive restarts.
+    """
+    def __init__(self, max_entries=2048, ttl_seconds=6 * 3600, persist_path: Optional[str] = None, persist_interval=30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.persist_interval = persist_interval
+        self._entries = OrderedDict() # key -> (expires_at, reason, tokens)
+        self._inflight = {}
+        self._dirty = False
+        self._saving = False
+        self._save_lock = threading.Lock()
+        self._last_saved = time.time()
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.tokens_spent = 0
+        if persist_path:
+            self.load()
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, reason, tokens):
+        self._entries[key] = (time.time() + self.ttl_seconds, reason, tokens)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+        if self.persist_path and time.time() - self._last_saved >= self.persist_interval:
+            self._save_soon()
+
+    async def get_or_create(self, key, producer, count_lookup=True):
+        """
+        Returns a (reason, from_cache) tuple for `key`, joining an in-flight request
+        for the same key if there is one. Otherwise runs `producer()`, which must
+        return a (reason, tokens) tuple, as its own task: a caller that stops
+        waiting (e.g. on a deadline) does not cancel it, and the late result still
+        lands in the cache. Failures are propagated and never cached.
+        - count_lookup: False when the caller already counted a lookup for this key
+          (e.g. a batch falling back per pair), so the hit rate counts each pair once.
+        """
+        entry = self._get(key)
+        if entry is not None:
+            if count_lookup:
+                self.hits += 1
+                metrics.cache_lookups.inc(cache="reasoning", result="hit")
+            self.tokens_saved += entry[2]
+            return entry[1], True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            if count_lookup:
+                self.shared += 1
+                metrics.cache_lookups.inc(cache="reasoning", result="shared")
+            reason, tokens = await asyncio.shield(task)
+            self.tokens_saved += tokens
+            return reason, True
+
+        if count_lookup:
+            self.misses += 1
+            metrics.cache_lookups.inc(cache="reasoning", result="miss")
+        task = asyncio.ensure_future(self._produce(key, producer))
+        # Retrieve the exception even if every caller gave up waiting
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+        reason, _ = await asyncio.shield(task)
+        return reason, False
+
+    async def _produce(self, key, producer):
+        try:
+            reason, tokens = await producer()
+            self.put(key, reason, tokens)
+            return reason, tokens
+        finally:
+            del self._inflight[key]
+
+    def get(self, key) -> Optional[str]:
+        """Returns the cached reason for `key`, or None, counting the lookup."""
+        entry = self._get(key)
+        if entry is None:
+            self.misses += 1
+            metrics.cache_lookups.inc(cache="reasoning", result="miss")
+            return None
+        self.hits += 1
+        metrics.cache_lookups.inc(cache="reasoning", result="hit")
+        self.tokens_saved += entry[2]
+        return entry[1]
+
+    def put(self, key, reason, tokens=0):
+        """Stores a reason produced outside of get_or_create (e.g. by a batched call)."""
+        self.tokens_spent += tokens
+        self._put(key, reason, tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.shared + self.misses
+        return {
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "shared_in_flight": self.shared,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared) / lookups, 4) if lookups else 0.0,
+            "tokens_spent": self.tokens_spent,
+            "tokens_saved": self.tokens_saved,
+        }
+
+    def load(self):
+        """Loads unexpired entries from the persistence file, if it exists."""
+        try:
+            with open(self.persist_path) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load reasoning cache from %s: %s", self.persist_path, e)
+            return
+
+        now = time.time()
+        for key, (expires_at, reason, tokens) in stored.get("entries", {}).items():
+            if expires_at > now and key.startswith(f"v{PROMPT_VERSION}:"):
+                self._entries[key] = (expires_at, reason, tokens)
+        logger.info("Loaded %d cached transfer reasons from %s.", len(self._entries), self.persist_path)
+
+    def save(self):
+        """Atomically writes the cache to the persistence file. Blocking (e.g. at shutdown); see _save_soon."""
+        if not self.persist_path or not self._dirty:
+            return
+        self._dirty = False
+        if self._write(dict(self._entries)):
+            self._last_saved = time.time()
+        else:
+            self._dirty = True
+
+    def _save_soon(self):
+        """
+        Persists the cache without blocking the event loop: the entries are copied
+        here and written in the default executor. Outside an event loop the file
+        is written right away.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if self._saving:
+            return
+        self._saving = True
+        self._dirty = False
+        self._last_saved = time.time()
+        loop.run_in_executor(None, self._write, dict(self._entries)).add_done_callback(self._saved)
+
+    def _saved(self, future):
+        self._saving = False
+        if not future.result():
+            self._dirty = True
+
+    def _write(self, entries) -> bool:
+        """Writes `entries` to a temporary file and moves it into place. Returns False on failure."""
+        tmp_path = f"{self.persist_path}.tmp"
+        with self._save_lock:
+            try:
+                directory = os.path.dirname(self.persist_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump({"prompt_version": PROMPT_VERSION, "entries": entries}, f)
+                os.replace(tmp_path, self.persist_path)
+                return True
+            except OSError as e:
+                logger.warning("Could not persist reasoning cache to %s: %s", self.persist_path, e)
+                return False
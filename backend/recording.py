@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Callable
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Bump when the bundle layout changes; bundles of another version are refused
+BUNDLE_FORMAT_VERSION = 1
+# Query parameters that carry credentials: never written to a bundle nor part of a key
+SECRET_PARAMS = {"api_token", "api_key", "key", "token"}
+KEPT_HEADERS = ("Content-Type", "Retry-After")
+
+class UpstreamNotRecorded(requests.exceptions.ConnectionError):
+    """Raised in replay mode for a request the bundle has no recording of."""
+
+def normalize_url(url: str) -> str:
+    """The URL without credentials and with sorted query parameters."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+class FixtureBundle:
+    """
+    A directory of recorded upstream responses: `manifest.json` describes every
+    entry (request, status, headers, original latency) and the bodies live in
+    `responses/`. Bundles are self-contained, so each recording session can be
+    kept as its own version (e.g. `bundles/2025-gw08`) and replayed anywhere.
+    """
+    def __init__(self, path: str, label: str = None):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self._lock = threading.Lock()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+            if self.manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+                raise ValueError(
+                    f"Bundle {path} has format version {self.manifest.get('format_version')}, "
+                    f"expected {BUNDLE_FORMAT_VERSION}."
+                )
+        else:
+            self.manifest = {
+                "format_version": BUNDLE_FORMAT_VERSION,
+                "label": label or os.path.basename(os.path.normpath(path)),
+                "created_at": time.time(),
+                "entries": {}
+            }
+
+    @staticmethod
+    def key(kind: str, request_repr: str) -> str:
+        return hashlib.sha1(f"{kind}\n{request_repr}".encode("utf-8")).hexdigest()[:20]
+
+    def get(self, key: str):
+        """Returns (entry, body bytes) for a recorded key, or None."""
+        entry = self.manifest["entries"].get(key)
+        if entry is None:
+            return None
+        with open(os.path.join(self.path, entry["body"]), "rb") as f:
+            return entry, f.read()
+
+    def put(self, key: str, entry: dict, body: bytes, save=True):
+        """Stores a response; with save=False the manifest is only written by the next save()."""
+        body_path = os.path.join("responses", f"{key}.bin")
+        os.makedirs(os.path.join(self.path, "responses"), exist_ok=True)
+        with open(os.path.join(self.path, body_path), "wb") as f:
+            f.write(body)
+        with self._lock:
+            self.manifest["entries"][key] = dict(entry, body=body_path, recorded_at=time.time())
+        if save:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+
+class LatencyModel:
+    """
+    Delay injected before each replayed response:
+    - "0" or "": none; "120": a fixed 120 ms; "50-400": uniform between 50 and 400 ms;
+    - "recorded": the latency observed when the response was recorded.
+    """
+    def __init__(self, spec: str = ""):
+        self.spec = (spec or "0").strip()
+
+    def seconds(self, entry: dict) -> float:
+        if self.spec == "recorded":
+            return entry.get("elapsed_ms", 0) / 1000
+        if "-" in self.spec:
+            low, high = (float(v) for v in self.spec.split("-", 1))
+            return random.uniform(low, high) / 1000
+        return float(self.spec) / 1000
+
+# --- HTTP transports ---
+
+class LiveTransport:
+    """Plain HTTP via requests."""
+    def get(self, url: str, timeout: float) -> requests.Response:
+        return requests.get(url, timeout=timeout)
+
+class RecordingTransport:
+    """Performs live requests and stores every response in a bundle."""
+    def __init__(self, bundle: FixtureBundle, inner=None):
+        self.bundle = bundle
+        self.inner = inner or LiveTransport()
+
+    def get(self, url: str, timeout: float) -> requests.Response:
+        start = time.perf_counter()
+        response = self.inner.get(url, timeout=timeout)
+        normalized = normalize_url(url)
+        self.bundle.put(FixtureBundle.key("GET", normalized), {
+            "kind": "http",
+            "request": f"GET {normalized}",
+            "status": response.status_code,
+            "headers": {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers},
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+        }, response.content)
+        return response
+
+class ReplayTransport:
+    """Serves responses from a bundle, never touching the network."""
+    def __init__(self, bundle: FixtureBundle, latency: LatencyModel = None):
+        self.bundle = bundle
+        self.latency = latency or LatencyModel()
+
+    def get(self, url: str, timeout: float) -> requests.Response:
+        normalized = normalize_url(url)
+        recorded = self.bundle.get(FixtureBundle.key("GET", normalized))
+        if recorded is None:
+            raise UpstreamNotRecorded(f"No recording of GET {normalized} in bundle {self.bundle.path}")
+        entry, body = recorded
+        delay = self.latency.seconds(entry)
+        if delay:
+            time.sleep(delay)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response._content = body
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        response.url = url
+        response.encoding = "utf-8"
+        response.reason = "Replayed"
+        return response
+
+# --- Chat completion clients (same `client.chat.completions.create` shape as AsyncAzureOpenAI) ---
+
+def chat_request_key(kwargs) -> str:
+    request = {k: kwargs.get(k) for k in ("model", "messages", "response_format", "temperature", "max_tokens")}
+    return FixtureBundle.key("chat", json.dumps(request, sort_keys=True))
+
+def _chat_response(content: str, total_tokens: int):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(total_tokens=total_tokens)
+    )
+
+class RecordingChatClient:
+    """Wraps a chat client and stores each completion's text and token usage in a bundle."""
+    def __init__(self, inner, bundle: FixtureBundle):
+        self.inner = inner
+        self.bundle = bundle
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        start = time.perf_counter()
+        response = await self.inner.chat.completions.create(**kwargs)
+        content = response.choices[0].message.content
+        usage = getattr(response, "usage", None)
+        self.bundle.put(chat_request_key(kwargs), {
+            "kind": "chat",
+            "request": f"chat {kwargs.get('model')}",
+            "status": 200,
+            "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+        }, (content or "").encode("utf-8"))
+        return response
+
+class ReplayChatClient:
+    """
+    Answers chat completions from a bundle; unrecorded prompts raise UpstreamNotRecorded.
+    - get_bundle: Returns the bundle to answer from; called for every completion, so
+      it can follow the process switching bundles (see upstream.replay_from).
+    """
+    def __init__(self, get_bundle: Callable[[], FixtureBundle], latency: LatencyModel = None):
+        self.get_bundle = get_bundle
+        self.latency = latency or LatencyModel()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        bundle = self.get_bundle()
+        recorded = bundle.get(chat_request_key(kwargs))
+        if recorded is None:
+            raise UpstreamNotRecorded(f"No recorded completion for this prompt in bundle {bundle.path}")
+        entry, body = recorded
+        delay = self.latency.seconds(entry)
+        if delay:
+            await asyncio.sleep(delay)
+        return _chat_response(body.decode("utf-8"), entry.get("total_tokens", 0))
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Prices, injuries and team news move most in the run-up to and just after a deadline
+DEADLINE_WINDOW = timedelta(minutes=90)
+
+def _parse_deadline(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+
+def next_refresh_interval(events, now: datetime, fast_seconds=60, live_seconds=300, quiet_seconds=3600) -> float:
+    """
+    How long to wait before the next refresh, from the bootstrap-static events:
+    - fast_seconds within DEADLINE_WINDOW of any deadline,
+    - live_seconds while the current gameweek is being played and settled
+      (deadline passed, not yet finished and data-checked),
+    - otherwise quiet_seconds, but never sleeping past the next deadline window.
+    """
+    deadlines = [(_parse_deadline(event.get('deadline_time')), event) for event in events]
+    deadlines = [(deadline, event) for deadline, event in deadlines if deadline is not None]
+
+    if any(abs(now - deadline) <= DEADLINE_WINDOW for deadline, _ in deadlines):
+        return fast_seconds
+
+    if any(
+        event.get('is_current') and deadline < now and not (event.get('finished') and event.get('data_checked'))
+        for deadline, event in deadlines
+    ):
+        return live_seconds
+
+    upcoming = [deadline for deadline, _ in deadlines if deadline > now]
+    if upcoming:
+        until_window = (min(upcoming) - DEADLINE_WINDOW - now).total_seconds()
+        return max(fast_seconds, min(quiet_seconds, until_window))
+    return quiet_seconds
+
+class SnapshotRefresher:
+    """
+    Background task that refreshes the snapshot store on the schedule from
+    next_refresh_interval instead of waiting for a request to find it expired.
+    Each refresh accepts data younger than half the interval, so with a shared
+    snapshot file only one worker per cycle actually fetches.
+    """
+    def __init__(self, store, on_refresh=None, fast_seconds=60, live_seconds=300, quiet_seconds=3600):
+        """
+        - store: A SnapshotStore or SharedSnapshotStore.
+        - on_refresh: Optional blocking callable run with each refreshed Snapshot.
+        """
+        self.store = store
+        self.on_refresh = on_refresh
+        self.fast_seconds = fast_seconds
+        self.live_seconds = live_seconds
+        self.quiet_seconds = quiet_seconds
+
+    def next_interval(self) -> float:
+        snapshot = self.store.peek()
+        if snapshot is None:
+            return self.fast_seconds
+        return next_refresh_interval(
+            snapshot.events, datetime.now(timezone.utc),
+            fast_seconds=self.fast_seconds, live_seconds=self.live_seconds, quiet_seconds=self.quiet_seconds
+        )
+
+    async def run(self):
+        while True:
+            interval = self.next_interval()
+            await asyncio.sleep(interval)
+            try:
+                snapshot = await run_in_threadpool(self.store.refresh, interval / 2)
+                if self.on_refresh is not None:
+                    await run_in_threadpool(self.on_refresh, snapshot)
+            except Exception as e:
+                logger.warning("Background snapshot refresh failed: %s", e)
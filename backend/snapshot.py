@@ -0,0 +1,286 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import ChainMap
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional
+from player_table import PlayerTable, deep_sizeof
+from player_index import PlayerIndex
+
+logger = logging.getLogger(__name__)
+
+def _freeze(value):
+    """Recursively converts dicts and lists into read-only mappings and tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def with_overlay(player, **fields):
+    """
+    Returns a lightweight per-request view of a snapshot player. Reads fall
+    through to the shared, read-only record; writes (e.g. `ai_score` or
+    `upcoming_fixtures` computed for one analysis) land in the overlay only.
+    """
+    return ChainMap(dict(fields), player)
+
+def to_plain(value):
+    """
+    Recursively converts read-only mappings, overlays and tuples back into plain
+    dicts and lists. Only used at the API boundary, where responses are serialized.
+    """
+    if isinstance(value, Mapping):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    return value
+
+def player_to_dict(player) -> Dict[str, Any]:
+    """Flattens a snapshot player or overlay into a plain dict at the API boundary."""
+    return to_plain(player) if player is not None else None
+
+class Snapshot:
+    """
+    An immutable, shareable view of one fetch of the FPL data: processed players
+    (with their base AI score) as compact PlayerRecords, teams, per-team fixtures
+    and the fixture difficulty map. Safe to use from concurrent requests without
+    copying; request-specific derived fields belong in overlays (see with_overlay).
+    """
+    def __init__(self, version: str, player_table: PlayerTable, teams, events, team_fixtures, current_gameweek,
+                 fixture_map_loader=None, memory_report=None, created_at=None, fixture_difficulty_map=None):
+        self.version = version
+        self.created_at = created_at if created_at is not None else time.time()
+        self.player_table = player_table
+        self.players = player_table.records
+        self.memory_report = memory_report or {}
+        self.teams = teams
+        self.events = events
+        self.team_fixtures = team_fixtures
+        self.current_gameweek = current_gameweek
+        self._fixture_map_loader = fixture_map_loader
+        self._fixture_difficulty_map = _freeze(fixture_difficulty_map) if fixture_difficulty_map is not None else None
+        self._fixture_map_lock = threading.Lock()
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.created_at
+
+    @property
+    def fixture_difficulty_map(self):
+        """
+        The PulseLive-based fixture difficulty map, built on first use (only the
+        analysis and squad builders need it) and then shared read-only.
+        """
+        if self._fixture_difficulty_map is None:
+            with self._fixture_map_lock:
+                if self._fixture_difficulty_map is None:
+                    loaded = self._fixture_map_loader() if self._fixture_map_loader else {}
+                    self._fixture_difficulty_map = _freeze(loaded)
+        return self._fixture_difficulty_map
+
+    def loaded_fixture_difficulty_map(self):
+        """The fixture difficulty map if it has been built already, else None. Never triggers a load."""
+        return self._fixture_difficulty_map
+
+    @property
+    def index(self) -> PlayerIndex:
+        """Id and price indexes over the players, built on first use."""
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = PlayerIndex(self.players, self.teams)
+        return self._index
+
+def snapshot_version(bootstrap_content: bytes, fixtures_content: bytes) -> str:
+    """
+    Version of the snapshot built from these raw payloads: a digest, so it only
+    changes when the upstream data does, and every process computes the same one.
+    """
+    return hashlib.sha1(bootstrap_content + fixtures_content).hexdigest()[:12]
+
+def build_snapshot(bootstrap_data: Dict[str, Any], fixtures_data: List[Dict[str, Any]], version: str,
+                   fixture_map_loader=None) -> Snapshot:
+    """
+    Processes the raw bootstrap-static and fixtures payloads into a Snapshot:
+    stat normalization, the base AI score, team/position names and each team's
+    next 5 fixtures. The input payloads are consumed (mutated) in the process.
+    - fixture_map_loader: Callable returning the fixture difficulty map, invoked lazily.
+    """
+    players = bootstrap_data['elements']
+    teams = {team['id']: team for team in bootstrap_data['teams']}
+    positions = {pos['id']: pos['singular_name_short'] for pos in bootstrap_data['element_types']}
+
+    # --- AI Score Calculation ---
+
+    # 1. Convert relevant stats to float for calculation
+    for p in players:
+        p['form'] = float(p.get('form', 0))
+        p['ict_index'] = float(p.get('ict_index', 0))
+        p['points_per_game'] = float(p.get('points_per_game', 0))
+
+    # 2. Normalize metrics to a 0-1 scale
+    def normalize(players, key):
+        min_val = min(p[key] for p in players)
+        max_val = max(p[key] for p in players)
+        range_val = max_val - min_val
+        if range_val == 0:
+            return
+        for p in players:
+            p[f"{key}_normalized"] = (p[key] - min_val) / range_val
+
+    normalize(players, 'form')
+    normalize(players, 'ict_index')
+    normalize(players, 'points_per_game')
+
+    # 3. Calculate weighted AI score
+    weights = {
+        "form": 0.4,
+        "ict": 0.3,
+        "ppg": 0.3
+    }
+
+    for p in players:
+        form_score = p.get('form_normalized', 0) * weights['form']
+        ict_score = p.get('ict_index_normalized', 0) * weights['ict']
+        ppg_score = p.get('points_per_game_normalized', 0) * weights['ppg']
+        p['ai_score'] = round((form_score + ict_score + ppg_score) * 100, 2)
+
+    # --- End AI Score Calculation ---
+
+    # Get current gameweek
+    current_gameweek = next((event['id'] for event in bootstrap_data['events'] if event['is_next']), None)
+
+    # Process fixtures
+    team_fixtures = {team_id: [] for team_id in teams.keys()}
+    if current_gameweek:
+        upcoming_fixtures = [f for f in fixtures_data if f.get('event') and f['event'] >= current_gameweek]
+
+        for team_id in teams.keys():
+            # Get next 5 fixtures for the team
+            next_5_fixtures = [f for f in upcoming_fixtures if f['team_h'] == team_id or f['team_a'] == team_id][:5]
+            for fixture in next_5_fixtures:
+                is_home = fixture['team_h'] == team_id
+                opponent_id = fixture['team_a'] if is_home else fixture['team_h']
+                opponent_name = teams.get(opponent_id, {}).get('short_name', 'N/A')
+                difficulty = fixture['team_h_difficulty'] if is_home else fixture['team_a_difficulty']
+
+                team_fixtures[team_id].append({
+                    "opponent": opponent_name,
+                    "difficulty": difficulty,
+                    "is_home": is_home
+                })
+
+    # Freeze once so every player of a team shares the same read-only fixture list
+    frozen_team_fixtures = {team_id: _freeze(fixtures) for team_id, fixtures in team_fixtures.items()}
+
+    for player in players:
+        player['team_name'] = teams.get(player['team'], {}).get('name')
+        player['team_short_name'] = teams.get(player['team'], {}).get('short_name')
+        player['position_name'] = positions.get(player['element_type'])
+        player['upcoming_fixtures'] = frozen_team_fixtures.get(player['team'], ())
+        # Add team_code for badge URLs
+        player['team_code'] = teams.get(player['team'], {}).get('code')
+
+    # Keep only the fields we use, column by column, instead of ~90-key dicts per player
+    player_table = PlayerTable.from_dicts(players, MappingProxyType(frozen_team_fixtures))
+    memory_report = {
+        "players": player_table.size,
+        "player_dicts_bytes": deep_sizeof(players),
+        "player_table_bytes": deep_sizeof(player_table),
+    }
+    logger.info(
+        "Snapshot %s: %d players, %.0f KiB as dicts -> %.0f KiB as compact records.", version, player_table.size,
+        memory_report['player_dicts_bytes'] / 1024, memory_report['player_table_bytes'] / 1024
+    )
+
+    return Snapshot(
+        version=version,
+        player_table=player_table,
+        memory_report=memory_report,
+        teams=_freeze(teams),
+        events=_freeze(bootstrap_data['events']),
+        team_fixtures=MappingProxyType(frozen_team_fixtures),
+        current_gameweek=current_gameweek,
+        fixture_map_loader=fixture_map_loader
+    )
+
+class BackgroundRevalidation:
+    """
+    Stale-while-revalidate for snapshot stores: once the snapshot is older than
+    `ttl_seconds` it keeps being served while one background thread refreshes
+    it. If upstream is down, the last good snapshot simply stays in use.
+    Stores provide `ttl_seconds` and `refresh(max_age)`.
+    """
+    # After a failed revalidation, wait this long before trying again
+    REVALIDATION_RETRY_SECONDS = 10
+
+    def _init_revalidation(self):
+        self._revalidating = False
+        self._retry_at = 0.0
+        self._revalidation_lock = threading.Lock()
+        self.last_refresh_error = None
+
+    def is_stale(self, snapshot: Snapshot) -> bool:
+        return snapshot.age_seconds >= self.ttl_seconds
+
+    def _revalidate_in_background(self):
+        with self._revalidation_lock:
+            if self._revalidating or time.monotonic() < self._retry_at:
+                return
+            self._revalidating = True
+        threading.Thread(target=self._revalidate, name="snapshot-revalidate", daemon=True).start()
+
+    def _revalidate(self):
+        try:
+            self.refresh(self.ttl_seconds)
+            self.last_refresh_error = None
+        except Exception as e:
+            self.last_refresh_error = str(e)
+            self._retry_at = time.monotonic() + self.REVALIDATION_RETRY_SECONDS
+            logger.warning("Snapshot revalidation failed, still serving the stale snapshot: %s", e)
+        finally:
+            with self._revalidation_lock:
+                self._revalidating = False
+
+class SnapshotStore(BackgroundRevalidation):
+    """
+    Holds the current Snapshot and rebuilds it with `loader` once it is older than
+    `ttl_seconds`, in the background while the stale one keeps being served. Only
+    the very first load blocks; its lock makes concurrent requests wait for a
+    single fetch instead of each fetching their own.
+    """
+    def __init__(self, loader, ttl_seconds=300):
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._init_revalidation()
+
+    def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            if self.is_stale(snapshot):
+                self._revalidate_in_background()
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self.loader()
+            return self._snapshot
+
+    def refresh(self, max_age=0) -> Snapshot:
+        """Reloads now, unless the current snapshot is younger than `max_age` seconds."""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.age_seconds >= max_age:
+                snapshot = self.loader()
+                self._snapshot = snapshot
+            return snapshot
+
+    def peek(self) -> Optional[Snapshot]:
+        """Returns the current snapshot without triggering a reload."""
+        return self._snapshot
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import logging
+import mmap
+import struct
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError: # Windows: fall back to in-process locking only
+    fcntl = None
+
+from player_table import PlayerTable, deep_sizeof
+from snapshot import Snapshot, BackgroundRevalidation, _freeze, to_plain
+
+logger = logging.getLogger(__name__)
+
+# File layout:
+#   MAGIC | header length (uint32, little-endian) | JSON header | padding | column data
+# Numeric columns are stored as raw fixed-width arrays. String columns are
+# dictionary-encoded: a per-row uint32 index into a table of unique strings,
+# which is itself an offsets array over one UTF-8 blob.
+MAGIC = b"FPLSNAP1"
+_PREFIX = struct.Struct("<8sI")
+_ALIGN = 8
+
+class StringColumn:
+    """
+    A read-only string column backed by a memory-mapped offsets table. Values
+    are decoded on first access and memoized per unique string, so repeated
+    values (positions, team names, statuses) are decoded once per worker.
+    """
+    __slots__ = ('_indices', '_offsets', '_blob', '_decoded')
+
+    def __init__(self, indices, offsets, blob):
+        self._indices = indices
+        self._offsets = offsets
+        self._blob = blob
+        self._decoded = {}
+
+    def __getitem__(self, i):
+        index = self._indices[i]
+        value = self._decoded.get(index)
+        if value is None:
+            start, end = self._offsets[index], self._offsets[index + 1]
+            value = sys.intern(str(self._blob[start:end], 'utf-8'))
+            self._decoded[index] = value
+        return value
+
+    def __len__(self):
+        return len(self._indices)
+
+def _encode_strings(values):
+    """Dictionary-encodes a list of strings into (row indices, offsets, blob)."""
+    unique = {}
+    indices = array('I')
+    for value in values:
+        indices.append(unique.setdefault(value, len(unique)))
+    offsets = array('I', [0])
+    blob = bytearray()
+    for value in unique:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    return indices, offsets, bytes(blob)
+
+def write_snapshot_file(path: str, snapshot: Snapshot):
+    """
+    Serializes a Snapshot (player columns, teams, events, fixtures and the
+    fixture difficulty map) into a file that other processes can map with
+    map_snapshot_file. The file is written next to `path` and swapped in with
+    os.replace, so readers only ever see a complete file.
+    """
+    chunks = []
+    position = 0
+
+    def add_chunk(data: bytes) -> dict:
+        nonlocal position
+        padding = -position % _ALIGN
+        if padding:
+            chunks.append(b"\0" * padding)
+            position += padding
+        chunks.append(data)
+        entry = {"offset": position, "length": len(data)}
+        position += len(data)
+        return entry
+
+    columns = {}
+    for name, column in snapshot.player_table.columns.items():
+        if isinstance(column, array):
+            columns[name] = {"kind": "array", "typecode": column.typecode, **add_chunk(column.tobytes())}
+        else:
+            indices, offsets, blob = _encode_strings(list(column))
+            columns[name] = {
+                "kind": "str",
+                "indices": add_chunk(indices.tobytes()),
+                "offsets": add_chunk(offsets.tobytes()),
+                "blob": add_chunk(blob),
+            }
+
+    header = {
+        "version": snapshot.version,
+        "created_at": snapshot.created_at,
+        "byteorder": sys.byteorder,
+        "size": snapshot.player_table.size,
+        "current_gameweek": snapshot.current_gameweek,
+        "teams": list(to_plain(snapshot.teams).values()),
+        "events": to_plain(snapshot.events),
+        # JSON object keys are strings, so keep integer team ids as pairs
+        "team_fixtures": [[team_id, to_plain(fixtures)] for team_id, fixtures in snapshot.team_fixtures.items()],
+        "fixture_difficulty_map": to_plain(snapshot.fixture_difficulty_map),
+        "memory_report": dict(snapshot.memory_report),
+        "columns": columns,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b" " * (-(_PREFIX.size + len(header_bytes)) % _ALIGN)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_PREFIX.pack(MAGIC, len(header_bytes)))
+            f.write(header_bytes)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def map_snapshot_file(path: str) -> Snapshot:
+    """
+    Maps a snapshot file read-only and returns a Snapshot whose player columns
+    are zero-copy views into the mapping. Once the file is replaced, the old
+    mapping stays valid until the last reference to the old Snapshot is gone.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    buffer = memoryview(mapped)
+    magic, header_length = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a snapshot file.")
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_length]))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError(f"{path} was written on a {header['byteorder']}-endian host.")
+    data = buffer[_PREFIX.size + header_length:]
+
+    def view(entry, typecode=None):
+        chunk = data[entry["offset"]:entry["offset"] + entry["length"]]
+        return chunk.cast(typecode) if typecode else chunk
+
+    columns = {}
+    for name, entry in header["columns"].items():
+        if entry["kind"] == "array":
+            columns[name] = view(entry, entry["typecode"])
+        else:
+            columns[name] = StringColumn(view(entry["indices"], 'I'), view(entry["offsets"], 'I'), view(entry["blob"]))
+
+    team_fixtures = MappingProxyType({team_id: _freeze(fixtures) for team_id, fixtures in header["team_fixtures"]})
+    player_table = PlayerTable(columns, team_fixtures)
+    memory_report = dict(
+        header["memory_report"],
+        shared_file_bytes=len(mapped),
+        player_table_heap_bytes=deep_sizeof(player_table),
+    )
+    return Snapshot(
+        version=header["version"],
+        player_table=player_table,
+        memory_report=memory_report,
+        teams=_freeze({team['id']: team for team in header["teams"]}),
+        events=_freeze(header["events"]),
+        team_fixtures=team_fixtures,
+        current_gameweek=header["current_gameweek"],
+        fixture_difficulty_map=header["fixture_difficulty_map"],
+        created_at=header["created_at"]
+    )
+
+@contextmanager
+def _file_lock(path: str):
+    """Holds an exclusive advisory lock on `path` across processes (no-op without fcntl)."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class SharedSnapshotStore(BackgroundRevalidation):
+    """
+    A SnapshotStore for multi-worker deployments. The snapshot lives in a file
+    at `path` that every worker maps zero-copy. When it expires, one worker
+    (holding a file lock) runs `loader` and atomically replaces the file; the
+    others wait on the lock and then map the fresh file instead of fetching.
+    The file's creation time is shared, so all workers expire it together.
+    Like SnapshotStore, an expired snapshot is served while it revalidates, and
+    a stale file left by a previous run is used at startup rather than nothing.
+    """
+    def __init__(self, path: str, loader, ttl_seconds=300):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._init_revalidation()
+
+    def _map_if_fresh(self, max_age=None) -> Optional[Snapshot]:
+        """Maps the file if it exists and is younger than `max_age` (default: the TTL)."""
+        max_age = self.ttl_seconds if max_age is None else max_age
+        try:
+            snapshot = map_snapshot_file(self.path)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Ignoring unreadable snapshot file %s: %s", self.path, e)
+            return None
+        return snapshot if snapshot.age_seconds < max_age else None
+
+    def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            if self.is_stale(snapshot):
+                self._revalidate_in_background()
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                snapshot = self._map_if_fresh(max_age=float("inf"))
+                if snapshot is None:
+                    snapshot = self._reload(self.ttl_seconds)
+                self._snapshot = snapshot
+            return self._snapshot
+
+    def refresh(self, max_age=0) -> Snapshot:
+        """
+        Reloads now, unless the shared file is younger than `max_age` seconds
+        (e.g. another worker refreshed it moments ago), in which case it is mapped.
+        """
+        with self._lock:
+            self._snapshot = self._reload(max_age)
+            return self._snapshot
+
+    def _reload(self, max_age) -> Snapshot:
+        with _file_lock(self.lock_path):
+            snapshot = self._map_if_fresh(max_age)
+            if snapshot is None:
+                logger.info("Refreshing shared snapshot at %s (pid %d).", self.path, os.getpid())
+                write_snapshot_file(self.path, self.loader())
+                snapshot = map_snapshot_file(self.path)
+            return snapshot
+
+    def peek(self) -> Optional[Snapshot]:
+        """Returns the current snapshot without triggering a reload."""
+        return self._snapshot
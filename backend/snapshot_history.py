@@ -0,0 +1,109 @@
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from player_table import PLAYER_FIELDS
+from snapshot import Snapshot, to_plain
+
+logger = logging.getLogger(__name__)
+
+# Marks a player that is new in a version: the whole row is sent
+ALL_FIELDS = None
+
+def diff_players(old: Snapshot, new: Snapshot) -> Dict[str, Any]:
+    """
+    Compares the players of two snapshots field by field.
+    Returns {"changed": {player_id: set of changed fields, or ALL_FIELDS if new}, "removed": set of ids}.
+    """
+    old_by_id = old.index.by_id
+    new_by_id = new.index.by_id
+    changed = {}
+    for player_id, player in new_by_id.items():
+        previous = old_by_id.get(player_id)
+        if previous is None:
+            changed[player_id] = ALL_FIELDS
+            continue
+        fields = {field for field in PLAYER_FIELDS if to_plain(player[field]) != to_plain(previous[field])}
+        if fields:
+            changed[player_id] = fields
+    removed = set(old_by_id) - set(new_by_id)
+    return {"changed": changed, "removed": removed}
+
+class SnapshotHistory:
+    """
+    Remembers the last `max_versions` snapshot versions and the player diff
+    between each consecutive pair, so clients holding an older version can
+    fetch only what changed. Only the latest Snapshot itself is kept.
+    """
+    def __init__(self, max_versions=24):
+        self.max_versions = max_versions
+        self._latest = None
+        # version -> diff leading from the previous version to it (None for the first)
+        self._diffs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, snapshot: Snapshot):
+        """Records `snapshot` if its version differs from the latest one seen."""
+        latest = self._latest
+        if latest is not None and latest.version == snapshot.version:
+            return
+        with self._lock:
+            latest = self._latest
+            if latest is not None and latest.version == snapshot.version:
+                return
+            diff = diff_players(latest, snapshot) if latest is not None else None
+            # Content-hash versions can repeat (X -> A -> B -> A). Keep only the newest
+            # occurrence, and forget every version before the previous one too: their
+            # chain of diffs ran through the dropped entry, so those clients resync.
+            if snapshot.version in self._diffs:
+                while self._diffs.popitem(last=False)[0] != snapshot.version:
+                    pass
+            self._diffs[snapshot.version] = diff
+            while len(self._diffs) > self.max_versions:
+                self._diffs.popitem(last=False)
+            self._latest = snapshot
+            if diff is not None:
+                logger.info("Snapshot %s: %d players changed, %d removed.", snapshot.version, len(diff['changed']), len(diff['removed']))
+
+    def changes_since(self, since: Optional[str]) -> Dict[str, Any]:
+        """
+        Changes from version `since` to the latest one. Changed players carry
+        their id plus the changed fields at their latest values; new players
+        are sent whole. If `since` is unknown (evicted or never seen), returns
+        a full resync with every player instead.
+        """
+        with self._lock:
+            latest = self._latest
+            versions = list(self._diffs.keys())
+            diffs = list(self._diffs.values())
+
+        if since in versions:
+            changed = {}
+            removed = set()
+            for diff in diffs[versions.index(since) + 1:]:
+                for player_id, fields in diff["changed"].items():
+                    removed.discard(player_id)
+                    if fields is ALL_FIELDS or (player_id in changed and changed[player_id] is ALL_FIELDS):
+                        changed[player_id] = ALL_FIELDS
+                    else:
+                        changed[player_id] = changed.get(player_id, set()) | fields
+                for player_id in diff["removed"]:
+                    changed.pop(player_id, None)
+                    removed.add(player_id)
+
+            players = latest.index.by_id
+            rows = []
+            for player_id, fields in changed.items():
+                player = players[player_id]
+                row_fields = PLAYER_FIELDS if fields is ALL_FIELDS else ['id'] + sorted(fields)
+                rows.append({field: to_plain(player[field]) for field in row_fields})
+            return {"version": latest.version, "since": since, "full": False, "players": rows, "removed": sorted(removed)}
+
+        return {
+            "version": latest.version,
+            "since": since,
+            "full": True,
+            "players": [to_plain(p) for p in latest.players],
+            "removed": []
+        }
@@ -0,0 +1,158 @@
+import time
+from typing import Any, Dict, List, Optional
+from unidecode import unidecode
+import upstream
+from details_store import DetailsStore
+
+# Cache lifetimes, by how often the underlying data changes
+SEASONS_TTL_SECONDS = 7 * 24 * 3600
+CURRENT_SEASON_STATS_TTL_SECONDS = 6 * 3600
+PAST_SEASON_STATS_TTL_SECONDS = 30 * 24 * 3600
+FAILED_MATCH_RETRY_SECONDS = 24 * 3600
+
+class SportMonksError(Exception):
+    """A SportMonks lookup failed; carries the HTTP status to report to the client."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def _sanitize_name(name):
+    return unidecode(name.lower()) if name else ""
+
+def fpl_full_name(fpl_player) -> str:
+    return f"{fpl_player['first_name']} {fpl_player['second_name']}"
+
+def match_sportmonks_player(fpl_player, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Picks the SportMonks search result that shares a (transliterated, lowercased)
+    name with the FPL player: web name, first name, second name or full name.
+    """
+    fpl_names = {
+        _sanitize_name(fpl_player.get('web_name')),
+        _sanitize_name(fpl_player.get('first_name')),
+        _sanitize_name(fpl_player.get('second_name')),
+        _sanitize_name(fpl_full_name(fpl_player))
+    }
+    fpl_names.discard('')
+
+    for sm_player in candidates:
+        sm_names = {
+            _sanitize_name(sm_player.get('common_name')),
+            _sanitize_name(sm_player.get('firstname')),
+            _sanitize_name(sm_player.get('lastname')),
+            _sanitize_name(sm_player.get('name')),
+            _sanitize_name(sm_player.get('display_name'))
+        }
+        sm_names.discard('')
+        if fpl_names.intersection(sm_names):
+            return sm_player
+    return None
+
+class SportMonksClient:
+    """
+    SportMonks lookups for the player details view, backed by a DetailsStore:
+    player ids are matched once and persisted, the league's season list is
+    cached for a week, and player stats are cached for hours when they include
+    the current season and for weeks when they only cover finished ones.
+    """
+    def __init__(self, api_url: str, api_key: str, league_id: int, store: DetailsStore):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.league_id = league_id
+        self.store = store
+
+    def _get_json(self, url: str, error_status: Optional[int], error_detail: str):
+        response = upstream.get(url)
+        if response.status_code != 200:
+            raise SportMonksError(error_status or response.status_code, error_detail)
+        return response.json()
+
+    def find_player_id(self, fpl_player) -> int:
+        """Returns the SportMonks id for an FPL player, searching and matching by name on first use."""
+        full_name = fpl_full_name(fpl_player)
+        known = self.store.get_player_id(fpl_player['id'])
+        if known is not None:
+            sportmonks_id, matched_at = known
+            if sportmonks_id is not None:
+                return sportmonks_id
+            if time.time() - matched_at < FAILED_MATCH_RETRY_SECONDS:
+                raise SportMonksError(404, f"Could not find a unique player match for '{full_name}' on SportMonks")
+
+        search_url = f"{self.api_url}/players/search/{full_name}?api_token={self.api_key}&include=teams.team"
+        search_data = self._get_json(search_url, None, "Error searching for player on SportMonks")
+        if not search_data.get('data'):
+            self.store.set_player_id(fpl_player['id'], None, full_name)
+            raise SportMonksError(404, f"Player '{full_name}' not found on SportMonks")
+
+        matched_player = match_sportmonks_player(fpl_player, search_data['data'])
+        if not matched_player:
+            self.store.set_player_id(fpl_player['id'], None, full_name)
+            raise SportMonksError(404, f"Could not find a unique player match for '{full_name}' on SportMonks")
+
+        self.store.set_player_id(fpl_player['id'], matched_player['id'], full_name)
+        return matched_player['id']
+
+    def recent_seasons(self, count=2) -> List[Dict[str, Any]]:
+        """The league's `count` most recent seasons (id, name, is_current), newest first."""
+        key = f"sportmonks:league:{self.league_id}:seasons"
+        seasons = self.store.get_response(key)
+        if seasons is None:
+            seasons_url = f"{self.api_url}/leagues/{self.league_id}?api_token={self.api_key}&include=seasons"
+            league_data = self._get_json(seasons_url, 500, "Could not fetch seasons from SportMonks").get('data', {})
+            seasons = [
+                {"id": s['id'], "name": s.get('name', ''), "is_current": bool(s.get('is_current'))}
+                for s in league_data.get('seasons', [])
+            ]
+            if not seasons:
+                raise SportMonksError(404, "No seasons found for Premier League")
+            self.store.put_response(key, seasons, SEASONS_TTL_SECONDS)
+
+        seasons = sorted(seasons, key=lambda s: s['name'], reverse=True)
+        return seasons[:count]
+
+    def player_stats(self, sportmonks_id: int, seasons: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """The player's SportMonks record with statistics for `seasons`, from the cache when fresh."""
+        season_ids_str = ",".join(str(s['id']) for s in seasons)
+        key = f"sportmonks:player:{sportmonks_id}:stats:{season_ids_str}"
+        player_data = self.store.get_response(key)
+        if player_data is not None:
+            return player_data
+
+        includes = "statistics.details.type;statistics.season.league"
+        filters = f"playerStatisticSeasons:{season_ids_str}"
+        stats_url = f"{self.api_url}/players/{sportmonks_id}?api_token={self.api_key}&include={includes}&filters={filters}"
+        player_data = self._get_json(stats_url, None, "Error fetching player stats from SportMonks")
+
+        in_progress = any(s['is_current'] for s in seasons)
+        self.store.put_response(key, player_data, CURRENT_SEASON_STATS_TTL_SECONDS if in_progress else PAST_SEASON_STATS_TTL_SECONDS)
+        return player_data
+
+    def prebuild(self, fpl_players, delay_seconds=0.5) -> Dict[str, int]:
+        """
+        Matches every FPL player that has no stored SportMonks id yet, pausing
+        `delay_seconds` between searches to stay within the API rate limit.
+        Returns counts of matched, unmatched and already known players.
+        """
+        counts = {"matched": 0, "unmatched": 0, "known": 0}
+        for fpl_player in fpl_players:
+            known = self.store.get_player_id(fpl_player['id'])
+            if known is not None and known[0] is not None:
+                counts["known"] += 1
+                continue
+            try:
+                self.find_player_id(fpl_player)
+                counts["matched"] += 1
+            except SportMonksError:
+                counts["unmatched"] += 1
+            time.sleep(delay_seconds)
+        return counts
+
+if __name__ == "__main__":
+    # Bulk-prebuild the id map for every current FPL player: python sportmonks.py [delay_seconds]
+    import sys
+    from main import get_snapshot, sportmonks_client
+
+    delay = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    counts = sportmonks_client.prebuild(get_snapshot().players, delay_seconds=delay)
+    print(f"SportMonks id map: {counts['matched']} matched, {counts['unmatched']} unmatched, {counts['known']} already known.")
@@ -1,10 +1,35 @@
+import os
+import copy
 import random
+import logging
 import itertools
 import asyncio
 from collections import Counter
 from typing import List, Dict, Any, Tuple, Union
 from pydantic import BaseModel
 from fixture_service import create_fixture_difficulty_map
+from cancellation import OperationCancelled, raise_if_cancelled
+from snapshot import with_overlay, player_to_dict
+from logs import Sampler
+import metrics
+
+logger = logging.getLogger(__name__)
+# Shared by all analyses: at DEBUG, one in LOG_SAMPLE_EVERY transfer candidates is logged with its score breakdown
+candidate_log_sampler = Sampler()
+
+# Set for reproducible runs (e.g. when replaying a bundle): every squad builder then
+# draws from its own random.Random seeded with it, so its result does not depend on
+# what other requests drew before it.
+RANDOM_SEED = int(os.getenv("RANDOM_SEED")) if os.getenv("RANDOM_SEED") else None
+
+def builder_rng(seed=None):
+    """
+    The source of randomness for one squad builder: a random.Random seeded with
+    `seed` (default: RANDOM_SEED), or the shared `random` module if neither is set.
+    """
+    if seed is None:
+        seed = RANDOM_SEED
+    return random.Random(seed) if seed is not None else random
 
 SQUAD_RULES = {
     "TOTAL_PLAYERS": 15,
@@ -18,6 +43,11 @@ SQUAD_RULES = {
     }
 }
 
+# The only player fields the genetic algorithm's loops read; it works on flat copies of these
+GA_PLAYER_FIELDS = ('id', 'team', 'now_cost', 'position_name')
+# The only player fields the transfer search reads from replacement candidates
+CANDIDATE_FIELDS = ('id', 'team', 'now_cost')
+
 VALID_FORMATIONS = [
     {'GKP': 1, 'DEF': 3, 'MID': 5, 'FWD': 2},
     {'GKP': 1, 'DEF': 3, 'MID': 4, 'FWD': 3},
@@ -28,9 +58,10 @@ VALID_FORMATIONS = [
 ]
 
 class RandomSquadBuilder:
-    def __init__(self, players, budget=100.0):
+    def __init__(self, players, budget=100.0, seed=None):
         self.players = players
         self.budget = budget
+        self.rng = builder_rng(seed)
         self.positions = {pos: [] for pos in SQUAD_RULES["POSITIONS"].keys()}
         for p in self.players:
             pos_name = p.get('position_name')
@@ -70,7 +101,7 @@ class RandomSquadBuilder:
             
             # Shuffle players within each position to ensure randomness
             for pos in temp_positions:
-                random.shuffle(temp_positions[pos])
+                self.rng.shuffle(temp_positions[pos])
 
             # A bit of a greedy approach: try to pick more expensive players first
             for pos in temp_positions:
@@ -129,33 +160,46 @@ class RandomSquadBuilder:
         squad = []
         for pos, count in SQUAD_RULES["POSITIONS"].items():
             if len(self.positions[pos]) >= count:
-                squad.extend(random.sample(self.positions[pos], count))
+                squad.extend(self.rng.sample(self.positions[pos], count))
         return squad
 
 class GeneticSquadBuilder:
-    def __init__(self, players, budget=100.0, population_size=1000, generations=500, mutation_rate=0.2, elitism_pct=0.1):
+    def __init__(self, players, budget=100.0, population_size=1000, generations=500, mutation_rate=0.2, elitism_pct=0.1,
+                 fixture_difficulty_map=None, seed=None):
         """
         Initializes the Genetic Algorithm Squad Builder.
-        - players: A list of all available players.
+        - players: A list of all available players. They are never mutated; the
+          evolution works on flat per-builder copies holding the fixture-aware AI score.
         - budget: The total budget for the squad.
         - population_size: The number of squads in each generation.
         - generations: The number of generations to evolve.
         - mutation_rate: The probability of a squad undergoing mutation.
         - elitism_pct: The percentage of the best squads to carry over to the next generation.
+        - fixture_difficulty_map: Optional precomputed map (e.g. from the shared snapshot);
+          fetched when omitted.
+        - seed: Seeds this builder's own random.Random (see builder_rng).
         """
-        self.players = players
         self.budget = budget
+        self.rng = builder_rng(seed)
         self.population_size = population_size
         self.generations = generations
         self.mutation_rate = mutation_rate
         self.elite_size = int(population_size * elitism_pct)
+        # Number of squad fitness evaluations so far (for benchmarking)
+        self.evaluations = 0
         
         # --- NEW: Fixture-aware AI Score Calculation ---
-        print("Initializing Genetic Squad Builder...")
-        self.fixture_difficulty_map = create_fixture_difficulty_map()
-        for player in self.players:
-            player['ai_score'] = self._calculate_ai_score(player)
-        print("AI scores calculated for all players.")
+        logger.debug("Initializing Genetic Squad Builder over %d players.", len(players))
+        if fixture_difficulty_map is None:
+            fixture_difficulty_map = create_fixture_difficulty_map()
+        self.fixture_difficulty_map = fixture_difficulty_map
+        # Plain dicts keep the hot loops off the shared read-only records; those are
+        # only looked up again for the squad run() returns.
+        self.records = {p['id']: p for p in players}
+        self.players = [
+            dict({field: p.get(field) for field in GA_PLAYER_FIELDS}, ai_score=self._calculate_ai_score(p))
+            for p in players
+        ]
         # ---
         
         # Pre-categorize players by position for easier selection
@@ -198,15 +242,16 @@ class GeneticSquadBuilder:
             player_to_replace = squad[0]
             
             # Find a cheaper replacement of the same position
+            squad_ids = {sq_p['id'] for sq_p in squad}
             replacement_options = [
                 p for p in self.positions[player_to_replace['position_name']]
-                if p['now_cost'] < player_to_replace['now_cost'] and p['id'] not in [sq_p['id'] for sq_p in squad]
+                if p['now_cost'] < player_to_replace['now_cost'] and p['id'] not in squad_ids
             ]
             
             if not replacement_options:
                 return None # Cannot repair
 
-            new_player = random.choice(replacement_options)
+            new_player = self.rng.choice(replacement_options)
             squad[0] = new_player
 
         return squad
@@ -220,7 +265,7 @@ class GeneticSquadBuilder:
             for pos, count in SQUAD_RULES["POSITIONS"].items():
                 # Ensure there are enough players to choose from
                 if len(self.positions[pos]) >= count:
-                    squad.extend(random.sample(self.positions[pos], count))
+                    squad.extend(self.rng.sample(self.positions[pos], count))
 
             if len(squad) == SQUAD_RULES["TOTAL_PLAYERS"] and self._is_valid(squad):
                 return squad
@@ -312,6 +357,7 @@ class GeneticSquadBuilder:
         """
         if not squad:
             return 0
+        self.evaluations += 1
         
         best_formation_score = 0
         
@@ -354,14 +400,15 @@ class GeneticSquadBuilder:
             combined_genes = list(unique_players.values())
             
             if len(combined_genes) >= count:
-                child.extend(random.sample(combined_genes, count))
+                child.extend(self.rng.sample(combined_genes, count))
             else:
                 # If not enough unique players, take what we have and fill randomly
                 child.extend(combined_genes)
                 needed = count - len(combined_genes)
-                available = [p for p in self.positions[pos] if p not in child]
+                child_ids = {p['id'] for p in child}
+                available = [p for p in self.positions[pos] if p['id'] not in child_ids]
                 if len(available) >= needed:
-                    child.extend(random.sample(available, needed))
+                    child.extend(self.rng.sample(available, needed))
                 else: # Failsafe
                     return None
         return child
@@ -377,7 +424,7 @@ class GeneticSquadBuilder:
         # Bias mutation towards replacing weaker players
         squad.sort(key=lambda p: p.get('ai_score', 0))
         # Pick one of the bottom 5 players to replace
-        idx_to_mutate = random.randint(0, min(4, len(squad) - 1))
+        idx_to_mutate = self.rng.randint(0, min(4, len(squad) - 1))
         
         player_to_replace = squad[idx_to_mutate]
         position = player_to_replace['position_name']
@@ -385,18 +432,29 @@ class GeneticSquadBuilder:
         # Find a new player of the same position
         max_attempts = 100
         for _ in range(max_attempts):
-            new_player = random.choice(self.positions[position])
+            new_player = self.rng.choice(self.positions[position])
             if new_player['id'] not in [p['id'] for p in squad]:
                 squad[idx_to_mutate] = new_player
                 return squad
         return squad # Return original if no replacement is found
 
-    def run(self):
+    def run(self, cancel_token=None):
         """
         The main entry point to run the genetic algorithm.
         Initializes a population and evolves it over a number of generations
         to find the best possible FPL squad.
+        - cancel_token: Optional CancellationToken, checked between generations.
+          Raises OperationCancelled once it has been triggered.
+        Returns the squad's players as overlays over their records, with this builder's AI score.
         """
+        start_evaluations = self.evaluations
+        with metrics.span("ga.run"):
+            best_squad = self._evolve(cancel_token)
+        metrics.ga_generations.observe(self.generations)
+        metrics.ga_evaluations.observe(self.evaluations - start_evaluations)
+        return [with_overlay(self.records[p['id']], ai_score=p['ai_score']) for p in best_squad]
+
+    def _evolve(self, cancel_token):
         # --- 1. Initialization ---
         population = []
         for _ in range(self.population_size):
@@ -405,10 +463,12 @@ class GeneticSquadBuilder:
             if squad:
                 population.append(squad)
         
-        print(f"Initial population created with {len(population)} squads.")
+        logger.debug("Initial population created with %d squads.", len(population))
 
         # --- 2. Evolution Loop ---
         for gen in range(self.generations):
+            raise_if_cancelled(cancel_token)
+
             # Calculate fitness for the entire population
             fitness_scores = [self._calculate_fitness(squad) for squad in population]
 
@@ -441,20 +501,20 @@ class GeneticSquadBuilder:
             for _ in range(num_offspring):
                 # Select two parents
                 if selection_probs:
-                    parent1, parent2 = random.choices(
+                    parent1, parent2 = self.rng.choices(
                         current_population,
                         weights=selection_probs,
                         k=2
                     )
                 else: # Fallback to random selection
-                    parent1, parent2 = random.choices(current_population, k=2)
+                    parent1, parent2 = self.rng.choices(current_population, k=2)
 
                 # Crossover
                 child = self._crossover(parent1, parent2)
                 if not child: continue
 
                 # Mutation
-                if random.random() < self.mutation_rate:
+                if self.rng.random() < self.mutation_rate:
                     child = self._mutate(child)
                 
                 # Repair if mutation or crossover made it invalid
@@ -467,41 +527,207 @@ class GeneticSquadBuilder:
             population = next_generation
             
             # Optional: Print progress
-            if (gen + 1) % 50 == 0:
+            if (gen + 1) % 50 == 0 and logger.isEnabledFor(logging.DEBUG):
                 best_squad_so_far = pop_with_fitness[0][0]
                 best_fitness = pop_with_fitness[0][1]
                 squad_cost = sum(p['now_cost'] / 10 for p in best_squad_so_far)
-                print(f"Generation {gen+1}/{self.generations} - Best Fitness: {best_fitness:.2f}, Squad Cost: £{squad_cost:.1f}m")
+                logger.debug("Generation %d/%d - Best Fitness: %.2f, Squad Cost: £%.1fm", gen + 1, self.generations, best_fitness, squad_cost)
 
         # --- 5. Return Best Result ---
         final_fitness_scores = [self._calculate_fitness(squad) for squad in population]
         best_squad_index = max(range(len(final_fitness_scores)), key=final_fitness_scores.__getitem__)
         return population[best_squad_index]
 
+def select_ai_squad(players, fixture_difficulty_map, cancel_token=None, seed=None) -> Dict[str, Any]:
+    """
+    Runs the genetic algorithm over all available players and picks the best
+    starting 11 and bench from the resulting squad, as /api/ai-squad returns it.
+    - players: All players of the snapshot.
+    - fixture_difficulty_map: The snapshot's fixture difficulty map.
+    - cancel_token: Optional CancellationToken checked by the genetic algorithm.
+    - seed: Optional seed for the genetic algorithm (see builder_rng).
+    """
+    # Filter out players with status 'u' (unavailable) or low chance of playing
+    available_players = [
+        p for p in players
+        if p.get('status') != 'u' and (p.get('chance_of_playing_next_round') is None or p.get('chance_of_playing_next_round') > 50)
+    ]
+
+    builder = GeneticSquadBuilder(
+        players=available_players,
+        population_size=200, # Increased for better exploration
+        generations=100,     # Increased for deeper evolution
+        mutation_rate=0.2,
+        fixture_difficulty_map=fixture_difficulty_map,
+        seed=seed
+    )
+    best_squad = builder.run(cancel_token=cancel_token)
+    
+    # Properly select starting 11 following FPL rules
+    # Group players by position
+    position_groups = {'GKP': [], 'DEF': [], 'MID': [], 'FWD': []}
+    for player in best_squad:
+        pos = player.get('position_name')
+        if pos in position_groups:
+            position_groups[pos].append(player)
+    
+    # Sort each position group by AI score
+    for pos in position_groups:
+        position_groups[pos].sort(key=lambda p: p.get('ai_score', 0), reverse=True)
+    
+    # Select starting 11: 1 GKP + best formation from remaining positions
+    starting_11 = []
+    bench = []
+    
+    # Always start the best goalkeeper
+    if position_groups['GKP']:
+        starting_11.append(position_groups['GKP'][0])
+        bench.extend(position_groups['GKP'][1:])
+    
+    # For outfield players, try different valid formations and pick the best
+    valid_formations = [
+        {'DEF': 4, 'MID': 4, 'FWD': 2},  # 4-4-2
+        {'DEF': 3, 'MID': 5, 'FWD': 2},  # 3-5-2
+        {'DEF': 3, 'MID': 4, 'FWD': 3},  # 3-4-3
+        {'DEF': 4, 'MID': 3, 'FWD': 3},  # 4-3-3
+        {'DEF': 4, 'MID': 5, 'FWD': 1},  # 4-5-1
+        {'DEF': 5, 'MID': 4, 'FWD': 1},  # 5-4-1
+        {'DEF': 5, 'MID': 3, 'FWD': 2},  # 5-3-2
+    ]
+    
+    best_formation_score = 0
+    best_formation_players = []
+    
+    for formation in valid_formations:
+        formation_players = []
+        formation_score = 0
+        
+        # Check if we have enough players for this formation
+        can_form = True
+        for pos, count in formation.items():
+            if len(position_groups[pos]) < count:
+                can_form = False
+                break
+        
+        if can_form:
+            # Select best players for this formation
+            for pos, count in formation.items():
+                selected = position_groups[pos][:count]
+                formation_players.extend(selected)
+                formation_score += sum(p.get('ai_score', 0) for p in selected)
+            
+            if formation_score > best_formation_score:
+                best_formation_score = formation_score
+                best_formation_players = formation_players
+    
+    # Add the best formation players to starting 11
+    starting_11.extend(best_formation_players)
+    
+    # Add remaining players to bench
+    for pos in ['DEF', 'MID', 'FWD']:
+        selected_ids = {p['id'] for p in best_formation_players if p.get('position_name') == pos}
+        remaining = [p for p in position_groups[pos] if p['id'] not in selected_ids]
+        bench.extend(remaining)
+    
+    # Calculate squad statistics
+    total_cost = sum(p.get('now_cost', 0) / 10 for p in best_squad)  # Convert from tenths to millions
+    remaining_budget = 100.0 - total_cost
+    total_ai_score = sum(p.get('ai_score', 0) for p in starting_11)
+    
+    # Determine the formation name
+    formation_counts = {}
+    for player in best_formation_players:
+        pos = player.get('position_name')
+        formation_counts[pos] = formation_counts.get(pos, 0) + 1
+    
+    formation_name = f"{formation_counts.get('DEF', 0)}-{formation_counts.get('MID', 0)}-{formation_counts.get('FWD', 0)}"
+    
+    return {
+        "starting_11": [player_to_dict(p) for p in starting_11],
+        "bench": [player_to_dict(p) for p in bench],
+        "formation": formation_name,
+        "squad_value": round(total_cost, 1),
+        "remaining_budget": round(remaining_budget, 1),
+        "total_ai_score": round(total_ai_score, 1)
+    }
+
+class AnalysisContext:
+    """
+    Snapshot-wide analysis state that does not depend on the user's squad, so
+    analyses of many squads (see bulk_analysis) can share it: every player's
+    AI score and the optimal squad the wildcard check compares against.
+    Plain data, so it can be sent to worker processes.
+    """
+    def __init__(self, scores: Dict[int, float], ideal_squad: List[Dict[str, Any]], ideal_squad_score: float):
+        self.scores = scores
+        self.ideal_squad = ideal_squad
+        self.ideal_squad_score = ideal_squad_score
+
+    @classmethod
+    def build(cls, players: List[Dict[str, Any]], fixture_difficulty_map, cancel_token=None) -> "AnalysisContext":
+        """Scores all players and runs the wildcard genetic algorithm once."""
+        scorer = SquadAnalyzer([], players, cancel_token=cancel_token, fixture_difficulty_map=fixture_difficulty_map)
+        scores = {p['id']: scorer._calculate_ai_score(p) for p in players}
+        ideal_squad, ideal_squad_score = scorer._build_ideal_squad()
+        return cls(scores, [player_to_dict(p) for p in ideal_squad], ideal_squad_score)
+
 class SquadAnalyzer:
     """
     Analyzes a user's squad and suggests improvements.
     """
-    def __init__(self, user_squad: List[Dict[str, Any]], all_players: List[Dict[str, Any]]):
+    def __init__(self, user_squad: List[Dict[str, Any]], all_players: List[Dict[str, Any]], cancel_token=None,
+                 fixture_difficulty_map=None, context: AnalysisContext = None):
         """
         Initializes the Squad Analyzer.
         - user_squad: A list of 15 players in the user's current squad.
-        - all_players: A list of all available players in the game.
+        - all_players: A list of all available players in the game. Shared snapshot
+          records are never mutated: the search reads flat copies of the few fields it
+          needs and a per-analysis {id: AI score} lookup, and only the suggested
+          players become overlays carrying this analysis' score and fixtures.
+        - cancel_token: Optional CancellationToken checked between analysis stages.
+        - fixture_difficulty_map: Optional precomputed map (e.g. from the shared snapshot);
+          fetched when omitted.
+        - context: Optional AnalysisContext for `all_players` and the same fixture map,
+          whose scores and wildcard squad are used instead of computing them again.
         """
-        print("\n--- Initializing Squad Analyzer ---")
-        self.user_squad = user_squad
-        self.all_players = all_players
+        self.user_squad = [with_overlay(p) for p in user_squad]
+        self.shared_players = all_players
+        self.records = {p['id']: p for p in all_players}
+        # Replacement candidates by position, in all_players order
+        self.candidates_by_position = {}
+        for p in all_players:
+            self.candidates_by_position.setdefault(p['position_name'], []).append(
+                {field: p[field] for field in CANDIDATE_FIELDS}
+            )
+        self.cancel_token = cancel_token
+        self.context = context
+        # Player id -> fixture-aware AI score, filled on first use (copied so the context stays read-only)
+        self.scores = dict(context.scores) if context is not None else {}
+        # Number of player AI score evaluations so far (for benchmarking)
+        self.evaluations = 0
         self.squad_player_ids = {p['id'] for p in user_squad}
         self.team_counts = Counter(p['team'] for p in user_squad)
         
-        print("Fetching fixture difficulty map...")
-        self.fixture_difficulty_map = create_fixture_difficulty_map()
+        if fixture_difficulty_map is None:
+            fixture_difficulty_map = create_fixture_difficulty_map()
+        self.fixture_difficulty_map = fixture_difficulty_map
         
         # Pre-calculate AI scores for all players in the user's squad
-        print("Calculating AI scores for user squad...")
         for player in self.user_squad:
             player['ai_score'] = self._calculate_ai_score(player)
-        print("--- Squad Analyzer Initialized ---")
+
+    def fork(self) -> "SquadAnalyzer":
+        """
+        Returns an analyzer for running a stage concurrently with this one's (e.g. the
+        chip suggestion in the threadpool while the transfers are searched). It shares
+        the read-only snapshot data, but has its own squad overlays and score lookup,
+        so neither stage sees the other's writes.
+        """
+        forked = copy.copy(self)
+        forked.user_squad = [with_overlay(p.parents, **p.maps[0]) for p in self.user_squad]
+        forked.scores = dict(self.scores)
+        forked.evaluations = 0
+        return forked
 
     def _get_average_fixture_difficulty(self, player, num_games=5):
         """
@@ -529,6 +755,7 @@ class SquadAnalyzer:
         Calculates a player's AI score based on a weighted combination of their
         recent form, underlying stats (ICT index), and upcoming fixture difficulty.
         """
+        self.evaluations += 1
         # --- Weights for different factors ---
         form_weight = 0.4
         ict_weight = 0.4
@@ -577,14 +804,29 @@ class SquadAnalyzer:
         final_score = score_after_fixtures + minutes_bonus
         return base_score, score_after_fixtures, minutes_bonus, final_score, avg_difficulty, difficulty_score, difficulty_weight
 
-    def _print_player_score_analysis(self, player: Dict[str, Any]):
-        print(f"--- Analysis for {player.get('web_name')} ---")
+    def _candidate_score(self, player_id: int) -> float:
+        """The fixture-aware AI score of one of all_players, computed at most once per analysis."""
+        score = self.scores.get(player_id)
+        if score is None:
+            score = self.scores[player_id] = self._calculate_ai_score(self.records[player_id])
+        return score
+
+    def _candidate(self, player_id: int) -> Dict[str, Any]:
+        """A suggested player: its record with this analysis' AI score and upcoming fixtures."""
+        record = self.records[player_id]
+        return with_overlay(
+            record, ai_score=self._candidate_score(player_id), upcoming_fixtures=self._get_upcoming_fixtures(record)
+        )
+
+    def _log_player_score_analysis(self, player: Dict[str, Any]):
+        """Logs the AI score breakdown of a player at DEBUG. Callers check the level first, the components are recomputed."""
         base_score, score_after_fixtures, minutes_bonus, final_score, avg_difficulty, difficulty_score, difficulty_weight = self._get_ai_score_components(player)
-        
-        print(f"  Base Stats       | Form: {player.get('form', 0)}, ICT Index: {player.get('ict_index', 0)}")
-        print(f"  Fixture Analysis | Avg Difficulty: {avg_difficulty:.2f} -> Modifier: {1 + (difficulty_score * difficulty_weight):.3f}")
-        print(f"  Calculated Score | Base: {base_score:.2f} | With Fixtures: {score_after_fixtures:.2f} | Bonus: +{minutes_bonus:.2f}")
-        print(f"  >> Final AI Score: {final_score:.2f}")
+        logger.debug(
+            "Analysis for %s | Form: %s, ICT Index: %s | Avg Difficulty: %.2f -> Modifier: %.3f"
+            " | Base: %.2f | With Fixtures: %.2f | Bonus: +%.2f | Final AI Score: %.2f",
+            player.get('web_name'), player.get('form', 0), player.get('ict_index', 0), avg_difficulty,
+            1 + (difficulty_score * difficulty_weight), base_score, score_after_fixtures, minutes_bonus, final_score
+        )
 
     def _get_starting_11(self, squad: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
@@ -617,6 +859,28 @@ class SquadAnalyzer:
         
         return best_lineup, bench
 
+    async def _gather_reasoning(self, coroutines, poll_interval=0.1):
+        """
+        Runs the reasoning calls concurrently, like asyncio.gather, but abandons
+        the outstanding calls as soon as the cancellation token is triggered.
+        """
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        if not tasks:
+            return []
+        if self.cancel_token is None:
+            return await asyncio.gather(*tasks)
+
+        pending = set(tasks)
+        try:
+            while pending:
+                self.cancel_token.raise_if_cancelled()
+                _, pending = await asyncio.wait(pending, timeout=poll_interval)
+        except (OperationCancelled, asyncio.CancelledError):
+            for task in pending:
+                task.cancel()
+            raise
+        return [task.result() for task in tasks]
+
     def _get_player_fixture_count(self, player: Dict[str, Any], gameweek_range=1) -> int:
         """
         Counts how many fixtures a player has within a given number of upcoming gameweeks.
@@ -662,38 +926,28 @@ class SquadAnalyzer:
         Analyzes the squad and game state to recommend a chip (Wildcard, Bench Boost, etc.).
         Returns a dictionary with the chip recommendation or None.
         """
+        raise_if_cancelled(self.cancel_token)
+
         # --- 1. Wildcard Logic ---
         WILDCARD_SCORE_GAIN_THRESHOLD = 25.0
         
-        print("\n--- Chip Analysis: Wildcard ---")
-        
         # Calculate current squad's total score
         current_squad_score = sum(self._calculate_ai_score(p) for p in self.user_squad)
-        print(f"Current Squad Total AI Score: {current_squad_score:.2f}")
 
-        # Build an optimal squad to compare against
-        print("Running Genetic Algorithm to find optimal wildcard squad...")
-        wildcard_builder = GeneticSquadBuilder(
-            players=self.all_players,
-            population_size=150, # Smaller values for faster analysis
-            generations=50,
-            mutation_rate=0.2
-        )
-        ideal_squad = wildcard_builder.run()
-        
-        # Pre-calculate AI scores for the ideal squad before summing them up
-        for player in ideal_squad:
-            player['ai_score'] = self._calculate_ai_score(player)
-            
-        ideal_squad_score = sum(p.get('ai_score', 0) for p in ideal_squad)
+        # Compare against an optimal squad (shared between analyses when there is a context)
+        if self.context is not None:
+            ideal_squad, ideal_squad_score = self.context.ideal_squad, self.context.ideal_squad_score
+        else:
+            ideal_squad, ideal_squad_score = self._build_ideal_squad()
         
         score_gain = ideal_squad_score - current_squad_score
         
-        print(f"Optimal Wildcard Squad Score: {ideal_squad_score:.2f}")
-        print(f"Potential Score Gain: {score_gain:.2f} (Threshold: {WILDCARD_SCORE_GAIN_THRESHOLD})")
+        logger.debug(
+            "Wildcard: current squad score %.2f, optimal %.2f, gain %.2f (threshold %s)",
+            current_squad_score, ideal_squad_score, score_gain, WILDCARD_SCORE_GAIN_THRESHOLD
+        )
 
         if score_gain >= WILDCARD_SCORE_GAIN_THRESHOLD:
-            print("WILDCARD SUGGESTION TRIGGERED")
             return {
                 "chip": "Wildcard",
                 "reason": f"Your squad's potential is significantly lower than an optimal squad. Playing your Wildcard could boost your team's total AI Score by an estimated {score_gain:.1f} points.",
@@ -714,12 +968,12 @@ class SquadAnalyzer:
         total_bench_score = sum(bench_scores)
         min_bench_score = min(bench_scores) if bench_scores else 0
         
-        print(f"\n--- Chip Analysis: Bench Boost ---")
-        print(f"Total Bench Score: {total_bench_score:.2f} (Threshold: {BENCH_BOOST_TOTAL_SCORE_THRESHOLD})")
-        print(f"Lowest Player Score on Bench: {min_bench_score:.2f} (Threshold: {BENCH_BOOST_MIN_PLAYER_SCORE_THRESHOLD})")
+        logger.debug(
+            "Bench Boost: total bench score %.2f (threshold %s), lowest %.2f (threshold %s)",
+            total_bench_score, BENCH_BOOST_TOTAL_SCORE_THRESHOLD, min_bench_score, BENCH_BOOST_MIN_PLAYER_SCORE_THRESHOLD
+        )
 
         if total_bench_score >= BENCH_BOOST_TOTAL_SCORE_THRESHOLD and min_bench_score >= BENCH_BOOST_MIN_PLAYER_SCORE_THRESHOLD:
-            print("BENCH BOOST SUGGESTION TRIGGERED")
             return {
                 "chip": "Bench Boost",
                 "reason": f"Your bench has a combined AI Score of {total_bench_score:.1f}, and all players have strong individual scores. This is a great week to play your Bench Boost.",
@@ -737,12 +991,12 @@ class SquadAnalyzer:
             captain_fixtures = self._get_player_fixture_count(captain)
             captain_score = self._calculate_ai_score(captain)
             
-            print(f"\n--- Chip Analysis: Triple Captain ---")
-            print(f"Captain: {captain.get('web_name')}, AI Score: {captain_score:.2f} (Threshold: {TRIPLE_CAPTAIN_SCORE_THRESHOLD})")
-            print(f"Fixtures in upcoming gameweek: {captain_fixtures}")
+            logger.debug(
+                "Triple Captain: %s, AI score %.2f (threshold %s), %d fixtures in the upcoming gameweek",
+                captain.get('web_name'), captain_score, TRIPLE_CAPTAIN_SCORE_THRESHOLD, captain_fixtures
+            )
 
             if captain_score >= TRIPLE_CAPTAIN_SCORE_THRESHOLD and captain_fixtures >= 2:
-                print("TRIPLE CAPTAIN SUGGESTION TRIGGERED")
                 return {
                     "chip": "Triple Captain",
                     "reason": f"{captain.get('web_name')} has an exceptionally high AI score of {captain_score:.1f} and plays twice this gameweek, making it a prime opportunity for Triple Captain.",
@@ -756,20 +1010,36 @@ class SquadAnalyzer:
         # More chip logic will be added here later.
         return None
 
+    def _build_ideal_squad(self) -> Tuple[List[Dict[str, Any]], float]:
+        """Runs the genetic algorithm for the wildcard comparison. Returns (squad, total AI score)."""
+        wildcard_builder = GeneticSquadBuilder(
+            players=self.shared_players,
+            population_size=150, # Smaller values for faster analysis
+            generations=50,
+            mutation_rate=0.2,
+            fixture_difficulty_map=self.fixture_difficulty_map
+        )
+        raise_if_cancelled(self.cancel_token)
+        ideal_squad = wildcard_builder.run(cancel_token=self.cancel_token)
+        
+        # Pre-calculate AI scores for the ideal squad before summing them up
+        for player in ideal_squad:
+            player['ai_score'] = self._calculate_ai_score(player)
+            
+        return ideal_squad, sum(p.get('ai_score', 0) for p in ideal_squad)
+
     def _find_potential_replacements(self, player_out: Dict[str, Any], budget: float, excluded_ids: set) -> List[Dict[str, Any]]:
         """
         Finds all valid replacement players for a given player, respecting budget,
-        team limits, and position constraints.
+        team limits, and position constraints. Returns candidates (see CANDIDATE_FIELDS).
         """
         replacements = []
         position_to_fill = player_out['position_name']
         
-        for player_in in self.all_players:
-            # Basic checks: not the same player, correct position, not already in squad
+        for player_in in self.candidates_by_position.get(position_to_fill, []):
+            # Basic checks: not the same player, not already in squad
             if player_in['id'] == player_out['id'] or player_in['id'] in excluded_ids:
                 continue
-            if player_in['position_name'] != position_to_fill:
-                continue
 
             # Budget check
             if player_in['now_cost'] > budget:
@@ -787,13 +1057,16 @@ class SquadAnalyzer:
             
         return replacements
 
-    async def suggest_transfers(self, num_suggestions=5, reasoning_generator=None):
+    def find_transfers(self, num_suggestions=5):
         """
-        Suggests the top N single-player transfers based on the biggest AI score improvement.
+        Suggests the top N single-player transfers based on the biggest AI score improvement,
+        without reasons (see attach_reasoning). Blocking: async callers run it in the threadpool.
         """
         # --- 1. Find the top N transfer candidates for each player in the user's squad ---
         all_potential_transfers = []
         for player_out in self.user_squad:
+            raise_if_cancelled(self.cancel_token)
+
             # Re-calculate score in case it has been affected by other logic
             player_out['ai_score'] = self._calculate_ai_score(player_out)
             
@@ -801,31 +1074,25 @@ class SquadAnalyzer:
             potential_replacements = self._find_potential_replacements(player_out, player_out['now_cost'], self.squad_player_ids)
             
             for player_in in potential_replacements:
-                # Re-calculate score for incoming player
-                player_in['ai_score'] = self._calculate_ai_score(player_in)
-
-                score_gain = player_in['ai_score'] - player_out['ai_score']
+                score_gain = self._candidate_score(player_in['id']) - player_out['ai_score']
                 if score_gain > 0:
-                    # --- Attach fixture data for reasoning ---
+                    # --- Attach fixture data for reasoning (suggested players get theirs in _candidate) ---
                     player_out['upcoming_fixtures'] = self._get_upcoming_fixtures(player_out)
-                    player_in['upcoming_fixtures'] = self._get_upcoming_fixtures(player_in)
                     # ---
-                    all_potential_transfers.append({
-                        "player_out": player_out,
-                        "player_in": player_in,
-                        "score_gain": score_gain
-                    })
+                    all_potential_transfers.append((score_gain, player_out, player_in['id']))
                     
-                    # --- DETAILED PRINT FOR COMPARISON ---
-                    print("\n" + "="*80)
-                    print(f"Found Potential Transfer: {player_out.get('web_name')} -> {player_in.get('web_name')} | Score Gain: +{score_gain:.2f}")
-                    self._print_player_score_analysis(player_out)
-                    self._print_player_score_analysis(player_in)
-                    print("="*80)
-                    # ---
+                    # Per-candidate breakdowns are sampled: there can be thousands of them per request
+                    if logger.isEnabledFor(logging.DEBUG) and candidate_log_sampler():
+                        record_in = self.records[player_in['id']]
+                        logger.debug(
+                            "Found Potential Transfer: %s -> %s | Score Gain: +%.2f",
+                            player_out.get('web_name'), record_in.get('web_name'), score_gain
+                        )
+                        self._log_player_score_analysis(player_out)
+                        self._log_player_score_analysis(record_in)
 
         # --- 2. Sort all possible transfers by score gain and get the top N ---
-        sorted_transfers = sorted(all_potential_transfers, key=lambda x: x['score_gain'], reverse=True)
+        sorted_transfers = sorted(all_potential_transfers, key=lambda x: x[0], reverse=True)
         
         # --- 3. Filter out transfers that would result in an invalid squad ---
         # This logic is simplified; a full validation would check all rules.
@@ -834,37 +1101,29 @@ class SquadAnalyzer:
         final_suggestions = []
         used_player_ids = set()
 
-        for transfer in sorted_transfers:
+        for score_gain, player_out, p_in_id in sorted_transfers:
             if len(final_suggestions) >= num_suggestions:
                 break
             
-            p_out_id = transfer['player_out']['id']
-            p_in_id = transfer['player_in']['id']
+            p_out_id = player_out['id']
 
             if p_out_id not in used_player_ids and p_in_id not in used_player_ids:
-                final_suggestions.append(transfer)
+                final_suggestions.append({
+                    "player_out": player_out,
+                    "player_in": self._candidate(p_in_id),
+                    "score_gain": score_gain
+                })
                 used_player_ids.add(p_out_id)
                 used_player_ids.add(p_in_id)
 
-        # --- 4. Generate AI reasoning for the top suggestions ---
-        if reasoning_generator:
-            reasoning_tasks = [
-                reasoning_generator(suggestion['player_out'], suggestion['player_in'])
-                for suggestion in final_suggestions
-            ]
-            reasons = await asyncio.gather(*reasoning_tasks)
-            for i, reason in enumerate(reasons):
-                final_suggestions[i]['reason'] = reason
-                
         return final_suggestions
 
-    async def suggest_double_transfers(self, reasoning_generator=None):
+    def find_double_transfer(self):
         """
         Suggests the best 2-for-2 transfer by identifying poor-value players and finding
-        the optimal replacement pair that maximizes the entire squad's score.
+        the optimal replacement pair that maximizes the entire squad's score, or None.
+        Without reasons (see attach_double_transfer_reasoning); blocking, like find_transfers.
         """
-        print("\n--- Searching for Optimal Double Transfer ---")
-        
         # --- 1. Identify players with poor value (low score for their cost) ---
         squad_with_value = []
         for p in self.user_squad:
@@ -875,14 +1134,16 @@ class SquadAnalyzer:
         
         # Target the bottom 8 players by value for potential transfer
         poor_value_players = sorted(squad_with_value, key=lambda p: p['value'])[:8]
-        print(f"Identifying poor-value players to transfer out: {[p['web_name'] for p in poor_value_players]}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Poor-value players to transfer out: %s", [p['web_name'] for p in poor_value_players])
 
         best_double_transfer = None
         highest_gain = 0
 
         # --- 2. Iterate through pairs of poor-value players to find the best swap ---
         for p_out1, p_out2 in itertools.combinations(poor_value_players, 2):
-            
+            raise_if_cancelled(self.cancel_token)
+
             # --- 3. Determine the total budget freed up by selling these two players ---
             total_budget = p_out1['now_cost'] + p_out2['now_cost']
             
@@ -903,57 +1164,110 @@ class SquadAnalyzer:
             # This is the crucial step: instead of just finding one good player, we
             # find the best combination of two that fits the budget.
             
-            for c1 in sorted(candidates1, key=lambda p: p['ai_score'], reverse=True)[:10]: # Top 10 candidates
+            score = self._candidate_score
+            for c1 in sorted(candidates1, key=lambda p: score(p['id']), reverse=True)[:10]: # Top 10 candidates
                 remaining_budget = total_budget - c1['now_cost']
                 
                 # Find the best partner for c1 from the second list of candidates
                 best_partner = None
                 for c2 in candidates2:
                     if c2['id'] != c1['id'] and c2['now_cost'] <= remaining_budget:
-                        if best_partner is None or c2['ai_score'] > best_partner['ai_score']:
+                        if best_partner is None or score(c2['id']) > score(best_partner['id']):
                             best_partner = c2
                 
                 if best_partner:
-                    current_gain = (c1['ai_score'] + best_partner['ai_score']) - (p_out1['ai_score'] + p_out2['ai_score'])
+                    current_gain = (score(c1['id']) + score(best_partner['id'])) - (p_out1['ai_score'] + p_out2['ai_score'])
                     
                     if current_gain > highest_gain:
                         highest_gain = current_gain
-                        best_double_transfer = ([p_out1, p_out2], [c1, best_partner])
-                        print(f"  New best pair found: ({p_out1['web_name']}, {p_out2['web_name']}) -> ({c1['web_name']}, {best_partner['web_name']}) | Gain: +{highest_gain:.2f}")
+                        best_double_transfer = ([p_out1, p_out2], [c1['id'], best_partner['id']])
+                        logger.debug(
+                            "New best pair found: (%s, %s) -> (%s, %s) | Gain: +%.2f", p_out1['web_name'], p_out2['web_name'],
+                            self.records[c1['id']]['web_name'], self.records[best_partner['id']]['web_name'], highest_gain
+                        )
 
         if not best_double_transfer:
-            print("--- No beneficial double transfer found. ---")
+            logger.debug("No beneficial double transfer found.")
             return None
 
-        # --- 6. Final processing and reasoning generation ---
-        players_out, players_in = best_double_transfer
+        # --- 6. Final processing ---
+        players_out, players_in_ids = best_double_transfer
+        players_in = [self._candidate(player_id) for player_id in players_in_ids]
         
         # Attach fixture data for reasoning
         for p in players_out + players_in:
             p['upcoming_fixtures'] = self._get_upcoming_fixtures(p)
 
-        print(f"\nOptimal Double Transfer Found: ({players_out[0]['web_name']}, {players_out[1]['web_name']}) -> ({players_in[0]['web_name']}, {players_in[1]['web_name']})")
-        self._print_player_score_analysis(players_out[0])
-        self._print_player_score_analysis(players_out[1])
-        self._print_player_score_analysis(players_in[0])
-        self._print_player_score_analysis(players_in[1])
-        
-        reason = None
-        if reasoning_generator:
-            reasoning_tasks = [
-                reasoning_generator(p_out, p_in) 
-                for p_out, p_in in zip(players_out, players_in)
-            ]
-            reasons = await asyncio.gather(*reasoning_tasks)
-            reason = " & ".join(filter(None, reasons))
-            
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Optimal Double Transfer Found: (%s, %s) -> (%s, %s)", players_out[0]['web_name'],
+                players_out[1]['web_name'], players_in[0]['web_name'], players_in[1]['web_name']
+            )
+            for p in players_out + players_in:
+                self._log_player_score_analysis(p)
+        
         return {
             "players_out": players_out,
             "players_in": players_in,
             "score_gain": round(highest_gain, 2),
-            "reason": reason
+            "reason": None
         }
 
+    @staticmethod
+    def _apply_double_transfer_reasons(double_transfer, reasons):
+        """Joins the per-pair (reason, source) results into the double transfer's reason."""
+        double_transfer['reason'] = " & ".join(filter(None, (reason for reason, _ in reasons)))
+        double_transfer['reason_source'] = "+".join(dict.fromkeys(source for _, source in reasons))
+
+    async def attach_reasoning(self, transfers, reasoning_generator):
+        """
+        Fills in the reasons for the single transfers with one
+        `reasoning_generator(player_out, player_in)` call each, returning (reason, source).
+        """
+        raise_if_cancelled(self.cancel_token)
+        reasoning_tasks = [
+            reasoning_generator(transfer['player_out'], transfer['player_in'])
+            for transfer in transfers
+        ]
+        reasons = await self._gather_reasoning(reasoning_tasks)
+        for transfer, (reason, source) in zip(transfers, reasons):
+            transfer['reason'] = reason
+            transfer['reason_source'] = source
+
+    async def attach_double_transfer_reasoning(self, double_transfer, reasoning_generator):
+        """Like attach_reasoning, for the pairs of a double transfer (if any)."""
+        if not double_transfer:
+            return
+        raise_if_cancelled(self.cancel_token)
+        reasoning_tasks = [
+            reasoning_generator(p_out, p_in)
+            for p_out, p_in in zip(double_transfer['players_out'], double_transfer['players_in'])
+        ]
+        reasons = await self._gather_reasoning(reasoning_tasks)
+        self._apply_double_transfer_reasons(double_transfer, reasons)
+
+    async def attach_batch_reasoning(self, transfers, double_transfer, batch_reasoning_generator):
+        """
+        Fills in the reasons for the single transfers and the double transfer with
+        one call to `batch_reasoning_generator`, which takes a list of
+        (player_out, player_in) pairs and returns (reason, source) tuples in the
+        same order.
+        """
+        pairs = [(t['player_out'], t['player_in']) for t in transfers]
+        if double_transfer:
+            pairs.extend(zip(double_transfer['players_out'], double_transfer['players_in']))
+        if not pairs:
+            return
+
+        raise_if_cancelled(self.cancel_token)
+        reasons, = await self._gather_reasoning([batch_reasoning_generator(pairs)])
+
+        for transfer, (reason, source) in zip(transfers, reasons):
+            transfer['reason'] = reason
+            transfer['reason_source'] = source
+        if double_transfer:
+            self._apply_double_transfer_reasons(double_transfer, reasons[len(transfers):])
+
     def _get_squad_positions(self) -> Dict[str, int]:
         """Counts the number of players in each position in the squad."""
         return Counter(p['position_name'] for p in self.user_squad)
@@ -0,0 +1,370 @@
+import json
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from recording import FixtureBundle, normalize_url
+
+# Generates FPL-shaped datasets of any size (players, clubs, gameweeks) for
+# scale testing, and writes them as an upstream bundle that can be replayed
+# like a recording: bootstrap-static, the FPL fixture list and the PulseLive
+# fixture list the fixture difficulty map is built from.
+#
+#   python synthetic_data.py --players 10000 --teams 100 --gameweeks 50 --out bundles/synthetic-10k
+#   UPSTREAM_MODE=replay UPSTREAM_BUNDLE_DIR=bundles/synthetic-10k uvicorn main:app
+
+BOOTSTRAP_URL = "https://fantasy.premierleague.com/api/bootstrap-static/"
+FIXTURES_URL = "https://fantasy.premierleague.com/api/fixtures/"
+PULSELIVE_FIXTURES_URL = "https://footballapi.pulselive.com/football/fixtures?comps=1&page=0&pageSize=500&sort=asc&statuses=U,S"
+# As in main.py; credentials are stripped from bundle keys, so no API key is needed
+SPORTMONKS_API_URL = "https://api.sportmonks.com/v3/football"
+PREMIER_LEAGUE_ID = 8
+
+# Share of each position in a real squad list, and its price range (in 0.1m)
+POSITIONS = {
+    1: {"short": "GKP", "name": "Goalkeeper", "share": 0.11, "price": (40, 60)},
+    2: {"short": "DEF", "name": "Defender", "share": 0.34, "price": (40, 75)},
+    3: {"short": "MID", "name": "Midfielder", "share": 0.40, "price": (45, 140)},
+    4: {"short": "FWD", "name": "Forward", "share": 0.15, "price": (45, 150)},
+}
+PRICE_DISTRIBUTIONS = ("skewed", "uniform", "normal")
+SCORE_DISTRIBUTIONS = ("correlated", "independent", "heavy_tail")
+
+_PLACES = (
+    "Ashford", "Barrow", "Carlton", "Dunmore", "Easton", "Fairview", "Glenwood", "Harbour", "Ironbridge", "Kingsley",
+    "Lakeside", "Marston", "Northgate", "Oakham", "Pemberton", "Queensbury", "Riverside", "Stanmore", "Thornbury",
+    "Upton", "Westfield", "Yarrow", "Bramley", "Colbourne", "Dunstan", "Elmridge", "Foxley", "Greystone", "Hollins",
+    "Kestrel"
+)
+_CLUB_SUFFIXES = ("Rovers", "Athletic", "Town", "Wanderers", "Albion", "County", "Rangers", "Borough")
+_FIRST_NAMES = (
+    "Alex", "Ben", "Carlos", "Daniel", "Eli", "Felix", "Gabriel", "Hugo", "Ivan", "Jamal", "Kai", "Luca", "Mateo",
+    "Noah", "Oscar", "Pablo", "Rafael", "Sami", "Theo", "Victor", "Yusuf", "Zane"
+)
+_SYLLABLES = ("ba", "ker", "son", "mo", "ri", "lan", "ders", "ton", "vic", "el", "ga", "nu", "ro", "wen", "dor", "is")
+
+def _club_names(count: int, rng: random.Random) -> List[str]:
+    names = [f"{place} {suffix}" for suffix in _CLUB_SUFFIXES for place in _PLACES]
+    if count > len(names):
+        names += [f"{place} {suffix} {n}" for n in range(2, count // len(names) + 2)
+                  for suffix in _CLUB_SUFFIXES for place in _PLACES]
+    return rng.sample(names, count)
+
+def _short_names(names: List[str]) -> List[str]:
+    """Unique three-character codes, like the FPL's ARS, MCI, NFO."""
+    used = set()
+    codes = []
+    for name in names:
+        letters = "".join(ch for ch in name.upper() if ch.isalpha())
+        candidates = [letters[:3], letters[0] + letters[-2:]] + [letters[:2] + str(n) for n in range(10)]
+        candidates += [f"{letters[0]}{n:02d}" for n in range(100)]
+        code = next(c for c in candidates if c not in used)
+        used.add(code)
+        codes.append(code)
+    return codes
+
+def _surname(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+def _price(rng: random.Random, low: int, high: int, distribution: str) -> int:
+    if distribution == "uniform":
+        fraction = rng.random()
+    elif distribution == "normal":
+        fraction = min(1.0, max(0.0, rng.gauss(0.4, 0.18)))
+    else: # "skewed": most players near the floor, a few premium ones, as in the real game
+        fraction = rng.betavariate(1.3, 4.5)
+    # Prices move in steps of 0.5m
+    return int(round((low + fraction * (high - low)) / 5) * 5)
+
+def _quality(rng: random.Random, price_fraction: float, distribution: str) -> float:
+    """A 0-1 latent player quality that form, ICT and points are derived from."""
+    if distribution == "independent":
+        return rng.random()
+    if distribution == "heavy_tail":
+        return min(1.0, (rng.paretovariate(3.0) - 1) / 2)
+    return min(1.0, max(0.0, 0.65 * price_fraction + 0.35 * rng.random()))
+
+def _round_robin(team_ids: List[int], rounds: int) -> List[List[tuple]]:
+    """
+    Circle-method schedule: `rounds` gameweeks in which every team plays at
+    most once (one team rests when the count is odd). Each full cycle of
+    opponents is repeated with home and away swapped.
+    """
+    ids = list(team_ids) + ([None] if len(team_ids) % 2 else [])
+    n = len(ids)
+    schedule = []
+    for round_index in range(rounds):
+        cycle, position = divmod(round_index, n - 1)
+        rotated = [ids[0]] + ids[1:][-position:] + ids[1:][:-position] if position else list(ids)
+        matches = []
+        for i in range(n // 2):
+            home, away = rotated[i], rotated[n - 1 - i]
+            if home is None or away is None:
+                continue
+            if (cycle + i + position) % 2:
+                home, away = away, home
+            matches.append((home, away))
+        schedule.append(matches)
+    return schedule
+
+def _detail_responses(rng: random.Random, elements, fixtures, events, detail_players: int) -> Dict[str, Any]:
+    """
+    Upstream responses behind the player details view for the first
+    `detail_players` players: SportMonks search, seasons and stats, and the
+    FPL fixtures and live stats of every finished gameweek.
+    """
+    responses = {}
+    seasons = [
+        {"id": 25583, "name": "2025/2026", "is_current": True},
+        {"id": 23614, "name": "2024/2025", "is_current": False},
+        {"id": 21646, "name": "2023/2024", "is_current": False},
+    ]
+    responses[f"{SPORTMONKS_API_URL}/leagues/{PREMIER_LEAGUE_ID}?api_token=&include=seasons"] = {
+        "data": {"id": PREMIER_LEAGUE_ID, "name": "Premier League", "seasons": seasons}
+    }
+    season_ids = ",".join(str(season["id"]) for season in seasons[:2])
+    includes = "statistics.details.type;statistics.season.league"
+
+    detailed = elements[:detail_players]
+    for element in detailed:
+        sportmonks_id = 900000 + element["id"]
+        full_name = f"{element['first_name']} {element['second_name']}"
+        sm_player = {
+            "id": sportmonks_id, "name": full_name, "common_name": element["web_name"],
+            "firstname": element["first_name"], "lastname": element["second_name"], "display_name": full_name
+        }
+        responses[f"{SPORTMONKS_API_URL}/players/search/{full_name}?api_token=&include=teams.team"] = {"data": [sm_player]}
+        statistics = []
+        for season in seasons[:2]:
+            appearances = rng.randint(0, 38)
+            statistics.append({
+                "season_id": season["id"],
+                "season": {"id": season["id"], "name": season["name"], "league": {"id": PREMIER_LEAGUE_ID, "name": "Premier League"}},
+                "details": [
+                    {"type": {"name": "Appearances"}, "value": {"total": appearances}},
+                    {"type": {"name": "Minutes Played"}, "value": {"total": appearances * rng.randint(20, 90)}},
+                    {"type": {"name": "Goals"}, "value": {"total": rng.randint(0, appearances // 3 + 1)}},
+                    {"type": {"name": "Assists"}, "value": {"total": rng.randint(0, appearances // 4 + 1)}},
+                ]
+            })
+        responses[f"{SPORTMONKS_API_URL}/players/{sportmonks_id}?api_token=&include={includes}&filters=playerStatisticSeasons:{season_ids}"] = {
+            "data": dict(sm_player, statistics=statistics)
+        }
+
+    fixture_by_team_gw = {}
+    for fixture in fixtures:
+        fixture_by_team_gw[(fixture["team_h"], fixture["event"])] = fixture
+        fixture_by_team_gw[(fixture["team_a"], fixture["event"])] = fixture
+    for event in events:
+        if not event["finished"]:
+            continue
+        gw = event["id"]
+        responses[f"https://fantasy.premierleague.com/api/fixtures/?event={gw}"] = [f for f in fixtures if f["event"] == gw]
+        live = []
+        for element in detailed:
+            fixture = fixture_by_team_gw.get((element["team"], gw))
+            if fixture is None:
+                continue
+            minutes = rng.choice([0, 25, 60, 90, 90, 90])
+            goals, assists = rng.choices([0, 1, 2], weights=[80, 17, 3])[0], rng.choices([0, 1], weights=[85, 15])[0]
+            live.append({
+                "id": element["id"],
+                "stats": {
+                    "minutes": minutes, "goals_scored": goals if minutes else 0, "assists": assists if minutes else 0,
+                    "clean_sheets": int(minutes >= 60 and rng.random() < 0.3), "bonus": rng.choice([0, 0, 0, 1, 2, 3]),
+                    "bps": rng.randint(0, 40), "ict_index": f"{rng.uniform(0, 15):.1f}",
+                    "total_points": (2 if minutes >= 60 else int(minutes > 0)) + 4 * goals + 3 * assists
+                },
+                "explain": [{"fixture": fixture["id"], "stats": []}]
+            })
+        responses[f"https://fantasy.premierleague.com/api/event/{gw}/live/"] = {"elements": live}
+    return responses
+
+def generate_dataset(players=700, teams=20, gameweeks=38, current_gameweek=None, seed=0,
+                     price_distribution="skewed", score_distribution="correlated", detail_players=200) -> Dict[str, Any]:
+    """
+    Builds a synthetic dataset shaped like the upstream payloads.
+    - players, teams, gameweeks: Dataset size. Every team gets enough players
+      per position to field a squad, so `players` must be at least 15 per team.
+    - current_gameweek: The next gameweek to be played (default: about a fifth
+      into the season); earlier gameweeks are finished.
+    - price_distribution: "skewed" (like the real game), "uniform" or "normal".
+    - score_distribution: How form, ICT and points relate to price:
+      "correlated", "independent" or "heavy_tail".
+    - detail_players: How many players (the lowest ids) get player details
+      data: SportMonks records and live stats for the finished gameweeks.
+    Returns {"bootstrap": ..., "fixtures": ..., "pulselive_fixtures": ..., "details": {url: payload}}.
+    """
+    if players < 15 * teams:
+        raise ValueError(f"{players} players cannot fill {teams} squads; need at least {15 * teams}.")
+    if teams < 2 or gameweeks < 1:
+        raise ValueError("Need at least 2 teams and 1 gameweek.")
+    if price_distribution not in PRICE_DISTRIBUTIONS or score_distribution not in SCORE_DISTRIBUTIONS:
+        raise ValueError(f"Distributions must be one of {PRICE_DISTRIBUTIONS} and {SCORE_DISTRIBUTIONS}.")
+    current_gameweek = min(gameweeks, max(1, current_gameweek or gameweeks // 5 + 1))
+    rng = random.Random(seed)
+
+    # --- Teams ---
+    names = _club_names(teams, rng)
+    team_list = []
+    for team_id, (name, short_name) in enumerate(zip(names, _short_names(names)), start=1):
+        strength = rng.randint(1, 5)
+        home = 1000 + strength * 60 + rng.randint(-30, 30)
+        away = home + rng.randint(-40, 20)
+        team_list.append({
+            "id": team_id, "code": 100 + team_id, "name": name, "short_name": short_name, "strength": strength,
+            "strength_overall_home": home, "strength_overall_away": away,
+            "strength_attack_home": home + rng.randint(-50, 50), "strength_attack_away": away + rng.randint(-50, 50),
+            "strength_defence_home": home + rng.randint(-50, 50), "strength_defence_away": away + rng.randint(-50, 50),
+            "played": 0, "win": 0, "draw": 0, "loss": 0, "points": 0, "position": 0
+        })
+
+    # --- Players ---
+    # Each team first gets a full squad's worth of every position, the rest is spread by position share
+    element_types = []
+    for pos_id, pos in POSITIONS.items():
+        element_types.append({
+            "id": pos_id, "singular_name": pos["name"], "singular_name_short": pos["short"],
+            "plural_name_short": pos["short"], "squad_select": {1: 2, 2: 5, 3: 5, 4: 3}[pos_id]
+        })
+    slots = [(team["id"], pos_id) for team in team_list for pos_id, count in ((1, 2), (2, 5), (3, 5), (4, 3))
+             for _ in range(count)]
+    shares = [POSITIONS[p]["share"] for p in POSITIONS]
+    slots += [(team_list[i % teams]["id"], rng.choices(list(POSITIONS), weights=shares)[0])
+              for i in range(players - len(slots))]
+
+    finished_gameweeks = current_gameweek - 1
+    elements = []
+    for player_id, (team_id, pos_id) in enumerate(slots, start=1):
+        low, high = POSITIONS[pos_id]["price"]
+        now_cost = _price(rng, low, high, price_distribution)
+        quality = _quality(rng, (now_cost - low) / (high - low), score_distribution)
+        minutes = int(finished_gameweeks * 90 * min(1.0, quality * 1.5) * rng.uniform(0.5, 1.0))
+        points_per_game = round(max(0.0, quality * 7 + rng.gauss(0, 0.8)), 1)
+        status = rng.choices(["a", "d", "i", "u"], weights=[88, 5, 6, 1])[0]
+        first_name, surname = rng.choice(_FIRST_NAMES), _surname(rng)
+        elements.append({
+            "id": player_id,
+            "code": 400000 + player_id,
+            "first_name": first_name,
+            "second_name": surname,
+            "web_name": surname,
+            "team": team_id,
+            "team_code": 100 + team_id,
+            "element_type": pos_id,
+            "now_cost": now_cost,
+            "status": status,
+            "chance_of_playing_next_round": None if status == "a" else rng.choice([0, 25, 50, 75]),
+            "form": f"{max(0.0, quality * 8 + rng.gauss(0, 1.2)):.1f}",
+            "ict_index": f"{max(0.0, quality * 40 * max(finished_gameweeks, 1) * rng.uniform(0.6, 1.1)):.1f}",
+            "points_per_game": f"{points_per_game:.1f}",
+            "total_points": int(points_per_game * minutes / 90),
+            "minutes": minutes,
+            "goals_scored": int(quality * rng.uniform(0, 1) * finished_gameweeks * (pos_id - 1) * 0.25),
+            "assists": int(quality * rng.uniform(0, 1) * finished_gameweeks * 0.2),
+            "selected_by_percent": f"{min(100.0, quality ** 3 * 60 * rng.random()):.1f}"
+        })
+
+    # --- Gameweeks and fixtures ---
+    season_start = datetime(2025, 8, 15, 17, 30, tzinfo=timezone.utc)
+    events = []
+    for gw in range(1, gameweeks + 1):
+        deadline = season_start + timedelta(days=7 * (gw - 1))
+        events.append({
+            "id": gw, "name": f"Gameweek {gw}", "deadline_time": deadline.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "is_previous": gw == current_gameweek - 2, "is_current": gw == current_gameweek - 1,
+            "is_next": gw == current_gameweek, "finished": gw < current_gameweek, "data_checked": gw < current_gameweek
+        })
+
+    teams_by_id = {team["id"]: team for team in team_list}
+    strengths = [team["strength"] for team in team_list]
+
+    def difficulty(opponent_id):
+        return min(5, max(2, round(1 + 4 * (teams_by_id[opponent_id]["strength"] - min(strengths)) /
+                                   max(1, max(strengths) - min(strengths)))))
+
+    fixtures = []
+    pulselive_fixtures = []
+    for gw, matches in enumerate(_round_robin([team["id"] for team in team_list], gameweeks), start=1):
+        kickoff = (season_start + timedelta(days=7 * (gw - 1) + 1, hours=-2.5)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        finished = gw < current_gameweek
+        for home, away in matches:
+            fixture_id = len(fixtures) + 1
+            fixtures.append({
+                "id": fixture_id, "code": 2500000 + fixture_id, "event": gw, "kickoff_time": kickoff,
+                "team_h": home, "team_a": away,
+                "team_h_difficulty": difficulty(away), "team_a_difficulty": difficulty(home),
+                "team_h_score": rng.randint(0, 4) if finished else None,
+                "team_a_score": rng.randint(0, 3) if finished else None,
+                "started": finished, "finished": finished, "finished_provisional": finished, "minutes": 90 if finished else 0
+            })
+            if not finished:
+                # PulseLive spells some club names differently (e.g. a trailing "FC")
+                pulselive_fixtures.append({
+                    "id": 100000 + fixture_id,
+                    "gameweek": {"gameweek": gw},
+                    "kickoff": {"label": kickoff},
+                    "status": "U",
+                    "teams": [
+                        {"team": {"name": teams_by_id[home]["name"] + (" FC" if home % 3 == 0 else "")}},
+                        {"team": {"name": teams_by_id[away]["name"] + (" FC" if away % 3 == 0 else "")}}
+                    ]
+                })
+
+    bootstrap = {"events": events, "teams": team_list, "elements": elements, "element_types": element_types,
+                 "total_players": players}
+    details = _detail_responses(rng, elements, fixtures, events, detail_players)
+    return {"bootstrap": bootstrap, "fixtures": fixtures, "pulselive_fixtures": pulselive_fixtures, "details": details}
+
+def write_bundle(path: str, dataset: Dict[str, Any], label: str = None, params: Dict[str, Any] = None) -> FixtureBundle:
+    """
+    Writes `dataset` as a replayable upstream bundle: the responses the snapshot
+    loader, fixture service and player details view request. The PulseLive
+    response holds every upcoming fixture in one page, however large the dataset.
+    """
+    bundle = FixtureBundle(path, label=label)
+    bundle.manifest["synthetic"] = params or {}
+    responses = (
+        (BOOTSTRAP_URL, dataset["bootstrap"]),
+        (FIXTURES_URL, dataset["fixtures"]),
+        (PULSELIVE_FIXTURES_URL, {"content": dataset["pulselive_fixtures"], "pageInfo": {"page": 0, "numPages": 1}}),
+    ) + tuple(dataset["details"].items())
+    for url, payload in responses:
+        normalized = normalize_url(url)
+        bundle.put(FixtureBundle.key("GET", normalized), {
+            "kind": "http",
+            "request": f"GET {normalized}",
+            "status": 200,
+            "headers": {"Content-Type": "application/json"},
+            "elapsed_ms": 0
+        }, json.dumps(payload).encode("utf-8"), save=False)
+    bundle.save()
+    return bundle
+
+def generate_bundle(path: str, **params) -> FixtureBundle:
+    """Generates a dataset (see generate_dataset for `params`) straight into a bundle at `path`."""
+    dataset = generate_dataset(**params)
+    label = f"synthetic-{params.get('players', 700)}p-{params.get('teams', 20)}t-{params.get('gameweeks', 38)}gw"
+    return write_bundle(path, dataset, label=label, params=params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic FPL dataset as a replayable upstream bundle.")
+    parser.add_argument("--out", required=True, help="Bundle directory to write.")
+    parser.add_argument("--players", type=int, default=700)
+    parser.add_argument("--teams", type=int, default=20)
+    parser.add_argument("--gameweeks", type=int, default=38)
+    parser.add_argument("--current-gameweek", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--price-distribution", choices=PRICE_DISTRIBUTIONS, default="skewed")
+    parser.add_argument("--score-distribution", choices=SCORE_DISTRIBUTIONS, default="correlated")
+    parser.add_argument("--detail-players", type=int, default=200,
+                        help="Players (lowest ids) with data for /api/player/{id} (default: 200).")
+    args = parser.parse_args()
+
+    bundle = generate_bundle(
+        args.out, players=args.players, teams=args.teams, gameweeks=args.gameweeks,
+        current_gameweek=args.current_gameweek, seed=args.seed,
+        price_distribution=args.price_distribution, score_distribution=args.score_distribution,
+        detail_players=args.detail_players
+    )
+    print(f"Wrote {bundle.manifest['label']} to {args.out}.")
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from synthetic_data import generate_bundle
+
+# The app is imported fully offline: upstream responses are replayed from a small
+# synthetic bundle, reasons come from the stub chat client and nothing runs in the
+# background. This has to happen before the first `import main`.
+DATA_DIR = tempfile.mkdtemp(prefix="fpl-coach-tests-")
+BUNDLE_DIR = os.path.join(DATA_DIR, "bundle")
+generate_bundle(BUNDLE_DIR, players=300, teams=20, seed=0, detail_players=20)
+os.environ.update({
+    "UPSTREAM_MODE": "replay",
+    "UPSTREAM_BUNDLE_DIR": BUNDLE_DIR,
+    "REASONING_CLIENT": "stub",
+    "PREWARM_ON_STARTUP": "0",
+    "SNAPSHOT_REFRESHER": "0",
+    "ANALYSIS_STORE_PATH": os.path.join(DATA_DIR, "analysis_results.sqlite3"),
+    "DETAILS_CACHE_PATH": os.path.join(DATA_DIR, "player_details_cache.sqlite3"),
+    "RANDOM_SEED": "1",
+    "LOG_LEVEL": "WARNING",
+})
+for name in ("REASONING_CACHE_PATH", "SNAPSHOT_SHARED_PATH", "PRECOMPUTED_DIR"):
+    os.environ.pop(name, None)
+
+@pytest.fixture(scope="session")
+def main_module():
+    import main
+    return main
+
+@pytest.fixture
+def app(main_module, monkeypatch):
+    """The app module with a fresh reasoning cache and stub chat client for each test."""
+    from reasoning import ReasoningCache, StubChatClient
+    monkeypatch.setattr(main_module, "reasoning_cache", ReasoningCache())
+    monkeypatch.setattr(main_module, "client", StubChatClient())
+    return main_module
+
+def make_player(player_id, **fields):
+    """A minimal player dict with the fields the reasoning prompts and templates read."""
+    player = {
+        "id": player_id, "web_name": f"Player {player_id}", "team": 1, "position_name": "MID",
+        "now_cost": 60, "form": "4.0", "points_per_game": "4.5", "ict_index": "50.0",
+        "total_points": 40, "minutes": 900, "ai_score": 10.0, "upcoming_fixtures": []
+    }
+    player.update(fields)
+    return player
+
+def make_squad(players, skip=0):
+    """
+    A valid 15-player squad of the cheapest players per position (after skipping
+    the `skip` cheapest), at most three per team, as plain dicts like the API receives.
+    """
+    from collections import Counter
+    from snapshot import player_to_dict
+    from squad_builder import SQUAD_RULES
+
+    squad, team_counts = [], Counter()
+    for position, count in SQUAD_RULES["POSITIONS"].items():
+        candidates = sorted((p for p in players if p['position_name'] == position), key=lambda p: (p['now_cost'], p['id']))
+        picked = 0
+        for player in candidates[skip:]:
+            if picked == count:
+                break
+            if team_counts[player['team']] < SQUAD_RULES["PLAYERS_PER_TEAM"]:
+                squad.append(player_to_dict(player))
+                team_counts[player['team']] += 1
+                picked += 1
+    return squad
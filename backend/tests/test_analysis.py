@@ -0,0 +1,96 @@
+import asyncio
+import json
+import time
+from fastapi import Response
+from starlette.requests import Request
+from conftest import make_squad
+from squad_builder import SquadAnalyzer
+
+def disconnecting_request(path):
+    """A request whose client stays connected until `disconnect()` is called on it."""
+    state = {"disconnected": False}
+
+    async def receive():
+        if state["disconnected"]:
+            return {"type": "http.disconnect"}
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    request = Request({
+        "type": "http", "method": "POST", "path": path, "headers": [], "query_string": b""
+    }, receive)
+    request.disconnect = lambda: state.update(disconnected=True)
+    return request
+
+def test_disconnect_cancels_transfer_search(app, monkeypatch):
+    snapshot = app.get_snapshot()
+    squad = app.Squad(squad=make_squad(snapshot.players, skip=3))
+    request = disconnecting_request("/api/analyze-squad")
+    searched = []
+    find_potential_replacements = SquadAnalyzer._find_potential_replacements
+
+    def slow_find_potential_replacements(self, *args):
+        # The client goes away during the first candidate search; every search
+        # then outlasts the watcher's poll interval
+        searched.append(args[0]['id'])
+        request.disconnect()
+        time.sleep(0.3)
+        return find_potential_replacements(self, *args)
+
+    monkeypatch.setattr(SquadAnalyzer, "_find_potential_replacements", slow_find_potential_replacements)
+
+    response = asyncio.run(app.analyze_squad_endpoint(squad, request, Response()))
+
+    assert response.status_code == app.CLIENT_CLOSED_REQUEST
+    # Cancelled within the single-transfer stage instead of after searching all 15 players
+    assert 1 <= len(searched) <= 2
+
+def test_forked_analyzer_does_not_share_writes(app):
+    snapshot = app.get_snapshot()
+    analyzer = app.create_analyzer(make_squad(snapshot.players))
+    forked = analyzer.fork()
+
+    forked.user_squad[0]['ai_score'] = -1.0
+    analyzer.user_squad[1]['upcoming_fixtures'] = ["sentinel"]
+    forked._candidate_score(snapshot.players[0]['id'])
+
+    assert analyzer.user_squad[0]['ai_score'] != -1.0
+    assert forked.user_squad[1]['upcoming_fixtures'] != ["sentinel"]
+    assert snapshot.players[0]['id'] not in analyzer.scores
+    assert forked.user_squad[2] == analyzer.user_squad[2]
+
+def test_stream_matches_analysis(app):
+    from fastapi.testclient import TestClient
+    snapshot = app.get_snapshot()
+    squad = make_squad(snapshot.players, skip=1)
+
+    with TestClient(app.app) as client:
+        events = [json.loads(line) for line in client.post("/api/analyze-squad/stream", json={"squad": squad}).text.splitlines()]
+        # The stream stored its analysis; this one is recomputed for comparison
+        analysis = client.post("/api/analyze-squad", json={"squad": squad, "bank": 0.0}).json()
+
+    assert [e["event"] for e in events] == (
+        ["captain", "transfers"] + ["transfer_reason"] * len(analysis["suggested_transfers"]) + ["double_transfer", "chip", "done"]
+    )
+    streamed = {e["event"]: e for e in events}
+    assert streamed["captain"]["captain_suggestion"]["id"] == analysis["captain_suggestion"]["id"]
+    assert [
+        (t["player_out"]["id"], t["player_in"]["id"], t["score_gain"]) for t in streamed["transfers"]["suggested_transfers"]
+    ] == [(t["player_out"]["id"], t["player_in"]["id"], t["score_gain"]) for t in analysis["suggested_transfers"]]
+    assert streamed["double_transfer"]["double_transfer_suggestion"]["score_gain"] == analysis["double_transfer_suggestion"]["score_gain"]
+
+def test_per_call_reasoning_fills_every_reason(app, monkeypatch):
+    from fastapi.testclient import TestClient
+    snapshot = app.get_snapshot()
+    squads = [make_squad(snapshot.players, skip=skip) for skip in (6, 7)]
+
+    with TestClient(app.app) as client:
+        batch = client.post("/api/analyze-squad", json={"squad": squads[0]}).json()
+        monkeypatch.setattr(app, "REASONING_MODE", "per-call")
+        per_call = client.post("/api/analyze-squad", json={"squad": squads[1]}).json()
+
+    for analysis in (batch, per_call):
+        # Pairs shared by both squads come from the reasoning cache the second time
+        assert {t["reason_source"] for t in analysis["suggested_transfers"]} <= {"llm", "cache"}
+        if analysis["double_transfer_suggestion"]:
+            assert set(analysis["double_transfer_suggestion"]["reason_source"].split("+")) <= {"llm", "cache"}
+    assert any(call["response_format"] is None for call in app.client.calls)
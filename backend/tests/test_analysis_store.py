@@ -0,0 +1,98 @@
+from fastapi.testclient import TestClient
+from analysis_store import AnalysisStore, squad_fingerprint
+from bulk_analysis import has_final_reasons, storable_analysis
+from conftest import make_squad
+from reasoning import StubChatClient
+
+# --- squad_fingerprint ---
+
+def test_fingerprint_ignores_player_order():
+    assert squad_fingerprint([3, 1, 2]) == squad_fingerprint([1, 2, 3])
+
+def test_fingerprint_accepts_numeric_strings():
+    assert squad_fingerprint(["1", "2", "3"]) == squad_fingerprint([1, 2, 3])
+
+def test_fingerprint_depends_on_players():
+    assert squad_fingerprint([1, 2, 3]) != squad_fingerprint([1, 2, 4])
+    assert squad_fingerprint([1, 2]) != squad_fingerprint([12])
+
+def test_fingerprint_rounds_bank_to_a_tenth():
+    assert squad_fingerprint([1, 2], 0.5) == squad_fingerprint([1, 2], 0.54)
+    assert squad_fingerprint([1, 2], 0.5) != squad_fingerprint([1, 2], 0.6)
+
+def test_fingerprint_distinguishes_unknown_bank():
+    assert squad_fingerprint([1, 2], None) != squad_fingerprint([1, 2], 0.0)
+
+# --- AnalysisStore ---
+
+def test_store_keeps_recent_versions(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analyses.sqlite3"), max_versions=2)
+    store.put("squad", "v1", {"n": 1})
+    store.put("squad", "v2", {"n": 2})
+    assert store.get("squad", "v1") == {"n": 1}
+    store.put("squad", "v3", {"n": 3})
+    assert store.get("squad", "v1") is None
+    assert store.get("squad", "v2") == {"n": 2}
+    assert store.get("other", "v3") is None
+
+def test_store_caps_entries(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analyses.sqlite3"), max_entries=2, evict_every=1)
+    for name in ("a", "b", "c"):
+        store.put(name, "v1", name)
+    assert [store.get(name, "v1") for name in ("a", "b", "c")] == [None, "b", "c"]
+
+def test_store_trims_overflow_every_few_puts(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analyses.sqlite3"), max_entries=2, evict_every=3)
+    for name in ("a", "b", "c", "d"):
+        store.put(name, "v1", name)
+    # Trimmed on the third put only
+    assert [store.get(name, "v1") for name in ("a", "b", "c", "d")] == [None, "b", "c", "d"]
+    store.evict()
+    assert [store.get(name, "v1") for name in ("b", "c", "d")] == [None, "c", "d"]
+
+# --- Reasons in stored analyses ---
+
+def make_analysis(*sources, double_source=None):
+    transfers = [{"player_out": {}, "player_in": {}, "score_gain": 1.0, "reason": f"Reason {i}.", "reason_source": source}
+                 for i, source in enumerate(sources)]
+    double_transfer = {"players_out": [], "players_in": [], "score_gain": 2.0, "reason": "Both.",
+                       "reason_source": double_source} if double_source else None
+    return {"suggested_transfers": transfers, "double_transfer_suggestion": double_transfer}
+
+def test_final_reasons_come_from_llm_or_cache():
+    assert has_final_reasons(make_analysis("llm", "cache", double_source="llm+cache"))
+    assert has_final_reasons(make_analysis())
+    assert not has_final_reasons(make_analysis("llm", "template"))
+    assert not has_final_reasons(make_analysis("llm", double_source="llm+template"))
+    assert not has_final_reasons(make_analysis(None))
+
+def test_storable_analysis_drops_template_reasons():
+    analysis = make_analysis("llm", "template", double_source="cache+template")
+    stored = storable_analysis(analysis)
+
+    assert [(t["reason"], t["reason_source"]) for t in stored["suggested_transfers"]] == [("Reason 0.", "llm"), (None, None)]
+    assert stored["double_transfer_suggestion"]["reason"] is None
+    # The response itself keeps its reasons
+    assert analysis["suggested_transfers"][1]["reason_source"] == "template"
+
+def test_template_reasons_are_replaced_when_served(app):
+    squad = make_squad(app.get_snapshot().players, skip=5)
+    app.client = StubChatClient(fail=True)
+
+    with TestClient(app.app) as client:
+        first = client.post("/api/analyze-squad", json={"squad": squad})
+        key, stored = app.find_stored_analysis(app.Squad(squad=squad))
+
+        app.client = StubChatClient()
+        second = client.post("/api/analyze-squad", json={"squad": squad})
+        _, restored = app.find_stored_analysis(app.Squad(squad=squad))
+
+    assert first.headers["X-Analysis-Cache"] == "miss"
+    assert {t["reason_source"] for t in first.json()["suggested_transfers"]} == {"template"}
+    assert stored is not None
+    assert {t["reason"] for t in stored["suggested_transfers"]} == {None}
+
+    assert second.headers["X-Analysis-Cache"] == "hit"
+    assert {t["reason_source"] for t in second.json()["suggested_transfers"]} == {"llm"}
+    assert restored == second.json()
+    assert has_final_reasons(restored)
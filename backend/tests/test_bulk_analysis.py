@@ -0,0 +1,87 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from conftest import make_squad
+from bulk_analysis import analyze_squad
+from squad_builder import AnalysisContext
+
+@pytest.fixture
+def bulk_app(app, monkeypatch):
+    """The app analyzing bulk requests on a single in-process worker, with no shared context or pools left over."""
+    monkeypatch.setattr(app, "BULK_ANALYSIS_WORKERS", 1)
+    monkeypatch.setattr(app, "analysis_context_cache", {})
+    yield app
+    app.close_bulk_analyzers()
+
+def test_concurrent_requests_build_the_context_once(bulk_app, monkeypatch):
+    snapshot = bulk_app.get_snapshot()
+    build = AnalysisContext.build
+    builds = []
+
+    def slow_build(*args, **kwargs):
+        builds.append(1)
+        time.sleep(0.1)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(AnalysisContext, "build", slow_build)
+    contexts = []
+    threads = [threading.Thread(target=lambda: contexts.append(bulk_app.get_analysis_context(snapshot))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert len(contexts) == 4
+    assert all(context is contexts[0] for context in contexts)
+
+def test_bulk_requests_share_one_pool_per_version(bulk_app, monkeypatch):
+    players = bulk_app.get_snapshot().players
+    started = []
+    start = bulk_app.BulkAnalyzer.start
+
+    def counting_start(self):
+        started.append(self)
+        return start(self)
+
+    monkeypatch.setattr(bulk_app.BulkAnalyzer, "start", counting_start)
+
+    with TestClient(bulk_app.app) as client:
+        for skip in (11, 12):
+            response = client.post("/api/analyze-squads", json={"squads": [{"squad": make_squad(players, skip=skip)}]})
+            events = [json.loads(line) for line in response.text.splitlines()]
+            assert [event["event"] for event in events] == ["result", "done"]
+
+    assert len(started) == 1
+
+def test_new_version_retires_the_previous_pool(bulk_app):
+    snapshot = bulk_app.get_snapshot()
+    first = bulk_app.get_bulk_analyzer(snapshot)
+    assert bulk_app.get_bulk_analyzer(snapshot) is first
+
+    future = first.submit(make_squad(snapshot.players, skip=13))
+    snapshot.version += "-next"
+    try:
+        second = bulk_app.get_bulk_analyzer(snapshot)
+    finally:
+        snapshot.version = snapshot.version[:-len("-next")]
+
+    assert second is not first
+    # Squads already submitted to the retired pool are still analyzed
+    assert future.result(timeout=30)["captain_suggestion"]
+
+def test_worker_analysis_runs_without_an_event_loop(bulk_app):
+    snapshot = bulk_app.get_snapshot()
+    context = bulk_app.get_analysis_context(snapshot)
+    squad = make_squad(snapshot.players, skip=14)
+
+    async def inside_a_running_loop():
+        # asyncio.run would refuse to start a second loop here
+        return analyze_squad(squad, snapshot.players, snapshot.fixture_difficulty_map, context)
+
+    analysis = asyncio.run(inside_a_running_loop())
+    assert analysis == analyze_squad(squad, snapshot.players, snapshot.fixture_difficulty_map, context)
+    assert analysis["suggested_transfers"]
@@ -0,0 +1,87 @@
+import random
+import pytest
+from player_index import PlayerIndex, QueryError, SORT_KEYS
+
+POSITIONS = ('GKP', 'DEF', 'MID', 'FWD')
+TEAMS = {team_id: {"id": team_id, "short_name": f"T{team_id:02d}", "name": f"Team {team_id}"} for team_id in range(1, 7)}
+
+@pytest.fixture(scope="module")
+def players():
+    rng = random.Random(3)
+    return [{
+        "id": player_id, "web_name": f"Player{rng.randint(1, 40)}", "position_name": rng.choice(POSITIONS),
+        "team": rng.choice(list(TEAMS)), "now_cost": rng.randrange(40, 130, 5), "total_points": rng.randint(0, 60),
+        "ai_score": round(rng.uniform(0, 10), 1), "form": round(rng.uniform(0, 8), 1),
+        "points_per_game": round(rng.uniform(0, 6), 1), "ict_index": round(rng.uniform(0, 200), 1),
+        "minutes": rng.choice((0, 90, 450, 900)), "status": rng.choice("aaaadi")
+    } for player_id in range(1, 241)]
+
+@pytest.fixture(scope="module")
+def index(players):
+    return PlayerIndex(players, TEAMS)
+
+def expected(players, position=None, team=None, min_cost=None, max_cost=None, statuses=None, min_ai_score=None,
+             sort='total_points', descending=True):
+    """Reference result: filter everything, then sort."""
+    matches = [
+        p for p in players
+        if (position is None or p['position_name'] == position) and (team is None or p['team'] == team)
+        and (min_cost is None or p['now_cost'] >= min_cost) and (max_cost is None or p['now_cost'] <= max_cost)
+        and (not statuses or p['status'] in statuses) and (min_ai_score is None or p['ai_score'] >= min_ai_score)
+    ]
+    return sorted(matches, key=lambda p: (p[sort], p['id']), reverse=descending)
+
+def all_pages(index, limit, **params):
+    """Follows next_cursor to the end, returning every page's players and the totals reported."""
+    players, totals, cursor = [], set(), None
+    while True:
+        result = index.query(limit=limit, cursor=cursor, **params)
+        players.extend(result["players"])
+        totals.add(result["total"])
+        cursor = result["next_cursor"]
+        if cursor is None:
+            return players, totals
+
+@pytest.mark.parametrize("sort", SORT_KEYS)
+@pytest.mark.parametrize("descending", (True, False))
+def test_query_pages_match_filter_then_sort(players, index, sort, descending):
+    rng = random.Random(sort)
+    for _ in range(15):
+        filters = {
+            "position": rng.choice((None,) + POSITIONS),
+            "team": rng.choice((None, None, 2, 5)),
+            "min_cost": rng.choice((None, 50, 75)),
+            "max_cost": rng.choice((None, 90, 120)),
+            "statuses": rng.choice((None, ["a"], ["d", "i"])),
+            "min_ai_score": rng.choice((None, 2.5, 7.0)),
+        }
+        want = expected(players, sort=sort, descending=descending, **filters)
+        query = dict(filters, team=str(filters["team"]) if filters["team"] is not None else None)
+
+        got, totals = all_pages(index, rng.choice((1, 7, 50)), sort=sort, descending=descending, **query)
+
+        assert [p['id'] for p in got] == [p['id'] for p in want]
+        assert totals == {len(want)}
+
+def test_query_resolves_team_aliases(players, index):
+    by_id = index.query(team="3", limit=200)["players"]
+    assert by_id == index.query(team="t03", limit=200)["players"] == index.query(team="Team 3", limit=200)["players"]
+    assert {p['team'] for p in by_id} == {3}
+
+def test_query_rejects_invalid_parameters(index):
+    with pytest.raises(QueryError):
+        index.query(sort="price")
+    with pytest.raises(QueryError):
+        index.query(team="Nowhere FC")
+    with pytest.raises(QueryError):
+        index.query(cursor="not a cursor")
+    cursor = index.query(sort="web_name", limit=1)["next_cursor"]
+    with pytest.raises(QueryError):
+        index.query(sort="total_points", cursor=cursor)
+
+def test_unknown_position_matches_nothing(index):
+    assert index.query(position="GK") == {"total": 0, "players": [], "next_cursor": None}
+
+def test_price_range(players, index):
+    got = index.price_range("DEF", 60, 80)
+    assert [p['id'] for p in got] == [p['id'] for p in expected(players, "DEF", min_cost=60, max_cost=80, sort='now_cost', descending=False)]
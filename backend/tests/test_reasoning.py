@@ -0,0 +1,184 @@
+import asyncio
+import json
+import pytest
+from conftest import make_player
+from reasoning import (
+    ReasoningCache, StubChatClient, batch_key, parse_batch_response, reasoning_cache_key,
+    SOURCE_LLM, SOURCE_CACHE, SOURCE_TEMPLATE
+)
+
+KEYS = [batch_key(i) for i in range(3)]
+
+def make_pairs(count):
+    return [(make_player(2 * i + 1), make_player(2 * i + 2)) for i in range(count)]
+
+# --- parse_batch_response ---
+
+def test_parse_batch_response_reads_every_key():
+    content = json.dumps({"t1": "First.", "t2": "Second.", "t3": "Third."})
+    assert parse_batch_response(content, KEYS) == {"t1": "First.", "t2": "Second.", "t3": "Third."}
+
+def test_parse_batch_response_strips_code_fence():
+    content = "```json\n" + json.dumps({"t1": " First. "}) + "\n```"
+    assert parse_batch_response(content, KEYS) == {"t1": "First."}
+
+def test_parse_batch_response_malformed_json_returns_nothing():
+    assert parse_batch_response('{"t1": "First.", "t2": ', KEYS) == {}
+    assert parse_batch_response("Sorry, I can't help with that.", KEYS) == {}
+    assert parse_batch_response("", KEYS) == {}
+    assert parse_batch_response(None, KEYS) == {}
+
+def test_parse_batch_response_non_object_returns_nothing():
+    assert parse_batch_response(json.dumps(["First.", "Second."]), KEYS) == {}
+    assert parse_batch_response(json.dumps("First."), KEYS) == {}
+
+def test_parse_batch_response_drops_unusable_items():
+    content = json.dumps({"t1": "First.", "t2": "   ", "t3": 42, "t9": "Unknown key."})
+    assert parse_batch_response(content, KEYS) == {"t1": "First."}
+
+# --- Batched reasoning with per-pair fallback ---
+
+def test_batch_reasoning_falls_back_per_pair(app):
+    app.client = StubChatClient(drop_keys=(batch_key(1),))
+    pairs = make_pairs(3)
+
+    results = asyncio.run(app.generate_batch_transfer_reasoning(pairs))
+
+    assert [source for _, source in results] == [SOURCE_LLM] * 3
+    assert all(reason for reason, _ in results)
+    # One batched completion, then one per-call completion for the dropped pair only
+    assert len(app.client.calls) == 2
+    assert app.client.calls[0]["response_format"] == {"type": "json_object"}
+    assert app.client.calls[1]["response_format"] is None
+    assert "Player 3" in app.client.calls[1]["messages"][-1]["content"]
+
+def test_batch_reasoning_uses_templates_when_client_fails(app):
+    app.client = StubChatClient(fail=True)
+
+    results = asyncio.run(app.generate_batch_transfer_reasoning(make_pairs(2)))
+
+    assert [source for _, source in results] == [SOURCE_TEMPLATE] * 2
+    assert app.reasoning_cache.stats()["entries"] == 0
+
+def test_batch_reasoning_counts_one_lookup_per_pair(app):
+    app.client = StubChatClient(drop_keys=(batch_key(1),))
+    pairs = make_pairs(3)
+
+    asyncio.run(app.generate_batch_transfer_reasoning(pairs))
+    assert (app.reasoning_cache.hits, app.reasoning_cache.misses) == (0, 3)
+
+    results = asyncio.run(app.generate_batch_transfer_reasoning(pairs))
+    assert [source for _, source in results] == [SOURCE_CACHE] * 3
+    assert (app.reasoning_cache.hits, app.reasoning_cache.misses) == (3, 3)
+    assert len(app.client.calls) == 2
+
+# --- ReasoningCache ---
+
+def test_cache_counts_hits_and_misses():
+    cache = ReasoningCache()
+    calls = []
+
+    async def producer():
+        calls.append(1)
+        return "Reason.", 10
+
+    async def run():
+        first = await cache.get_or_create("k", producer)
+        second = await cache.get_or_create("k", producer)
+        return first, second
+
+    assert asyncio.run(run()) == (("Reason.", False), ("Reason.", True))
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses, cache.shared) == (1, 1, 0)
+    assert cache.tokens_saved == 10
+    assert cache.get("k") == "Reason."
+    assert cache.get("other") is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+def test_cache_shares_in_flight_requests():
+    cache = ReasoningCache()
+    calls = []
+
+    async def producer():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "Reason.", 10
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_create("k", producer) for _ in range(5)])
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert results[0] == ("Reason.", False)
+    assert results[1:] == [("Reason.", True)] * 4
+    assert (cache.hits, cache.misses, cache.shared) == (0, 1, 4)
+
+def test_cache_does_not_keep_failures():
+    cache = ReasoningCache()
+
+    async def failing():
+        raise RuntimeError("LLM unavailable")
+
+    async def producer():
+        return "Reason.", 1
+
+    async def run():
+        try:
+            await cache.get_or_create("k", failing)
+        except RuntimeError:
+            pass
+        return await cache.get_or_create("k", producer)
+
+    assert asyncio.run(run()) == ("Reason.", False)
+    assert cache.misses == 2
+
+def test_cache_lookup_not_counted_twice():
+    cache = ReasoningCache()
+
+    async def producer():
+        return "Reason.", 1
+
+    asyncio.run(cache.get_or_create("k", producer, count_lookup=False))
+    asyncio.run(cache.get_or_create("k", producer, count_lookup=False))
+
+    assert (cache.hits, cache.misses, cache.shared) == (0, 0, 0)
+
+def test_cache_expires_entries():
+    cache = ReasoningCache(ttl_seconds=0)
+    cache.put("k", "Reason.")
+    assert cache.get("k") is None
+
+def test_cache_persists_and_loads(tmp_path):
+    path = str(tmp_path / "reasoning_cache.json")
+    key = reasoning_cache_key(make_player(1), make_player(2))
+    cache = ReasoningCache(persist_path=path)
+    cache.put(key, "Reason.", tokens=5)
+    cache.put("v0:1:2:stale-prompt", "Old reason.")
+    cache.save()
+
+    loaded = ReasoningCache(persist_path=path)
+    assert loaded.get(key) == "Reason."
+    assert loaded.get("v0:1:2:stale-prompt") is None
+
+def test_cache_key_changes_with_prompt_inputs():
+    player_out, player_in = make_player(1), make_player(2)
+    key = reasoning_cache_key(player_out, player_in)
+
+    assert reasoning_cache_key(make_player(1), make_player(2)) == key
+    assert reasoning_cache_key(player_out, make_player(2, form="6.0")) != key
+    assert reasoning_cache_key(player_in, player_out) != key
+
+def test_cache_persists_off_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "reasoning_cache.json")
+    key = reasoning_cache_key(make_player(1), make_player(2))
+    cache = ReasoningCache(persist_path=path, persist_interval=0)
+    monkeypatch.setattr(cache, "save", lambda: pytest.fail("blocking save on the event loop"))
+
+    async def run():
+        cache.put(key, "Reason.")
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    with open(path) as f:
+        assert list(json.load(f)["entries"]) == [key]
@@ -0,0 +1,37 @@
+import asyncio
+import pytest
+import upstream
+from recording import FixtureBundle, RecordingChatClient, ReplayChatClient, UpstreamNotRecorded
+from reasoning import StubChatClient, request_transfer_reasoning
+from conftest import make_player
+
+def record_reason(path, player_out, player_in, suffix):
+    """Records one per-call transfer reason into a new bundle at `path`, its text ending in `suffix`."""
+    class Client(StubChatClient):
+        async def _create(self, **kwargs):
+            response = await super()._create(**kwargs)
+            response.choices[0].message.content += suffix
+            return response
+
+    bundle = FixtureBundle(path)
+    asyncio.run(request_transfer_reasoning(RecordingChatClient(Client(), bundle), player_out, player_in))
+    bundle.save()
+
+def test_replay_follows_replay_from(tmp_path, monkeypatch):
+    player_out, player_in = make_player(1), make_player(2)
+    record_reason(str(tmp_path / "first"), player_out, player_in, " (first)")
+    record_reason(str(tmp_path / "second"), player_out, player_in, " (second)")
+    for name in ("UPSTREAM_MODE", "bundle", "transport"):
+        monkeypatch.setattr(upstream, name, getattr(upstream, name))
+
+    client = ReplayChatClient(lambda: upstream.bundle)
+    upstream.replay_from(str(tmp_path / "first"))
+    reason, _ = asyncio.run(request_transfer_reasoning(client, player_out, player_in))
+    assert reason.endswith("(first)")
+
+    upstream.replay_from(str(tmp_path / "second"))
+    reason, _ = asyncio.run(request_transfer_reasoning(client, player_out, player_in))
+    assert reason.endswith("(second)")
+
+    with pytest.raises(UpstreamNotRecorded):
+        asyncio.run(request_transfer_reasoning(client, player_out, make_player(3)))
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+from player_table import PLAYER_FIELDS
+from snapshot_history import SnapshotHistory
+
+def make_snapshot(version, players):
+    """A stand-in Snapshot with the attributes SnapshotHistory reads; `players` maps id -> field overrides."""
+    rows = []
+    for player_id, fields in players.items():
+        row = {field: 0 for field in PLAYER_FIELDS}
+        row.update(id=player_id, web_name=f"Player {player_id}", upcoming_fixtures=[], **fields)
+        rows.append(row)
+    return SimpleNamespace(version=version, players=rows, index=SimpleNamespace(by_id={p['id']: p for p in rows}))
+
+X = make_snapshot("x", {1: {}, 2: {}, 3: {}})
+A = make_snapshot("a", {1: {"total_points": 5}, 2: {}, 3: {}})
+B = make_snapshot("b", {1: {"total_points": 5}, 2: {"now_cost": 55}, 4: {}})
+A_AGAIN = make_snapshot("a", {1: {"total_points": 5}, 2: {}, 3: {}})
+
+def observe_all(*snapshots, max_versions=24):
+    history = SnapshotHistory(max_versions=max_versions)
+    for snapshot in snapshots:
+        history.observe(snapshot)
+    return history
+
+def test_changes_since_latest_is_empty():
+    changes = observe_all(X, A).changes_since("a")
+    assert changes == {"version": "a", "since": "a", "full": False, "players": [], "removed": []}
+
+def test_changes_since_sends_changed_fields_only():
+    changes = observe_all(X, A).changes_since("x")
+    assert not changes["full"]
+    assert changes["players"] == [{"id": 1, "total_points": 5}]
+
+def test_changes_since_combines_diffs():
+    changes = observe_all(X, A, B).changes_since("x")
+    rows = {row["id"]: row for row in changes["players"]}
+    assert rows[1] == {"id": 1, "total_points": 5}
+    assert rows[2] == {"id": 2, "now_cost": 55}
+    # New players are sent whole
+    assert set(rows[4]) == set(PLAYER_FIELDS)
+    assert changes["removed"] == [3]
+
+def test_unknown_version_gets_full_resync():
+    changes = observe_all(X, A).changes_since("unknown")
+    assert changes["full"]
+    assert {p["id"] for p in changes["players"]} == {1, 2, 3}
+    assert observe_all(X, A).changes_since(None)["full"]
+
+def test_evicted_versions_get_full_resync():
+    history = observe_all(X, A, B, max_versions=2)
+    assert history.changes_since("x")["full"]
+    assert not history.changes_since("a")["full"]
+
+def test_same_version_is_observed_once():
+    history = observe_all(X, A, A)
+    assert history.changes_since("x")["players"] == [{"id": 1, "total_points": 5}]
+
+def test_reappearing_version_resyncs_older_clients():
+    history = observe_all(X, A, B, A_AGAIN)
+
+    # A client on B gets the changes back to A's content
+    changes = history.changes_since("b")
+    assert not changes["full"]
+    assert {row["id"]: row for row in changes["players"]}[2] == {"id": 2, "now_cost": 0}
+    assert changes["removed"] == [4]
+    # A client on X must not get only B -> A: it would miss the X -> A changes
+    assert history.changes_since("x")["full"]
+    assert history.changes_since("a")["players"] == []
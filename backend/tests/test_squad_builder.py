@@ -0,0 +1,39 @@
+import random
+import pytest
+from squad_builder import GeneticSquadBuilder, RandomSquadBuilder, select_ai_squad
+
+@pytest.fixture(scope="module")
+def snapshot(main_module):
+    return main_module.get_snapshot()
+
+def run_genetic(snapshot, seed):
+    builder = GeneticSquadBuilder(
+        snapshot.players, population_size=30, generations=5, fixture_difficulty_map=snapshot.fixture_difficulty_map, seed=seed
+    )
+    return [p['id'] for p in builder.run()]
+
+def test_seeded_builders_do_not_depend_on_earlier_draws(snapshot):
+    first = run_genetic(snapshot, seed=7)
+    random.random()
+    run_genetic(snapshot, seed=8)
+    assert run_genetic(snapshot, seed=7) == first
+
+    squad = [p['id'] for p in RandomSquadBuilder(snapshot.players, seed=7).build()]
+    random.shuffle(list(range(10)))
+    assert [p['id'] for p in RandomSquadBuilder(snapshot.players, seed=7).build()] == squad
+
+def test_genetic_squad_is_valid(snapshot):
+    builder = GeneticSquadBuilder(
+        snapshot.players, population_size=30, generations=5, fixture_difficulty_map=snapshot.fixture_difficulty_map, seed=1
+    )
+    squad = builder.run()
+    assert builder._is_valid(squad)
+    # Shared records come back as overlays carrying this run's score
+    assert all('ai_score' in p.maps[0] for p in squad)
+
+def test_ai_squad_is_reproducible(snapshot):
+    first = select_ai_squad(snapshot.players, snapshot.fixture_difficulty_map, seed=3)
+    random.random()
+    second = select_ai_squad(snapshot.players, snapshot.fixture_difficulty_map, seed=3)
+    assert [p['id'] for p in first['starting_11']] == [p['id'] for p in second['starting_11']]
+    assert len(first['starting_11']) == 11
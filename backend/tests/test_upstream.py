@@ -0,0 +1,112 @@
+import pytest
+import requests
+import upstream
+from recording import UpstreamNotRecorded
+from upstream import CircuitBreaker, UpstreamUnavailable
+
+class Clock:
+    """Stands in for time.monotonic in upstream, advanced by hand."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(upstream.time, "monotonic", clock)
+    # No jitter, so backoffs are exact
+    monkeypatch.setattr(upstream.random, "uniform", lambda low, high: 1.0)
+    return clock
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+# --- CircuitBreaker ---
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, base_backoff=5.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_success()
+    open_breaker(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.describe()["retry_in_seconds"] == 5.0
+
+def test_breaker_lets_one_trial_through_after_backoff(clock):
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=5.0)
+    open_breaker(breaker)
+    clock.now += 4.9
+    assert not breaker.allow()
+    clock.now += 0.1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+def test_successful_trial_closes_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=5.0)
+    open_breaker(breaker)
+    clock.now += 5
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_failed_trial_reopens_with_doubled_backoff(clock):
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=5.0, max_backoff=12.0)
+    open_breaker(breaker)
+    for backoff in (10.0, 12.0):
+        clock.now += 100
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.describe()["retry_in_seconds"] == backoff
+
+def test_breaker_honours_retry_after(clock):
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=5.0, max_backoff=300.0)
+    breaker.record_failure(retry_after=60)
+    assert breaker.describe()["retry_in_seconds"] == 60.0
+
+# --- Guarded GETs ---
+
+class FailingTransport:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        raise self.error
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    """A fresh breaker for the test host, opened and past its backoff: the next GET is the half-open trial."""
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=5.0)
+    monkeypatch.setitem(upstream._breakers, "breaker.test", breaker)
+    open_breaker(breaker)
+    clock.now += 5
+    return breaker
+
+@pytest.mark.parametrize("error", (UpstreamNotRecorded("not in bundle"), RuntimeError("transport bug"), KeyboardInterrupt()))
+def test_trial_without_health_outcome_returns_breaker_to_open(monkeypatch, breaker, error):
+    monkeypatch.setattr(upstream, "transport", FailingTransport(error))
+    with pytest.raises(type(error)):
+        upstream._guarded_get("https://breaker.test/api/")
+    assert breaker.state == CircuitBreaker.OPEN
+    # The trial ended without a verdict, so the next request is another trial
+    assert breaker.allow()
+
+def test_failed_trial_request_reopens_breaker(monkeypatch, breaker):
+    transport = FailingTransport(requests.exceptions.ConnectionError("refused"))
+    monkeypatch.setattr(upstream, "transport", transport)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        upstream._guarded_get("https://breaker.test/api/")
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(UpstreamUnavailable):
+        upstream._guarded_get("https://breaker.test/api/")
+    assert transport.calls == 1
@@ -0,0 +1,58 @@
+import asyncio
+from warmup import WarmupTracker
+
+def make_tracker():
+    return WarmupTracker([("snapshot", True), ("indexes", True), ("fixture_difficulty_map", False), ("ai_squad", False)])
+
+def test_prewarm_retries_required_stages_until_ready(app, monkeypatch):
+    get_snapshot = app.get_snapshot
+    calls = []
+
+    def flaky_get_snapshot():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("FPL API unavailable")
+        return get_snapshot()
+
+    tracker = make_tracker()
+    monkeypatch.setattr(app, "warmup", tracker)
+    monkeypatch.setattr(app, "get_snapshot", flaky_get_snapshot)
+    monkeypatch.setattr(app, "build_ai_squad", lambda: None)
+    monkeypatch.setattr(app, "PREWARM_RETRY_SECONDS", 0)
+
+    asyncio.run(app.prewarm())
+
+    assert len(calls) == 3
+    report = tracker.report()
+    assert report["ready"]
+    assert {name: stage["status"] for name, stage in report["stages"].items()} == dict.fromkeys(report["stages"], "ok")
+
+def test_failed_optional_stage_does_not_block_readiness(app, monkeypatch):
+    def failing_ai_squad():
+        raise RuntimeError("GA failed")
+
+    tracker = make_tracker()
+    monkeypatch.setattr(app, "warmup", tracker)
+    monkeypatch.setattr(app, "build_ai_squad", failing_ai_squad)
+
+    asyncio.run(app.prewarm())
+
+    report = tracker.report()
+    assert report["ready"]
+    assert report["stages"]["ai_squad"]["status"] == "failed"
+    assert report["stages"]["ai_squad"]["error"] == "GA failed"
+
+def test_stages_after_a_failed_optional_stage_name_it(app, monkeypatch):
+    class FailingSnapshot:
+        @property
+        def fixture_difficulty_map(self):
+            raise RuntimeError("fixtures unavailable")
+
+    tracker = make_tracker()
+    monkeypatch.setattr(app, "warmup", tracker)
+
+    app.prewarm_optional(FailingSnapshot())
+
+    stages = tracker.report()["stages"]
+    assert stages["fixture_difficulty_map"]["error"] == "fixtures unavailable"
+    assert stages["ai_squad"]["error"] == "Skipped after the fixture_difficulty_map stage failed."
@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+import random
+import threading
+from urllib.parse import urlsplit
+import requests
+import metrics
+from recording import (
+    FixtureBundle, LatencyModel, LiveTransport, RecordingTransport, ReplayTransport, UpstreamNotRecorded
+)
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "10"))
+
+# "live" talks to the real services, "record" also saves every response into the
+# bundle at UPSTREAM_BUNDLE_DIR, and "replay" serves only from that bundle (offline),
+# delayed per UPSTREAM_REPLAY_LATENCY (see recording.LatencyModel).
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "live")
+UPSTREAM_BUNDLE_DIR = os.getenv("UPSTREAM_BUNDLE_DIR", "upstream_bundle")
+
+class UpstreamUnavailable(requests.exceptions.RequestException):
+    """Raised without making a request while a host's circuit breaker is open."""
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one: the first caller
+    runs the function, everyone arriving while it is in flight waits for and
+    shares its result (or exception). Nothing is cached once the call returns.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        return {"upstream_calls": self.calls, "shared_in_flight": self.shared}
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker. After `failure_threshold` consecutive failures
+    (errors, timeouts, 429s and 5xx) the circuit opens and requests fail fast
+    for a backoff period that doubles on every re-open, up to `max_backoff`
+    (or the host's Retry-After). Once it has elapsed, a single trial request
+    is let through: success closes the circuit, failure re-opens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, base_backoff=5.0, max_backoff=300.0):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self.open_until:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened = 0
+
+    def release_trial(self):
+        """Ends a half-open trial that said nothing about the host's health; the next request is a new trial."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self, retry_after: float = None):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                backoff = min(self.max_backoff, self.base_backoff * (2 ** self.opened))
+                if retry_after is not None:
+                    backoff = max(backoff, min(retry_after, self.max_backoff))
+                self.state = self.OPEN
+                self.opened += 1
+                # Jitter so workers do not all retry the host at the same moment
+                self.open_until = time.monotonic() + backoff * random.uniform(0.8, 1.2)
+
+    def describe(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "retry_in_seconds": round(max(0.0, self.open_until - time.monotonic()), 1) if self.state == self.OPEN else 0
+            }
+
+def _create_transport(mode: str):
+    if mode == "live":
+        return None, LiveTransport()
+    if mode not in ("record", "replay"):
+        raise ValueError(f"Unknown UPSTREAM_MODE '{mode}'; expected live, record or replay.")
+    bundle = FixtureBundle(UPSTREAM_BUNDLE_DIR, label=os.getenv("UPSTREAM_BUNDLE_LABEL"))
+    if mode == "record":
+        logger.info("Recording upstream responses into %s.", UPSTREAM_BUNDLE_DIR)
+        return bundle, RecordingTransport(bundle)
+    logger.info("Replaying upstream responses from %s (%d entries).", UPSTREAM_BUNDLE_DIR, len(bundle.manifest['entries']))
+    return bundle, ReplayTransport(bundle, LatencyModel(os.getenv("UPSTREAM_REPLAY_LATENCY", "0")))
+
+# The bundle is shared with the chat client so LLM calls are recorded and replayed too
+bundle, transport = _create_transport(UPSTREAM_MODE)
+
+def replay_from(path: str, latency: str = "0"):
+    """
+    Switches this process to replaying from the bundle at `path`, for offline
+    tools that pick or generate their bundle at runtime (e.g. the benchmarks).
+    """
+    global UPSTREAM_MODE, bundle, transport
+    UPSTREAM_MODE = "replay"
+    bundle = FixtureBundle(path)
+    transport = ReplayTransport(bundle, LatencyModel(latency))
+
+
+_flight = SingleFlight()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def breaker_for(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker()
+        return breaker
+
+def _retry_after(response) -> float:
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def _guarded_get(url: str) -> requests.Response:
+    host = urlsplit(url).netloc
+    breaker = breaker_for(host)
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"{host} is unavailable (circuit open); not retrying yet.")
+    start = time.perf_counter()
+    try:
+        response = transport.get(url, timeout=UPSTREAM_TIMEOUT_SECONDS)
+    except UpstreamNotRecorded:
+        # A gap in the bundle says nothing about the host's health
+        metrics.upstream_seconds.observe(time.perf_counter() - start, host=host, outcome="not_recorded")
+        breaker.release_trial()
+        raise
+    except requests.exceptions.RequestException as e:
+        metrics.upstream_seconds.observe(
+            time.perf_counter() - start, host=host,
+            outcome="timeout" if isinstance(e, requests.exceptions.Timeout) else "error"
+        )
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Neither does anything else (a bug, an interrupt), but a half-open trial must not stay in flight forever
+        breaker.release_trial()
+        raise
+    metrics.upstream_seconds.observe(time.perf_counter() - start, host=host, outcome=metrics.status_class(response.status_code))
+    if response.status_code == 429 or response.status_code >= 500:
+        breaker.record_failure(_retry_after(response))
+    else:
+        breaker.record_success()
+    return response
+
+def get(url: str) -> requests.Response:
+    """
+    GETs `url` through the shared single-flight layer, so a burst of requests
+    needing the same upstream resource makes exactly one HTTP call, and through
+    the host's circuit breaker, which raises UpstreamUnavailable instead of
+    calling a host that keeps failing. The response is shared between callers
+    and must be treated as read-only.
+    """
+    return _flight.do(("GET", url), lambda: _guarded_get(url))
+
+def _open_circuits():
+    with _breakers_lock:
+        return {(host,): int(breaker.state != CircuitBreaker.CLOSED) for host, breaker in _breakers.items()}
+
+metrics.CallbackMetric("fpl_upstream_circuit_open", "1 while a host's circuit breaker is open or half-open.",
+                       _open_circuits, ("host",))
+metrics.CallbackMetric("fpl_upstream_shared_calls_total", "Upstream GETs answered by joining an in-flight call.",
+                       lambda: _flight.shared, type="counter")
+
+def stats():
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return dict(_flight.stats(), mode=UPSTREAM_MODE, hosts={host: breaker.describe() for host, breaker in breakers.items()})
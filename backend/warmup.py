@@ -0,0 +1,66 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+
+class WarmupTracker:
+    """
+    Tracks the startup warm-up stages and their timings for the readiness probe.
+    The instance is ready once every stage has finished and no required stage
+    failed; optional stages that fail are reported but do not block traffic.
+    """
+    def __init__(self, stages):
+        """
+        - stages: (name, required) pairs, in the order they run.
+        """
+        self._stages = {
+            name: {"status": STATUS_PENDING, "required": required, "duration_ms": None, "error": None}
+            for name, required in stages
+        }
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Runs the body as stage `name`, recording its status and duration. Errors are re-raised."""
+        with self._lock:
+            self._stages[name]["status"] = STATUS_RUNNING
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._finish(name, STATUS_FAILED, start, error=str(e))
+            raise
+        self._finish(name, STATUS_OK, start)
+
+    def _finish(self, name, status, start, error=None):
+        with self._lock:
+            self._stages[name].update(
+                status=status,
+                duration_ms=round((time.perf_counter() - start) * 1000, 1),
+                error=error
+            )
+
+    def skip_remaining(self, reason: str):
+        """Marks every stage that has not run as failed, e.g. after an earlier stage failed."""
+        with self._lock:
+            for stage in self._stages.values():
+                if stage["status"] == STATUS_PENDING:
+                    stage.update(status=STATUS_FAILED, error=reason)
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(
+                stage["status"] == STATUS_OK or (stage["status"] == STATUS_FAILED and not stage["required"])
+                for stage in self._stages.values()
+            )
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self._stages.items()}
+        return {"ready": self.ready, "stages": stages}
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useLocation, Link } from 'react-router-dom';
 import Pitch from './Pitch';
 import Loading from './Loading';
@@ -12,6 +12,8 @@ const SquadAnalysisPage = () => {
     const [error, setError] = useState(null);
     const [newSquad, setNewSquad] = useState([]);
     const [highlightedIds, setHighlightedIds] = useState({ out: [], in: [] });
+    // Aborting the in-flight request lets the backend cancel the analysis it was running for us.
+    const abortControllerRef = useRef(null);
 
     const fetchAnalysis = useCallback(async () => {
         if (!squad) {
@@ -20,45 +22,112 @@ const SquadAnalysisPage = () => {
             return;
         }
 
+        abortControllerRef.current?.abort();
+        const controller = new AbortController();
+        abortControllerRef.current = controller;
+
         setLoading(true);
         setError(null);
 
+        setAnalysis(null);
+
+        // --- Apply each streamed section as soon as the backend emits it ---
+        const handleEvent = (data) => {
+            switch (data.event) {
+                case 'captain':
+                    setAnalysis({
+                        captain_suggestion: data.captain_suggestion,
+                        vice_captain_suggestion: data.vice_captain_suggestion,
+                        suggested_transfers: null,
+                        double_transfer_suggestion: null,
+                        chip_suggestion: null,
+                        pending: true,
+                    });
+                    setLoading(false);
+                    break;
+                case 'transfers': {
+                    setAnalysis(prev => ({ ...prev, suggested_transfers: data.suggested_transfers }));
+
+                    // --- Construct the new squad and highlighted players ---
+                    let tempSquad = [...squad];
+                    const outIds = data.suggested_transfers.map(t => t.player_out.id);
+                    const inIds = data.suggested_transfers.map(t => t.player_in.id);
+
+                    const playersToRemove = new Set(outIds);
+                    const playersToAdd = data.suggested_transfers.map(t => t.player_in);
+
+                    tempSquad = tempSquad.filter(p => !playersToRemove.has(p.id));
+                    tempSquad.push(...playersToAdd);
+
+                    setNewSquad(tempSquad);
+                    setHighlightedIds({ out: outIds, in: inIds });
+                    break;
+                }
+                case 'transfer_reason':
+                    setAnalysis(prev => ({
+                        ...prev,
+                        suggested_transfers: prev.suggested_transfers.map((t, i) =>
+                            i === data.index ? { ...t, reason: data.reason } : t
+                        ),
+                    }));
+                    break;
+                case 'double_transfer':
+                    setAnalysis(prev => ({ ...prev, double_transfer_suggestion: data.double_transfer_suggestion }));
+                    break;
+                case 'chip':
+                    setAnalysis(prev => ({ ...prev, chip_suggestion: data.chip_suggestion }));
+                    break;
+                case 'done':
+                    setAnalysis(prev => ({ ...prev, pending: false }));
+                    break;
+                case 'error':
+                    throw new Error(data.detail || "Failed to get analysis.");
+                default:
+                    break;
+            }
+        };
+
         try {
-            const response = await fetch('/api/analyze-squad', {
+            const response = await fetch('/api/analyze-squad/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ squad }),
+                signal: controller.signal,
             });
             if (!response.ok) {
                 const errData = await response.json();
                 throw new Error(errData.detail || "Failed to get analysis.");
             }
-            const data = await response.json();
-            setAnalysis(data);
-
-            // --- Construct the new squad and highlighted players ---
-            let tempSquad = [...squad];
-            const outIds = data.suggested_transfers.map(t => t.player_out.id);
-            const inIds = data.suggested_transfers.map(t => t.player_in.id);
-            
-            const playersToRemove = new Set(outIds);
-            const playersToAdd = data.suggested_transfers.map(t => t.player_in);
 
-            tempSquad = tempSquad.filter(p => !playersToRemove.has(p.id));
-            tempSquad.push(...playersToAdd);
-
-            setNewSquad(tempSquad);
-            setHighlightedIds({ out: outIds, in: inIds });
+            // The response is NDJSON: one complete JSON event per line.
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+                lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+            }
+            if (buffered.trim()) {
+                handleEvent(JSON.parse(buffered));
+            }
             
         } catch (err) {
+            if (err.name === 'AbortError') return;
             setError(err.message);
         } finally {
-            setLoading(false);
+            if (abortControllerRef.current === controller) {
+                setLoading(false);
+            }
         }
     }, [squad]);
 
     useEffect(() => {
         fetchAnalysis();
+        return () => abortControllerRef.current?.abort();
     }, [fetchAnalysis]);
 
     if (loading) {
@@ -176,9 +245,15 @@ const SquadAnalysisPage = () => {
                     </div>
                 )}
 
+                {analysis.pending && (
+                    <div className="analysis-section">
+                        <p className="analysis-pending">Still crunching the numbers for the remaining suggestions...</p>
+                    </div>
+                )}
+
                 <div className="analysis-section">
                     <h2>Top Transfer Suggestions</h2>
-                    {analysis.suggested_transfers.map((transfer, index) => (
+                    {(analysis.suggested_transfers || []).map((transfer, index) => (
                       <div className="suggestion-card transfer-card" key={index}>
                         <div className="transfer-details">
                           <div className="player-out">
@@ -204,7 +279,7 @@ const SquadAnalysisPage = () => {
                         )}
                       </div>
                     ))}
-                     {analysis.suggested_transfers.length === 0 && (
+                     {analysis.suggested_transfers && analysis.suggested_transfers.length === 0 && (
                         <div className="suggestion-card">
                             <p>No immediate transfers suggested. Your squad is looking strong!</p>
                         </div>